@@ -0,0 +1,81 @@
+"""
+Adaptive polling interval for the auto-post job
+Polls faster while new items keep appearing and backs off when idle
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveInterval:
+    def __init__(self, min_minutes: float, max_minutes: float,
+                 jitter: float = 0.1, smoothing: float = 0.3, max_seen: int = 500):
+        """
+        Initialize the interval tracker
+        jitter is the fraction of the interval used as random spread,
+        smoothing is the weight of the latest run in the activity average,
+        max_seen is the number of listing URLs remembered between runs
+        """
+        if min_minutes <= 0 or max_minutes < min_minutes:
+            raise ValueError("Interval bounds must satisfy 0 < min <= max")
+        
+        self.min_minutes = min_minutes
+        self.max_minutes = max_minutes
+        self.jitter = jitter
+        self.smoothing = smoothing
+        self.activity = 0.0  # Smoothed new items per run
+        self.current = min_minutes
+        self.max_seen = max_seen
+        self._seen: OrderedDict = OrderedDict()
+    
+    def count_new(self, urls: Iterable[str]) -> int:
+        """
+        Count listing URLs not seen on earlier runs, and remember them
+        Items that stay unposted (deferred duplicates, failed fetches) are
+        listed on every run and must not keep the interval at its minimum
+        """
+        new_items = 0
+        for url in urls:
+            if url in self._seen:
+                self._seen.move_to_end(url)
+            else:
+                self._seen[url] = None
+                new_items += 1
+        
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+        return new_items
+    
+    def record_run(self, new_items: int) -> float:
+        """
+        Record how many new items a run found and return the next interval
+        Halves the interval when new items show up, grows it by half while idle
+        """
+        self.activity = self.smoothing * new_items + (1 - self.smoothing) * self.activity
+        
+        if new_items > 0:
+            self.current = max(self.min_minutes, self.current / 2)
+        elif self.activity < 0.5:
+            self.current = min(self.max_minutes, self.current * 1.5)
+        
+        logger.debug(
+            f"Adaptive interval: {self.current:.1f} min "
+            f"(new={new_items}, activity={self.activity:.2f})"
+        )
+        return self.current
+    
+    def jitter_seconds(self) -> int:
+        """Get the random spread to apply to the next run, in seconds"""
+        return int(self.current * 60 * self.jitter)
+    
+    def get_stats(self) -> dict:
+        """Get current interval state"""
+        return {
+            'interval': self.current,
+            'min': self.min_minutes,
+            'max': self.max_minutes,
+            'activity': self.activity
+        }
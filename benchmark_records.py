@@ -0,0 +1,105 @@
+"""
+Memory benchmark: download links as dicts vs slotted records
+Fills a links cache the size of the 'links_prev'/'detail' namespaces
+with realistic entries both ways and reports bytes per entry
+
+Usage: python benchmark_records.py [entries] [links_per_entry]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from cache_manager import DEFAULT_POLICIES
+from records import ContentItem, DownloadLink, links_hash
+
+QUALITIES = ['4K', '1080p', '720p', '480p']
+SERVERS = ['HubCloud', 'HubDrive', 'GDFlix', 'HubCDN']
+
+
+def parsed_links(entry: int, count: int):
+    """
+    Link tuples as they arrive from a parser process
+    Labels are built at runtime, like unpickled strings, so each is a new object
+    """
+    return [
+        (
+            f'https://hubcloud.example/drive/{entry:06d}{i:03d}',
+            QUALITIES[i % len(QUALITIES)].encode().decode(),
+            f'Movie {entry} {QUALITIES[i % len(QUALITIES)]} x264 [{i}]',
+            SERVERS[i % len(SERVERS)].encode().decode()
+        )
+        for i in range(count)
+    ]
+
+
+def as_dicts(records):
+    return [
+        {'url': url, 'quality': quality, 'text': text, 'server': server}
+        for url, quality, text, server in records
+    ]
+
+
+def as_records(records):
+    return [DownloadLink.from_record(record) for record in records]
+
+
+def measure(build, entries: int, links: int):
+    """Build the cache with `build` and return (bytes held, seconds)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    cache = {f'https://hdhub4u.example/movie-{n}/': build(parsed_links(n, links)) for n in range(entries)}
+    elapsed = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    return held, elapsed
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_POLICIES['links_prev'].max_entries
+    links = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    print(f"{entries} cache entries x {links} links")
+
+    results = {
+        'dict links': measure(as_dicts, entries, links),
+        'record links': measure(as_records, entries, links),
+        'links hash only': measure(lambda records: links_hash(as_records(records)), entries, links),
+    }
+    baseline = results['dict links'][0]
+    for name, (held, elapsed) in results.items():
+        print(
+            f"{name:>16}: {held / 1024 / 1024:7.2f} MB, {held / entries:8.0f} B/entry, "
+            f"{baseline / held:5.1f}x smaller, built in {elapsed:.2f}s"
+        )
+
+    # Change detection: compare a fresh scrape against the previous one
+    old = [as_dicts(parsed_links(n, links)) for n in range(200)]
+    new = [as_dicts(parsed_links(n, links)) for n in range(200)]
+    start = time.perf_counter()
+    changed = sum(a != b for a, b in zip(old, new))
+    dict_compare = time.perf_counter() - start
+
+    # The scraper hashes links once per fetch, when it builds the details
+    old_hashes = [links_hash(as_records(parsed_links(n, links))) for n in range(200)]
+    new_records = [as_records(parsed_links(n, links)) for n in range(200)]
+    start = time.perf_counter()
+    new_hashes = [links_hash(records) for records in new_records]
+    hashing = time.perf_counter() - start
+    start = time.perf_counter()
+    changed += sum(a != b for a, b in zip(old_hashes, new_hashes))
+    hash_compare = time.perf_counter() - start
+    assert changed == 0
+    print(
+        f"compare 200 entries: dicts {dict_compare * 1e3:.2f} ms, stored hashes {hash_compare * 1e3:.2f} ms "
+        f"(hashing at fetch time {hashing * 1e3:.2f} ms)"
+    )
+
+    item = ContentItem('Movie', 'https://hdhub4u.example/movie/', 'https://img.example/p.jpg', '1080p FHD')
+    print(f"item: record {sys.getsizeof(item)} B vs dict {sys.getsizeof(item.as_dict())} B (containers only)")
+
+
+if __name__ == '__main__':
+    main()
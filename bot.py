@@ -5,10 +5,16 @@ Admin-only bot that automatically posts content to Telegram channels
 """
 
 import os
+import re
+import json
 import asyncio
+import hashlib
 import logging
+import socket
+import tempfile
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import List, Optional, Tuple
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,11 +22,18 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
 from telegram.helpers import escape_markdown
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from database import Database
 from scraper import HDhub4uScraper
 from cache_manager import CacheManager
+from adaptive_scheduler import AdaptiveInterval
+from rate_limiter import RateLimiter
+from dedup import DuplicateIndex
+from link_prober import LinkProber
+from poster_cache import PosterCache
+from profiling import RunProfiler
 
 # Configure logging
 logging.basicConfig(
@@ -32,13 +45,42 @@ logger = logging.getLogger(__name__)
 # Environment variables
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS = [int(x) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
+# Another Bot API server, e.g. a local one or fake_bot_api.py for load tests
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL')
+# Identifies this instance when several share the database
+REPLICA_ID = os.getenv('REPLICA_ID') or f"{socket.gethostname()}:{os.getpid()}"
 
 # Global instances
 db = Database()
 scraper = HDhub4uScraper()
 cache = CacheManager()
 scheduler = AsyncIOScheduler()
+adaptive_interval: Optional[AdaptiveInterval] = None
+send_limiter = RateLimiter(2)
+dedup_index = DuplicateIndex()
+prober = LinkProber(db)
+posters = PosterCache(
+    os.getenv('POSTER_CACHE_DIR', 'poster_cache'),
+    headers={'User-Agent': scraper.headers['User-Agent'], 'Referer': f"{scraper.main_url}/"}
+)
+run_profiler = RunProfiler()
+_outbox_lock = asyncio.Lock()
+_holds_scheduler_lease = False
 PLOT_PREVIEW_LIMIT = 200
+POSTS_PER_RUN = 3
+HISTORY_PAGE_SIZE = 10
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE = 30  # Seconds, doubled after each failed attempt
+RETENTION_INTERVAL_HOURS = 6
+SCHEDULER_LEASE = 'scheduler'
+LEASE_TTL = 180  # Seconds; renewed by every scheduled run, so a standby takes over within this
+SEND_CLAIM_TTL = 120  # Seconds a replica may hold a URL while sending it
+CATCHUP_THRESHOLD = 6  # Due posts at which the sender switches to albums
+ALBUM_SIZE = 10  # Telegram's maximum photos per album
+ALBUMS_PER_RUN = 3
+CATCHUP_LINKS_PER_ITEM = 3
+BOT_DOWNLOAD_LIMIT = 20 * 1024 * 1024  # getFile only serves files up to 20 MB  # Link buttons per post in an album's links message
+LINK_COUNT_PATTERN = re.compile(r'💾 \d+ Download Links? Available')
 
 
 def is_admin(user_id: int) -> bool:
@@ -67,12 +109,23 @@ Welcome Admin! This bot automatically posts content to your Telegram channel.
 *Available Commands:*
 /setchannel - Set target channel
 /settimer - Set auto-post interval (in minutes)
+/setschedule - Choose fixed or adaptive scheduling
+/setdedup - Handle re-uploads (off, skip or merge)
+/setprobe - Handle dead download links (off, reorder or drop)
+/setretention - Purge old post history (days or off)
 /status - View bot status
 /posted - View post history
+/find - Find posted content by title
+/export - Download post history as JSONL (gzip)
+/import - Seed post history (reply to an exported file)
 /start_autopost - Start auto-posting
 /stop_autopost - Stop auto-posting
 /force_post - Manually trigger a post
+/search - Search the site and post a result
 /stats - View statistics
+/cache - View cache usage per namespace
+/outbox - View, retry or drop posts that failed to send
+/profile - Profile the next posting run
 
 *Current Status:*
 Channel: {channel}
@@ -146,6 +199,128 @@ async def set_timer(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Please provide a valid number")
 
 
+async def set_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switch between fixed and adaptive scheduling"""
+    if not await admin_only(update, context):
+        return
+    
+    mode = context.args[0].lower() if context.args else ''
+    if mode not in ('fixed', 'adaptive'):
+        await update.message.reply_text(
+            "⏱️ Please choose a scheduling mode\n"
+            "Example: `/setschedule fixed` or `/setschedule adaptive 2 30`\n"
+            "(adaptive polls between min and max minutes)",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    if mode == 'adaptive':
+        try:
+            min_minutes = int(context.args[1]) if len(context.args) > 1 else 2
+            max_minutes = int(context.args[2]) if len(context.args) > 2 else 30
+        except ValueError:
+            await update.message.reply_text("⚠️ Please provide valid numbers")
+            return
+        
+        if min_minutes < 1 or max_minutes < min_minutes:
+            await update.message.reply_text("⚠️ Bounds must satisfy 1 <= min <= max")
+            return
+        
+        db.set_setting('timer_min', str(min_minutes))
+        db.set_setting('timer_max', str(max_minutes))
+    
+    db.set_setting('schedule_mode', mode)
+    
+    if db.get_setting('auto_post_enabled') == 'true':
+        restart_scheduler(context.application)
+    
+    if mode == 'adaptive':
+        text = f"✅ Adaptive scheduling: every {min_minutes}-{max_minutes} minutes"
+    else:
+        text = f"✅ Fixed scheduling: every {db.get_setting('timer') or '5'} minutes"
+    await update.message.reply_text(text)
+
+
+async def set_dedup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set how re-uploads of already posted content are handled"""
+    if not await admin_only(update, context):
+        return
+    
+    mode = context.args[0].lower() if context.args else ''
+    if mode not in ('off', 'skip', 'merge'):
+        await update.message.reply_text(
+            "🔁 Please choose how re-uploads are handled\n"
+            "`off` - post them again\n"
+            "`skip` - don't post them\n"
+            "`merge` - add their links to the existing post",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    db.set_setting('dedup_mode', mode)
+    await update.message.reply_text(f"✅ Re-upload handling set to: {mode}")
+
+
+async def set_probe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set how dead download links are handled before posting"""
+    if not await admin_only(update, context):
+        return
+    
+    mode = context.args[0].lower() if context.args else ''
+    if mode not in ('off', 'reorder', 'drop'):
+        await update.message.reply_text(
+            "🔗 Please choose how dead download links are handled\n"
+            "`off` - don't check links\n"
+            "`reorder` - move dead links to the end\n"
+            "`drop` - remove dead links",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    db.set_setting('probe_mode', mode)
+    await update.message.reply_text(f"✅ Dead link handling set to: {mode}")
+
+
+async def set_retention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set how long post history is kept"""
+    if not await admin_only(update, context):
+        return
+    
+    args = [arg.lower() for arg in context.args or []]
+    if not args:
+        await update.message.reply_text(
+            "🧹 Please provide a retention period in days, or `off`\n"
+            "Example: `/setretention 90` or `/setretention 90 delete`\n"
+            "`archive` (default) keeps purged URLs so they are never reposted, "
+            "`delete` removes them completely",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    if args[0] == 'off':
+        db.set_setting('retention_days', 'off')
+        await update.message.reply_text("✅ Retention disabled, history is kept forever")
+        return
+    
+    mode = args[1] if len(args) > 1 else 'archive'
+    try:
+        days = int(args[0])
+    except ValueError:
+        await update.message.reply_text("⚠️ Please provide a valid number")
+        return
+    
+    if days < 1 or mode not in ('archive', 'delete'):
+        await update.message.reply_text("⚠️ Use at least 1 day and `archive` or `delete`")
+        return
+    
+    db.set_setting('retention_days', str(days))
+    db.set_setting('retention_mode', mode)
+    await update.message.reply_text(
+        f"✅ Posts older than {days} days will be purged ({mode}) "
+        f"every {RETENTION_INTERVAL_HOURS} hours"
+    )
+
+
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show bot status"""
     if not await admin_only(update, context):
@@ -157,44 +332,226 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     total_posts = db.get_total_posts()
     last_post = db.get_last_post_time()
+    outbox_counts = db.get_outbox_counts()
+    
+    retention_days = db.get_setting('retention_days')
+    if retention_days and retention_days != 'off':
+        retention_line = f"{retention_days} days ({db.get_setting('retention_mode') or 'archive'})"
+    else:
+        retention_line = "off"
+    
+    breaker = scraper.breakers.for_url(scraper.main_url).get_stats()
+    if breaker['state'] == 'open':
+        site_line = f"⛔ Circuit open, retry in {breaker['retry_in']:.0f}s"
+    elif breaker['state'] == 'half-open':
+        site_line = "🟡 Circuit half-open, checking recovery"
+    else:
+        site_line = f"✅ Reachable ({breaker['error_rate']:.0%} recent errors)"
+    
+    lease = db.get_lease(SCHEDULER_LEASE)
+    if not lease:
+        replica_line = f"`{REPLICA_ID}` (no active owner)"
+    elif lease['owner'] == REPLICA_ID:
+        replica_line = f"`{REPLICA_ID}` (owns scheduled jobs)"
+    else:
+        replica_line = f"`{REPLICA_ID}` (standby, jobs owned by `{lease['owner']}`)"
+    
+    if db.get_setting('schedule_mode') == 'adaptive' and adaptive_interval:
+        interval = adaptive_interval.get_stats()
+        timer_line = (
+            f"adaptive, now {interval['interval']:.1f} min "
+            f"({interval['min']:g}-{interval['max']:g})"
+        )
+    else:
+        timer_line = f"{timer} minutes"
     
     status_text = f"""
 📊 *Bot Status*
 
 *Configuration:*
 • Channel: `{channel}`
-• Timer: {timer} minutes
+• Timer: {timer_line}
 • Auto-posting: {'✅ Active' if auto_status else '❌ Inactive'}
+• Re-uploads: {db.get_setting('dedup_mode') or 'skip'}
+• Retention: {retention_line}
 
 *Statistics:*
 • Total posts: {total_posts}
 • Last post: {last_post or 'Never'}
 • Cache entries: {cache.size()}
+• Outbox: {outbox_counts.get('pending', 0)} pending, {outbox_counts.get('failed', 0)} failed
 
 *System:*
 • Database: ✅ Connected
-• Scraper: ✅ Ready
+• Scraper: {'⚠️ Serving stale listing' if scraper.content_stale else '✅ Ready'}
+• Source site: {site_line}
+• Replica: {replica_line}
 """
     
     await update.message.reply_text(status_text, parse_mode=ParseMode.MARKDOWN)
 
 
 async def posted_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show recent post history"""
+    """Show post history, newest first, with buttons to page through it"""
     if not await admin_only(update, context):
         return
     
-    posts = db.get_recent_posts(limit=10)
-    
-    if not posts:
+    text, keyboard = render_history_page()
+    if text is None:
         await update.message.reply_text("📝 No posts yet!")
         return
     
+    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard)
+
+
+async def history_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle Newer/Older buttons under /posted"""
+    query = update.callback_query
+    if not is_admin(update.effective_user.id):
+        await query.answer("⛔ Access denied", show_alert=True)
+        return
+    
+    # hist:<older|newer>:<id>:<posted_at>; posted_at itself contains colons
+    _, direction, post_id, posted_at = query.data.split(':', 3)
+    text, keyboard = render_history_page((posted_at, int(post_id)), direction == 'newer')
+    
+    await query.answer()
+    await query.edit_message_text(
+        text or "📝 No more posts", parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard
+    )
+
+
+def render_history_page(cursor_key: Optional[Tuple[str, int]] = None,
+                        newer: bool = False) -> Tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """
+    Build one page of /posted, read by keyset from cursor_key
+    Returns (None, None) when the page is empty
+    """
+    posts, has_more = db.get_posts_page(cursor_key, newer, limit=HISTORY_PAGE_SIZE)
+    if not posts:
+        return None, None
+    
     history_text = "*Recent Posts:*\n\n"
     for post in posts:
-        history_text += f"• {post['title']}\n  _{post['posted_at']}_\n\n"
+        history_text += f"• {_escape_md(post['title'])}\n  _{post['posted_at']}_\n\n"
+    
+    # A page reached by going older always has newer posts. Going newer,
+    # the older ones may have been purged since, so look for one
+    has_newer = has_more if newer else cursor_key is not None
+    if newer:
+        last = posts[-1]
+        _, has_older = db.get_posts_page((last['posted_at'], last['id']), limit=0)
+    else:
+        has_older = has_more
+    
+    buttons = []
+    if has_newer:
+        first = posts[0]
+        buttons.append(InlineKeyboardButton(
+            "◀️ Newer", callback_data=f"hist:newer:{first['id']}:{first['posted_at']}"
+        ))
+    if has_older:
+        last = posts[-1]
+        buttons.append(InlineKeyboardButton(
+            "Older ▶️", callback_data=f"hist:older:{last['id']}:{last['posted_at']}"
+        ))
+    
+    return history_text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def find_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Find posted content by title"""
+    if not await admin_only(update, context):
+        return
+    
+    query = ' '.join(context.args or [])
+    if not query:
+        await update.message.reply_text(
+            "🔍 Please provide words from the title\n"
+            "Example: `/find matrix 1999`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    posts = db.find_posts(query)
+    if not posts:
+        await update.message.reply_text(f"🔍 No posts found for: {query}")
+        return
+    
+    find_text = f"*Posts matching:* {_escape_md(query)}\n\n"
+    for post in posts:
+        find_text += f"• [{_escape_md(post['title'])}]({post['url']})\n  _{post['posted_at']}_\n\n"
+    
+    await update.message.reply_text(
+        find_text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True
+    )
+
+
+async def export_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send post history as a gzip-compressed JSONL file"""
+    if not await admin_only(update, context):
+        return
+    
+    # Compressed so the file stays under the download limit for /import
+    fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+    os.close(fd)
+    try:
+        # Runs on its own connection in a worker thread
+        count = await asyncio.to_thread(db.export_posts, path)
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                f,
+                filename=f"posts-{datetime.now():%Y%m%d-%H%M}.jsonl.gz",
+                caption=f"📦 {count} posts exported"
+            )
+    except Exception as e:
+        logger.error(f"Error exporting history: {e}")
+        await update.message.reply_text(f"❌ Export failed: {str(e)}")
+    finally:
+        os.remove(path)
+
+
+async def import_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Seed post history from a JSONL or .jsonl.gz file (sent as a reply to the file)"""
+    if not await admin_only(update, context):
+        return
+    
+    reply = update.message.reply_to_message
+    if not reply or not reply.document:
+        await update.message.reply_text(
+            "📥 Send the .jsonl.gz file from /export, then reply to it with /import"
+        )
+        return
+    if (reply.document.file_size or 0) > BOT_DOWNLOAD_LIMIT:
+        await update.message.reply_text(
+            "❌ File is over 20 MB, the most a bot can download. "
+            "Compress it with gzip (.jsonl.gz) and send it again"
+        )
+        return
+    
+    fd, path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    try:
+        telegram_file = await reply.document.get_file()
+        await telegram_file.download_to_drive(path)
+    
+        await update.message.reply_text("⏳ Importing history...")
+        result = await asyncio.to_thread(
+            db.import_posts, path, scraper.fingerprint_title
+        )
+        load_dedup_index()
     
-    await update.message.reply_text(history_text, parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(
+            f"✅ Imported {result['imported']} posts "
+            f"({result['skipped']} already known, {result['invalid']} invalid lines)\n"
+            f"{result['rows']} rows in {result['seconds']:.1f}s "
+            f"({result['rows_per_second']:.0f} rows/s)"
+        )
+    except Exception as e:
+        logger.error(f"Error importing history: {e}")
+        await update.message.reply_text(f"❌ Import failed: {str(e)}")
+    finally:
+        os.remove(path)
 
 
 async def start_autopost(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -222,7 +579,7 @@ async def stop_autopost(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     db.set_setting('auto_post_enabled', 'false')
-    scheduler.remove_all_jobs()
+    restart_scheduler(context.application)
     
     await update.message.reply_text("⏸️ Auto-posting stopped!")
 
@@ -247,6 +604,140 @@ async def force_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Error posting: {str(e)}")
 
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Arm the profiler for the next posting run, or cancel it"""
+    if not await admin_only(update, context):
+        return
+    
+    if context.args and context.args[0].lower() in ('off', 'cancel'):
+        if run_profiler.disarm() is None:
+            await update.message.reply_text("ℹ️ Profiler was not armed")
+        else:
+            await update.message.reply_text("✅ Profiler disarmed")
+        return
+    
+    run_profiler.arm(update.effective_chat.id)
+    await update.message.reply_text(
+        "🔬 Profiler armed for the next posting run\n"
+        "The report will be sent here. Use /force_post to run now, "
+        "or /profile off to cancel"
+    )
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Search the site and offer results as post buttons"""
+    if not await admin_only(update, context):
+        return
+    
+    query = scraper.normalize_query(' '.join(context.args or []))
+    if not query:
+        await update.message.reply_text(
+            "🔎 Please provide a search query\n"
+            "Example: `/search the matrix`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    text, keyboard = await render_search(query, 1)
+    await update.message.reply_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+
+
+async def search_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle post and page buttons under search results"""
+    query = update.callback_query
+    if not is_admin(update.effective_user.id):
+        await query.answer("⛔ Access denied", show_alert=True)
+        return
+    
+    action, token, *rest = query.data.split(':')
+    value = cache.get(token, namespace='tokens')
+    if value is None:
+        await query.answer("⌛ These results have expired, please search again", show_alert=True)
+        return
+    
+    if action == 'search':
+        await query.answer()
+        text, keyboard = await render_search(value, int(rest[0]))
+        await query.edit_message_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+        return
+    
+    # Fetching details can take a while; acknowledge the button right away
+    await query.answer("⏳ Posting...")
+    result = await post_search_result(context.application, value)
+    await query.message.reply_text(result)
+
+
+def callback_token(key: str, value) -> str:
+    """
+    Store a value under a short token for inline button callback data
+    (limited to 64 bytes, too short for URLs and long queries)
+    """
+    token = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    cache.set(token, value, namespace='tokens')
+    return token
+
+
+async def render_search(query: str, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Build the text and buttons for one page of search results"""
+    results = await scraper.search(query, cache, page)
+    
+    if not results:
+        text = f"🔎 No results for \"{query}\"" + (f" on page {page}" if page > 1 else "")
+    else:
+        lines = [f"🔎 Results for \"{query}\" (page {page}):", ""]
+        for i, item in enumerate(results, 1):
+            marker = " ✅" if db.is_posted(item['url']) else ""
+            lines.append(f"{i}. {item['title']} [{item['quality']}]{marker}")
+        text = "\n".join(lines)
+    
+    buttons = [
+        [InlineKeyboardButton(
+            f"📤 {i}. {item['title'][:40]}",
+            callback_data=f"post:{callback_token('item:' + item['url'], item)}"
+        )]
+        for i, item in enumerate(results, 1)
+        if not db.is_posted(item['url'])
+    ]
+    
+    query_token = callback_token('query:' + query, query)
+    nav = []
+    if page > 1:
+        nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"search:{query_token}:{page - 1}"))
+    # The site has no result count, so Next is offered on every non-empty
+    # page; it is being prefetched, and past the end it opens the empty page
+    if results:
+        nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"search:{query_token}:{page + 1}"))
+    if nav:
+        buttons.append(nav)
+    
+    return text, InlineKeyboardMarkup(buttons) if buttons else None
+
+
+async def post_search_result(application: Application, item: dict) -> str:
+    """Queue a search result for the channel and try to send it now"""
+    channel = db.get_setting('channel')
+    if not channel:
+        return "⚠️ Please set a channel first using /setchannel"
+    if db.is_posted(item['url']):
+        return f"ℹ️ Already posted: {item['title']}"
+    if db.is_queued(item['url']):
+        return f"ℹ️ Already queued: {item['title']}"
+    
+    try:
+        queued = await enqueue_item(channel, dict(item), scraper.fingerprint_title(item['title']))
+        if queued:
+            await drain_outbox(application)
+    except Exception as e:
+        logger.error(f"Error posting search result: {e}")
+        return f"❌ Error posting: {str(e)}"
+    
+    if not queued:
+        return f"❌ Could not queue: {item['title']}"
+    if db.is_posted(item['url']):
+        return f"✅ Posted: {item['title']}"
+    return f"📤 Queued, will be sent shortly: {item['title']}"
+
+
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show detailed statistics"""
     if not await admin_only(update, context):
@@ -255,6 +746,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     total_posts = db.get_total_posts()
     today_posts = db.get_posts_count_today()
     unique_content = db.get_unique_content_count()
+    poster_stats = posters.get_stats()
     
     stats_text = f"""
 📈 *Detailed Statistics*
@@ -268,6 +760,10 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Entries: {cache.size()}
 • Hit rate: {cache.get_hit_rate():.1f}%
 
+*Posters:*
+• Cached: {poster_stats['files']} ({poster_stats['bytes'] / 1024 / 1024:.1f} of {poster_stats['max_bytes'] / 1024 / 1024:.0f} MB)
+• Fetched: {poster_stats['misses']}, reused: {poster_stats['hits']}, unusable: {poster_stats['failures']}
+
 *Database:*
 • Size: {db.get_size_mb():.2f} MB
 """
@@ -275,80 +771,669 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN)
 
 
-async def post_to_channel(application: Application, channel: str, force: bool = False):
-    """Main function to post content to channel"""
+async def cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show per-namespace cache usage, or flush a namespace"""
+    if not await admin_only(update, context):
+        return
+    
+    args = context.args or []
+    if args and args[0].lower() == 'flush':
+        if len(args) < 2:
+            await update.message.reply_text("❌ Usage: /cache flush <namespace|all>")
+            return
+    
+        if args[1] == 'all':
+            cache.clear()
+            await update.message.reply_text("✅ Cache cleared")
+        else:
+            count = cache.flush(args[1])
+            await update.message.reply_text(f"✅ Flushed {count} entries from {args[1]}")
+        return
+    
+    cache_stats = cache.get_stats()
+    lines = [f"{'namespace':<11}{'items':>10}{'KB':>8}{'hit%':>7}{'evict':>7}"]
+    for name, ns in cache_stats['namespaces'].items():
+        capacity = f"{ns['size']}/{ns['max_entries']}" if ns['max_entries'] else str(ns['size'])
+        lines.append(
+            f"{name:<11}{capacity:>10}{ns['bytes'] / 1024:>8.1f}"
+            f"{ns['hit_rate']:>7.1f}{ns['evictions']:>7}"
+        )
+    
+    cache_text = (
+        "🗄 *Cache*\n\n"
+        "```\n" + "\n".join(lines) + "\n```\n"
+        f"Total: {cache_stats['size']} entries, {cache_stats['bytes'] / 1024:.1f} KB, "
+        f"hit rate {cache_stats['hit_rate']:.1f}%\n\n"
+        "Use /cache flush <namespace|all> to drop entries"
+    )
+    
+    await update.message.reply_text(cache_text, parse_mode=ParseMode.MARKDOWN)
+
+
+async def outbox_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show posts that ran out of send attempts, or retry/purge them"""
+    if not await admin_only(update, context):
+        return
+    
+    action = (context.args or [''])[0].lower()
+    if action == 'retry':
+        count = db.retry_failed_outbox()
+        # Revived entries stand for their titles in the duplicate index again
+        load_dedup_index()
+        await update.message.reply_text(f"🔁 {count} failed posts queued again")
+        return
+    if action == 'purge':
+        count = db.purge_failed_outbox()
+        await update.message.reply_text(f"🗑 Removed {count} failed posts from the outbox")
+        return
+    
+    failed = db.get_failed_outbox()
+    if not failed:
+        await update.message.reply_text("✅ No failed posts in the outbox")
+        return
+    
+    lines = ["⚠️ *Failed posts*", ""]
+    for entry in failed:
+        lines.append(f"• {_escape_md(entry['title'])}: {_escape_md((entry['last_error'] or '')[:100])}")
+    lines.append("")
+    lines.append("Failed posts are queued again when they show up on the site.")
+    lines.append("Use /outbox retry to send them now or /outbox purge to drop them")
+    await update.message.reply_text('\n'.join(lines), parse_mode=ParseMode.MARKDOWN)
+
+
+async def post_to_channel(application: Application, channel: str, force: bool = False) -> List[str]:
+    """
+    Main function to post content to channel
+    Queues new content, then drains the outbox.
+    Returns the URLs of not-yet-posted items seen on the listing page
+    """
+    if run_profiler.armed:
+        return await profile_post(application, channel, force)
+    
     try:
-        # Get content from scraper with caching
-        content = await scraper.get_latest_content(cache)
+        new_urls = await enqueue_new_content(channel)
+        await drain_outbox(application)
+        return new_urls
         
-        if not content:
-            logger.warning("No content available to post")
-            return
+    except Exception as e:
+        logger.error(f"Error in post_to_channel: {e}")
+        raise
+
+
+async def profile_post(application: Application, channel: str, force: bool = False) -> List[str]:
+    """Run post_to_channel once under the profiler and send the report"""
+    chat_id = run_profiler.disarm()
+    new_urls, error, report = await run_profiler.run(
+        'post_to_channel', lambda: post_to_channel(application, channel, force)
+    )
+    
+    try:
+        await application.bot.send_document(
+            chat_id,
+            document=report.encode('utf-8'),
+            filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt",
+            caption="🔬 Profile of the last posting run"
+        )
+    except Exception as e:
+        logger.error(f"Error sending profile report: {e}")
+    
+    if error is not None:
+        raise error
+    return new_urls
+
+
+async def enqueue_new_content(channel: str) -> List[str]:
+    """
+    Scrape stage: render new items and queue them in the outbox
+    Returns the URLs of not-yet-posted items seen on the listing page
+    """
+    # Get content from scraper with caching; stop reading once posted items follow each other
+    content = await scraper.get_latest_content(cache, stop_at=db.is_posted)
+    
+    if not content:
+        logger.warning("No content available to post")
+        return []
+    
+    new_items = [item for item in content if not db.is_posted(item['url'])]
+    dedup_mode = db.get_setting('dedup_mode') or 'skip'
+    
+    # Fetch the detail pages of all items to queue at once: the downloads
+    # overlap and one executor task parses them; enqueue_item then hits the cache.
+    # Posters download meanwhile and are handed to enqueue_item
+    to_fetch = [item for item in new_items if not db.is_queued(item['url'])]
+    poster_tasks = {
+        item['url']: asyncio.create_task(posters.fetch(item['poster_url']))
+        for item in to_fetch if item.get('poster_url')
+    }
+    if len(to_fetch) > 1 and scraper.is_available():
+        await scraper.get_details_batch([item['url'] for item in to_fetch], cache)
+    
+    for item in new_items:
+        if db.is_queued(item['url']):
+            continue
+        
+        fingerprint = scraper.fingerprint_title(item['title'])
+        match = dedup_index.find(fingerprint) if dedup_mode != 'off' else None
         
+        if isinstance(match, str):
+            # The original is still waiting in the outbox
+            logger.info(f"Deferring re-upload until original is sent: {item['title']}")
+            continue
+        
+        target = db.get_post(match) if match is not None else None
+        if target and (dedup_mode == 'skip' or not target['message_id']):
+            db.add_post(item['title'], item['url'], fingerprint=fingerprint, duplicate_of=target['id'])
+            logger.info(f"Skipping re-upload of {target['title']}: {item['title']}")
+            continue
+        
+        if not scraper.is_available(item['url']):
+            # Don't queue posts without links; the items stay new for the next run
+            logger.warning("Source site unavailable, leaving remaining items for the next run")
+            break
+        
+        # Cached records are shared and read-only; the post is built on a copy
+        await enqueue_item(channel, dict(item), fingerprint, target, poster_tasks.get(item['url']))
+    
+    if not new_items:
+        logger.info("No new content to post (nothing new on the listing)")
+    
+    return [item['url'] for item in new_items]
+
+
+async def enqueue_item(channel: str, item: dict, fingerprint: str,
+                       target: Optional[dict] = None,
+                       poster_task: Optional[asyncio.Task] = None) -> bool:
+    """
+    Fetch details for one item, render it and queue it in the outbox
+    With a target post, its links are merged into that post instead.
+    poster_task is a poster download the caller already started.
+    Returns True if something was queued
+    """
+    # Download the poster while the detail page is fetched
+    if target:
+        poster_task = None
+    elif poster_task is None and item.get('poster_url'):
+        poster_task = asyncio.create_task(posters.fetch(item['poster_url']))
+    
+    # Get download links and metadata for this item (one fetch)
+    try:
+        details = await scraper.get_details(item['url'], cache)
+        if details.get('unavailable'):
+            # Don't queue a post without links; the item stays new for the next run
+            logger.warning(f"Source site unavailable, leaving {item['title']} for the next run")
+            return False
+        item['download_links'] = await prober.check_links(
+            details['links'], db.get_setting('probe_mode') or 'drop'
+        )
+        enrich_item(item, details['meta'])
+    except Exception as e:
+        logger.error(f"Error getting download links: {e}")
+        item['download_links'] = []
+    
+    if target:
+        return await enqueue_merge(target, item, fingerprint)
+    
+    # Posters only known from the detail page are fetched now
+    if poster_task:
+        poster_file = await poster_task
+    else:
+        poster_file = await posters.fetch(item.get('poster_url', ''))
+    
+    # Render caption and keyboard once; the outbox keeps the result
+    content_hash, message, keyboard = render_post(item)
+    
+    payload = {
+        'caption': message,
+        'keyboard': keyboard.to_dict() if keyboard else None,
+        'poster_url': item.get('poster_url', ''),
+        'poster_file': poster_file,
+        'content_hash': content_hash,
+        'fingerprint': fingerprint
+    }
+    if db.enqueue_post(item['title'], item['url'], channel, payload):
+        dedup_index.add(fingerprint, item['url'])
+        logger.info(f"Queued: {item['title']}")
+        return True
+    return False
+
+
+def enrich_item(item: dict, meta: dict):
+    """Fill post fields from detail page metadata without overwriting scraped ones"""
+    for key in ('year', 'rating', 'genre', 'plot'):
+        if meta.get(key) and not item.get(key):
+            item[key] = meta[key]
+    
+    if not item.get('poster_url'):
+        item['poster_url'] = meta.get('poster') or meta.get('image') or ''
+
+
+async def enqueue_merge(target: dict, item: dict, fingerprint: str) -> bool:
+    """
+    Queue an edit that adds a re-upload's links to the original post
+    Returns True if an edit was queued
+    """
+    details = await scraper.get_details(target['url'], cache)
+    if details.get('unavailable'):
+        # Without the original's links the merge would drop them
+        logger.warning(f"Source site unavailable, leaving merge into {target['title']} for the next run")
+        return False
+    old_links = details['links']
+    
+    known_urls = {link['url'] for link in old_links}
+    added = [link for link in item['download_links'] if link['url'] not in known_urls]
+    merged_links = old_links + added
+    
+    # The keyboard shows only the first links; an edit that renders the same
+    # buttons would be rejected as "message is not modified". The stored hash
+    # also covers links an earlier merge already added to the post
+    old_keyboard = create_download_keyboard({'url': target['url'], 'download_links': old_links})
+    keyboard = create_download_keyboard({'url': target['url'], 'download_links': merged_links})
+    content_hash = compute_content_hash(keyboard, len(merged_links))
+    if not added or keyboard == old_keyboard or content_hash == target.get('content_hash'):
+        db.add_post(item['title'], item['url'], fingerprint=fingerprint, duplicate_of=target['id'])
+        logger.info(f"Re-upload adds no new links to {target['title']}: {item['title']}")
+        return False
+    
+    payload = {
+        'merge_into': target['id'],
+        'target_url': target['url'],
+        'message_id': target['message_id'],
+        'keyboard': keyboard.to_dict() if keyboard else None,
+        'link_count': len(merged_links),
+        'content_hash': content_hash,
+        'fingerprint': fingerprint
+    }
+    if db.enqueue_post(item['title'], item['url'], target['channel'], payload):
+        logger.info(f"Queued merge of {item['title']} into {target['title']}")
+        return True
+    return False
+
+
+async def drain_outbox(application: Application, limit: Optional[int] = None) -> int:
+    """
+    Sender stage: send due outbox entries with retries
+    Sends at most limit (default POSTS_PER_RUN) posts; returns the number sent
+    """
+    if _outbox_lock.locked():
+        return 0
+    
+    async with _outbox_lock:
         posted_count = 0
+        limit = limit or POSTS_PER_RUN
+        due = db.get_due_outbox(limit=max(limit, ALBUM_SIZE * ALBUMS_PER_RUN))
+        
+        # After an outage, clear the backlog in albums instead of one post per send
+        if len(due) >= CATCHUP_THRESHOLD:
+            posted_count, due = await send_catchup(application, due)
         
-        # Check for duplicates
-        for item in content:
-            if db.is_posted(item['url']):
-                logger.info(f"Skipping duplicate: {item['title']}")
+        for entry in due[:limit]:
+            # Wait for a send slot before claiming, so the claim and the
+            # posted check are fresh when the send goes out
+            await send_limiter.wait()
+            # Another replica is sending this URL right now
+            claim = f"send:{entry['url']}"
+            if not db.acquire_lease(claim, REPLICA_ID, SEND_CLAIM_TTL):
                 continue
-            
-            # Get download links for this item
             try:
-                download_links = await scraper.get_download_links(item['url'], cache)
-                item['download_links'] = download_links
-            except Exception as e:
-                logger.error(f"Error getting download links: {e}")
-                item['download_links'] = []
-            
-            # Format message
-            message = format_post_message(item)
-            
-            # Create inline keyboard with download links
-            keyboard = create_download_keyboard(item)
+                if await send_outbox_entry(application, entry):
+                    posted_count += 1
+            except RetryAfter:
+                break
+            finally:
+                db.release_lease(claim, REPLICA_ID)
+        
+        return posted_count
+
+
+async def send_outbox_entry(application: Application, entry: dict) -> bool:
+    """
+    Send one claimed outbox entry and record the outcome
+    The caller has already waited for a send slot. Returns True if it was
+    posted; re-raises RetryAfter after rescheduling the entry so the caller
+    can stop the run
+    """
+    # Idempotency: the URL may have been posted since it was queued
+    if db.is_posted(entry['url']):
+        db.discard_outbox(entry['id'])
+        release_fingerprint(entry)
+        return False
+    
+    payload = entry['payload']
+    keyboard = None
+    if payload.get('keyboard'):
+        keyboard = InlineKeyboardMarkup.de_json(payload['keyboard'], application.bot)
+    
+    try:
+        if payload.get('merge_into'):
+            await edit_merged_post(application, entry, keyboard)
+            sent = None
+        elif photo := poster_for(payload):
+            try:
+                sent = await application.bot.send_photo(
+                    chat_id=entry['channel'],
+                    photo=photo,
+                    caption=payload['caption'],
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=keyboard
+                )
+            except BadRequest as e:
+                # A rejected image fails the same way on every retry; post without it
+                logger.warning(f"Photo rejected ({e}), posting {entry['title']} as text")
+                sent = await application.bot.send_message(
+                    chat_id=entry['channel'],
+                    text=payload['caption'],
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=keyboard
+                )
+        else:
+            sent = await application.bot.send_message(
+                chat_id=entry['channel'],
+                text=payload['caption'],
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=keyboard
+            )
+    except RetryAfter as e:
+        # Flood control applies to the whole bot, stop this run
+        retry_in = _retry_seconds(e.retry_after)
+        send_limiter.pause(retry_in)
+        # Waiting out a flood limit is not the post's fault; don't use up an attempt
+        db.defer_outbox(entry['id'], str(e), retry_in)
+        logger.warning(f"Flood limit hit, pausing sends for {retry_in:.0f}s")
+        raise
+    except Exception as e:
+        retry_in = OUTBOX_RETRY_BASE * (2 ** entry['attempts'])
+        if db.fail_outbox(entry['id'], str(e), retry_in, OUTBOX_MAX_ATTEMPTS):
+            release_fingerprint(entry)
+        logger.error(f"Error posting {entry['title']}: {e}")
+        return False
+    
+    # Record in history and remove from the outbox
+    if payload.get('merge_into'):
+        db.update_post_timestamp(payload['target_url'], content_hash=payload.get('content_hash'))
+        db.complete_outbox(
+            entry['id'],
+            fingerprint=payload.get('fingerprint'),
+            duplicate_of=payload['merge_into']
+        )
+        logger.info(f"Merged links into post {payload['merge_into']}: {entry['title']}")
+    else:
+        post_id = db.complete_outbox(
+            entry['id'],
+            content_hash=payload.get('content_hash'),
+            message_id=sent.message_id if sent else None,
+            fingerprint=payload.get('fingerprint')
+        )
+        if post_id and payload.get('fingerprint'):
+            dedup_index.add(payload['fingerprint'], post_id)
+        logger.info(f"Posted: {entry['title']}")
+    return True
+
+
+async def edit_merged_post(application: Application, entry: dict,
+                           keyboard: Optional[InlineKeyboardMarkup]):
+    """
+    Swap the merged keyboard into the original post, then bring the
+    caption's link count up to date
+    The bot keeps no copy of posted captions, so the caption is rebuilt
+    from the message Telegram returns for the keyboard edit
+    """
+    payload = entry['payload']
+    try:
+        message = await application.bot.edit_message_reply_markup(
+            chat_id=entry['channel'],
+            message_id=payload['message_id'],
+            reply_markup=keyboard
+        )
+    except BadRequest as e:
+        # Already applied, e.g. by a send whose result was lost
+        if 'not modified' not in str(e).lower():
+            raise
+        return
+    
+    if not isinstance(message, Message) or not payload.get('link_count'):
+        return
+    
+    photo = message.caption is not None
+    try:
+        old_text = message.caption_markdown if photo else message.text_markdown
+    except ValueError:
+        # Formatting that Markdown can't express
+        return
+    if not old_text:
+        return
+    new_text = LINK_COUNT_PATTERN.sub(format_link_count(payload['link_count']), old_text, count=1)
+    if new_text == old_text:
+        return
+    
+    await send_limiter.wait()
+    try:
+        if photo:
+            await application.bot.edit_message_caption(
+                chat_id=entry['channel'],
+                message_id=payload['message_id'],
+                caption=new_text,
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=keyboard
+            )
+        else:
+            await application.bot.edit_message_text(
+                new_text,
+                chat_id=entry['channel'],
+                message_id=payload['message_id'],
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=keyboard
+            )
+    except RetryAfter as e:
+        send_limiter.pause(_retry_seconds(e.retry_after))
+        logger.warning(f"Flood limit hit, link count of {entry['title']} not updated")
+    except Exception as e:
+        # The links are merged; a stale count is not worth resending for
+        logger.warning(f"Could not update link count of {entry['title']}: {e}")
+
+
+async def send_catchup(application: Application, entries: List[dict]) -> Tuple[int, List[dict]]:
+    """
+    Catch-up mode: send backlog posts with posters as albums
+    At most ALBUMS_PER_RUN albums go out, across all channels. Returns
+    (posts sent, entries left for normal sending: merges, posts without a
+    poster and albums of one). Nothing is left after a flood error
+    """
+    groups = {}
+    photos = {}  # Entry id -> poster, read from disk once
+    rest = []
+    for entry in entries:
+        payload = entry['payload']
+        photo = None if payload.get('merge_into') else poster_for(payload)
+        if photo:
+            photos[entry['id']] = photo
+            groups.setdefault(entry['channel'], []).append(entry)
+        else:
+            rest.append(entry)
+    
+    posted_count = 0
+    albums_sent = 0
+    for channel_entries in groups.values():
+        for start in range(0, len(channel_entries), ALBUM_SIZE):
+            album = channel_entries[start:start + ALBUM_SIZE]
+            if len(album) < 2:
+                rest.extend(album)
+                continue
+            if albums_sent >= ALBUMS_PER_RUN:
+                # The next run sends the rest as albums too
+                continue
             
-            # Send to channel
+            # Wait for the send slot first; see drain_outbox
+            await send_limiter.wait()
+            claims = [f"send:{entry['url']}" for entry in album]
+            claimed = [
+                entry for entry, claim in zip(album, claims)
+                if db.acquire_lease(claim, REPLICA_ID, SEND_CLAIM_TTL)
+            ]
             try:
-                if item.get('poster_url'):
-                    await application.bot.send_photo(
-                        chat_id=channel,
-                        photo=item['poster_url'],
-                        caption=message,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=keyboard
-                    )
-                else:
-                    await application.bot.send_message(
-                        chat_id=channel,
-                        text=message,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=keyboard
-                    )
-                
-                # Record in database
-                db.add_post(item['title'], item['url'])
-                logger.info(f"Posted: {item['title']}")
-                
-                posted_count += 1
-                
-                # Limit posts per run (avoid flooding)
-                if posted_count >= 3:
-                    logger.info("Reached post limit for this run")
-                    break
+                # Idempotency: the URLs may have been posted since they were queued
+                for entry in [entry for entry in claimed if db.is_posted(entry['url'])]:
+                    db.discard_outbox(entry['id'])
+                    release_fingerprint(entry)
+                    claimed.remove(entry)
                 
-                # Add delay between posts
-                await asyncio.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"Error posting {item['title']}: {e}")
-                continue
-        
-        if posted_count == 0:
-            logger.info("No new content to post (all duplicates)")
-        
-    except Exception as e:
-        logger.error(f"Error in post_to_channel: {e}")
+                # Telegram albums need at least two photos
+                if len(claimed) >= 2:
+                    albums_sent += 1
+                    try:
+                        posted_count += await send_album(application, claimed, photos)
+                    except BadRequest:
+                        # Per-post sends count attempts, so a bad entry fails alone
+                        for i, entry in enumerate(claimed):
+                            if i:
+                                await send_limiter.wait()
+                            if await send_outbox_entry(application, entry):
+                                posted_count += 1
+                elif claimed and await send_outbox_entry(application, claimed[0]):
+                    posted_count += 1
+            except RetryAfter:
+                return posted_count, []
+            finally:
+                for claim in claims:
+                    db.release_lease(claim, REPLICA_ID)
+    
+    return posted_count, rest
+
+
+async def send_album(application: Application, entries: List[dict], photos: dict) -> int:
+    """
+    Send claimed, unposted entries as one album plus a silent message with
+    their links
+    Albums can't carry buttons, so the follow-up holds each post's best
+    links. photos maps entry ids to posters. The caller has already waited
+    for a send slot. Returns the number of posts sent; re-raises RetryAfter
+    after rescheduling the entries, and BadRequest with the entries left
+    untouched so the caller can send them one by one
+    """
+    channel = entries[0]['channel']
+    media = [
+        InputMediaPhoto(
+            photos[entry['id']],
+            caption=f"{i}. *{_escape_md(entry['title'])}*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        for i, entry in enumerate(entries, 1)
+    ]
+    
+    try:
+        await application.bot.send_media_group(chat_id=channel, media=media)
+    except RetryAfter as e:
+        retry_in = _retry_seconds(e.retry_after)
+        send_limiter.pause(retry_in)
+        for entry in entries:
+            db.defer_outbox(entry['id'], str(e), retry_in)
+        logger.warning(f"Flood limit hit, pausing sends for {retry_in:.0f}s")
         raise
+    except BadRequest as e:
+        # Usually one bad poster or caption; the rest can still go out
+        logger.warning(f"Album of {len(entries)} rejected, sending singly: {e}")
+        raise
+    except Exception as e:
+        for entry in entries:
+            retry_in = OUTBOX_RETRY_BASE * (2 ** entry['attempts'])
+            if db.fail_outbox(entry['id'], str(e), retry_in, OUTBOX_MAX_ATTEMPTS):
+                release_fingerprint(entry)
+        logger.error(f"Error posting album of {len(entries)}: {e}")
+        return 0
+    
+    # The album is out; record it before the links message so it is never resent
+    for entry in entries:
+        payload = entry['payload']
+        # No message_id: album photos have no keyboard for merges to edit
+        post_id = db.complete_outbox(
+            entry['id'],
+            content_hash=payload.get('content_hash'),
+            fingerprint=payload.get('fingerprint')
+        )
+        if post_id and payload.get('fingerprint'):
+            dedup_index.add(payload['fingerprint'], post_id)
+    logger.info(f"Posted album of {len(entries)}: {', '.join(entry['title'] for entry in entries)}")
+    
+    text, keyboard = render_album_links(entries)
+    for attempt in range(2):
+        await send_limiter.wait()
+        try:
+            await application.bot.send_message(
+                chat_id=channel,
+                text=text,
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=keyboard,
+                disable_notification=True
+            )
+            break
+        except RetryAfter as e:
+            # Wait it out once; without this message the album has no links
+            retry_in = _retry_seconds(e.retry_after)
+            send_limiter.pause(retry_in)
+            logger.warning(f"Flood limit hit on album links, retrying in {retry_in:.0f}s")
+        except Exception as e:
+            logger.error(f"Error sending album links: {e}")
+            break
+    
+    return len(entries)
+
+
+def release_fingerprint(entry: dict):
+    """
+    Take a queued post that won't be sent out of the duplicate index
+    If its URL was posted in the meantime, the index points at that post instead
+    """
+    payload = entry['payload']
+    fingerprint = payload.get('fingerprint')
+    if not fingerprint or payload.get('merge_into'):
+        return
+    
+    if dedup_index.discard(fingerprint, entry['url']):
+        post_id = db.get_original_id(entry['url'])
+        if post_id is not None:
+            dedup_index.add(fingerprint, post_id)
+
+
+def render_album_links(entries: List[dict]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Build the compact links message for an album from each post's keyboard"""
+    lines = [f"📥 *Download links* ({len(entries)} posts above)"]
+    rows = []
+    for i, entry in enumerate(entries, 1):
+        lines.append(f"{i}. {_escape_md(entry['title'])}")
+        # Rendered keyboards list the best quality first and end with More Info
+        keyboard = entry['payload'].get('keyboard') or {}
+        buttons = [
+            button for row in keyboard.get('inline_keyboard', []) for button in row
+            if button.get('url') and button['url'] != entry['url']
+        ]
+        row = [
+            InlineKeyboardButton(f"{i} · {button['text'].split(' ', 1)[-1]}", url=button['url'])
+            for button in buttons[:CATCHUP_LINKS_PER_ITEM]
+        ]
+        if row:
+            rows.append(row)
+    return '\n'.join(lines), InlineKeyboardMarkup(rows) if rows else None
+
+
+def poster_for(payload: dict):
+    """
+    Get the photo to send for an outbox payload: cached bytes, a URL, or None
+    A poster_file of None means the poster couldn't be fetched, so the post
+    goes out as text. Entries queued before the poster cache have no
+    poster_file and still send their URL
+    """
+    if 'poster_file' not in payload:
+        return payload.get('poster_url') or None
+    if payload['poster_file'] is None:
+        return None
+    # Fall back to the URL if the file was pruned or lives on another replica
+    return posters.load(payload['poster_file']) or payload.get('poster_url') or None
+
+
+def _retry_seconds(retry_after) -> float:
+    """Convert a RetryAfter delay (int or timedelta) to seconds"""
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
 
 
 def _escape_md(value) -> str:
@@ -401,12 +1486,17 @@ def format_post_message(item: dict) -> str:
     
     # Add download links count indicator
     if download_count > 0:
-        message += f"\n\n💾 {download_count} Download {'Link' if download_count == 1 else 'Links'} Available"
+        message += f"\n\n{format_link_count(download_count)}"
         message += f"\n👇 _Click the buttons below to download_"
     
     return message
 
 
+def format_link_count(count: int) -> str:
+    """Caption line announcing the number of download links"""
+    return f"💾 {count} Download {'Link' if count == 1 else 'Links'} Available"
+
+
 def create_download_keyboard(item: dict) -> InlineKeyboardMarkup:
     """
     Create inline keyboard with download links
@@ -442,33 +1532,195 @@ def create_download_keyboard(item: dict) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(buttons) if buttons else None
 
 
+def compute_content_hash(keyboard: Optional[InlineKeyboardMarkup], link_count: int) -> str:
+    """
+    Hash the parts of a post that merges edit: its keyboard and link count.
+    Posts store it, so a merge that would leave the post unchanged is skipped.
+    """
+    payload = json.dumps(
+        [keyboard.to_dict() if keyboard else None, link_count],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def render_post(item: dict) -> Tuple[str, str, Optional[InlineKeyboardMarkup]]:
+    """
+    Render caption and keyboard once per item; the outbox keeps the result
+    for retries. Returns (content_hash, caption, keyboard)
+    """
+    keyboard = create_download_keyboard(item)
+    content_hash = compute_content_hash(keyboard, len(item.get('download_links', [])))
+    return content_hash, format_post_message(item), keyboard
+
+
+async def adaptive_post(application: Application, channel: str):
+    """Scheduled run in adaptive mode: post, then retune the interval"""
+    # The listing cache would hide new items at short intervals; keep it as a fallback
+    cache.expire('latest_content', namespace='listing')
+    
+    new_urls = []
+    try:
+        new_urls = await post_to_channel(application, channel)
+    finally:
+        if adaptive_interval and scheduler.get_job('auto_post'):
+            # Items stuck on the listing count once, when they first appear
+            minutes = adaptive_interval.record_run(adaptive_interval.count_new(new_urls))
+            scheduler.reschedule_job(
+                'auto_post',
+                trigger='interval',
+                minutes=minutes,
+                jitter=adaptive_interval.jitter_seconds()
+            )
+            logger.info(f"Adaptive scheduler: next run in ~{minutes:.1f} minutes")
+
+
+async def run_if_leader(job, *args):
+    """
+    Run a scheduled job only on the replica that holds the scheduler lease
+    Every run renews the lease; once the owner stops renewing, the next
+    replica to run a job takes over. A replica taking over reloads the
+    duplicate index, which missed the other replica's posts while it waited
+    """
+    global _holds_scheduler_lease
+    
+    if not db.acquire_lease(SCHEDULER_LEASE, REPLICA_ID, LEASE_TTL):
+        _holds_scheduler_lease = False
+        logger.debug(f"Skipping {job.__name__}: scheduled jobs are owned by another replica")
+        return None
+    
+    if not _holds_scheduler_lease:
+        _holds_scheduler_lease = True
+        logger.info(f"Replica {REPLICA_ID} took over scheduled jobs")
+        load_dedup_index()
+    return await job(*args)
+
+
 def restart_scheduler(application: Application):
     """Restart the scheduler with current settings"""
+    global adaptive_interval
+    
     scheduler.remove_all_jobs()
+    adaptive_interval = None
+    
+    # Maintenance runs whether or not auto-posting is enabled
+    scheduler.add_job(
+        run_if_leader,
+        'interval',
+        hours=RETENTION_INTERVAL_HOURS,
+        args=[run_retention],
+        id='retention',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
     
     if db.get_setting('auto_post_enabled') == 'true':
         timer = int(db.get_setting('timer') or '5')
         channel = db.get_setting('channel')
         
-        if channel:
+        if not channel:
+            return
+        
+        # Slow runs must never overlap; missed runs collapse into one
+        job_options = dict(
+            id='auto_post',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        
+        if db.get_setting('schedule_mode') == 'adaptive':
+            adaptive_interval = AdaptiveInterval(
+                int(db.get_setting('timer_min') or '2'),
+                int(db.get_setting('timer_max') or '30')
+            )
             scheduler.add_job(
-                post_to_channel,
+                run_if_leader,
                 'interval',
+                args=[adaptive_post, application, channel],
+                minutes=adaptive_interval.current,
+                jitter=adaptive_interval.jitter_seconds(),
+                **job_options
+            )
+            logger.info(
+                f"Scheduler started: adaptive posting every "
+                f"{adaptive_interval.min_minutes}-{adaptive_interval.max_minutes} minutes"
+            )
+        else:
+            scheduler.add_job(
+                run_if_leader,
+                'interval',
+                args=[post_to_channel, application, channel],
                 minutes=timer,
-                args=[application, channel],
-                id='auto_post',
-                replace_existing=True
+                **job_options
             )
             logger.info(f"Scheduler started: posting every {timer} minutes")
+        
+        # Independent sender drains retries and backlog between scrapes
+        scheduler.add_job(
+            run_if_leader,
+            'interval',
+            minutes=1,
+            args=[drain_outbox, application],
+            id='outbox_sender',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+
+async def run_retention():
+    """Scheduled maintenance: purge old posts in chunks off the event loop"""
+    days = db.get_setting('retention_days')
+    if not days or days == 'off':
+        return
+    
+    archive = (db.get_setting('retention_mode') or 'archive') == 'archive'
+    try:
+        result = await asyncio.to_thread(db.purge_old_posts, int(days), archive)
+    except Exception as e:
+        logger.error(f"Retention purge failed: {e}")
+        return
+    
+    if result['deleted']:
+        logger.info(
+            f"Retention purged {result['deleted']} posts older than {days} days "
+            f"({result['archived']} archived, {result['chunks']} chunks, "
+            f"{result['freed_mb']:.2f} MB freed)"
+        )
+        # Drop index entries pointing at purged posts
+        load_dedup_index()
+
+
+def load_dedup_index():
+    """Fill the in-memory duplicate index from post history"""
+    backfilled = db.backfill_fingerprints(scraper.fingerprint_title)
+    if backfilled:
+        logger.info(f"Computed fingerprints for {backfilled} older posts")
+    
+    dedup_index.clear()
+    for post_id, fingerprint in db.get_fingerprints():
+        dedup_index.add(fingerprint, post_id)
+    for url, fingerprint in db.get_queued_fingerprints():
+        dedup_index.add(fingerprint, url)
+    logger.info(f"Duplicate index loaded: {len(dedup_index)} titles")
 
 
 async def post_init(application: Application):
     """Initialize bot on startup"""
     logger.info("Bot started!")
     
-    # Start scheduler if auto-posting is enabled
-    if db.get_setting('auto_post_enabled') == 'true':
-        restart_scheduler(application)
+    load_dedup_index()
+    
+    # Schedule maintenance, and posting if auto-posting is enabled
+    restart_scheduler(application)
+
+
+async def post_shutdown(application: Application):
+    """Hand scheduled jobs to a standby replica right away"""
+    db.release_lease(SCHEDULER_LEASE, REPLICA_ID)
 
 
 def main():
@@ -482,18 +1734,40 @@ def main():
         return
     
     # Create application
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if BOT_API_BASE_URL:
+        builder.base_url(BOT_API_BASE_URL)
+        logger.info(f"Using Bot API at {BOT_API_BASE_URL}")
+    application = builder.build()
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("setchannel", set_channel))
     application.add_handler(CommandHandler("settimer", set_timer))
+    application.add_handler(CommandHandler("setschedule", set_schedule))
+    application.add_handler(CommandHandler("setdedup", set_dedup))
+    application.add_handler(CommandHandler("setprobe", set_probe))
+    application.add_handler(CommandHandler("setretention", set_retention))
     application.add_handler(CommandHandler("status", status))
     application.add_handler(CommandHandler("posted", posted_history))
+    application.add_handler(CommandHandler("find", find_posts))
+    application.add_handler(CommandHandler("export", export_history))
+    application.add_handler(CommandHandler("import", import_history))
     application.add_handler(CommandHandler("start_autopost", start_autopost))
     application.add_handler(CommandHandler("stop_autopost", stop_autopost))
     application.add_handler(CommandHandler("force_post", force_post))
+    application.add_handler(CommandHandler("search", search_command))
     application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("cache", cache_command))
+    application.add_handler(CommandHandler("outbox", outbox_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CallbackQueryHandler(search_callback, pattern=r'^(post|search):'))
+    application.add_handler(CallbackQueryHandler(history_callback, pattern=r'^hist:'))
     
     # Start scheduler
     scheduler.start()
@@ -1,101 +1,318 @@
 """
 Cache Manager for the bot
-Provides in-memory caching with TTL support
+Provides in-memory caching with TTL support, split into namespaces
+that each have their own policy and statistics
 """
 
+import asyncio
+import sys
 import time
-from typing import Any, Optional
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class CachePolicy(NamedTuple):
+    ttl: float = 300
+    stale_ttl: float = 0
+    max_entries: Optional[int] = None
+
+
+# TTLs are in seconds. Namespaces not listed here use the 'default' policy
+DEFAULT_POLICIES: Dict[str, CachePolicy] = {
+    'default': CachePolicy(),
+    # Fresh for 5 minutes, then served while refreshing for 10 more
+    'listing': CachePolicy(ttl=300, stale_ttl=600, max_entries=16),
+    # Fresh for 1 hour, then served while refreshing for 6 more
+    'detail': CachePolicy(ttl=3600, stale_ttl=6 * 3600, max_entries=500),
+    'links_prev': CachePolicy(ttl=86400, max_entries=2000),
+    # Result pages per normalized query and page number
+    'search': CachePolicy(ttl=600, stale_ttl=1800, max_entries=100),
+    # Short callback tokens for inline buttons
+    'tokens': CachePolicy(ttl=86400, max_entries=2000),
+}
+
+
+def approx_size(value: Any, _seen: Optional[set] = None) -> int:
+    """Estimate the memory held by a value, following containers and objects"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _seen) + approx_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, _seen) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += approx_size(vars(value), _seen)
+    elif hasattr(value, '__slots__'):
+        size += sum(approx_size(getattr(value, name, None), _seen) for name in value.__slots__)
+    return size
+
+
+class _Namespace:
+    def __init__(self, policy: CachePolicy):
+        self.policy = policy
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()  # Least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
 class CacheManager:
-    def __init__(self):
-        """Initialize cache manager"""
-        self._cache = {}
-        self._hits = 0
-        self._misses = 0
+    def __init__(self, policies: Optional[Dict[str, CachePolicy]] = None):
+        """Initialize cache manager with per-namespace policies (defaults if omitted)"""
+        self._policies = dict(DEFAULT_POLICIES)
+        if policies:
+            self._policies.update(policies)
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+    
+    def _ns(self, namespace: str) -> _Namespace:
+        """Get a namespace, creating it on first use"""
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            policy = self._policies.get(namespace, self._policies['default'])
+            ns = self._namespaces[namespace] = _Namespace(policy)
+        return ns
     
-    def get(self, key: str) -> Optional[Any]:
+    def _remove(self, ns: _Namespace, key: str):
+        """Drop an entry and its byte count"""
+        entry = ns.entries.pop(key)
+        ns.bytes -= entry['size']
+    
+    def get(self, key: str, namespace: str = 'default') -> Optional[Any]:
         """Get value from cache"""
-        if key in self._cache:
-            entry = self._cache[key]
-            
+        ns = self._ns(namespace)
+        entry = ns.entries.get(key)
+        if entry is not None:
             # Check if expired
             if entry['expires_at'] > time.time():
-                self._hits += 1
-                logger.debug(f"Cache hit: {key}")
+                ns.hits += 1
+                ns.entries.move_to_end(key)
+                logger.debug(f"Cache hit: {namespace}/{key}")
                 return entry['value']
             else:
-                # Remove expired entry
-                del self._cache[key]
-                self._misses += 1
-                logger.debug(f"Cache expired: {key}")
+                # Remove expired entry (kept while it can still serve as stale data)
+                if entry['stale_until'] <= time.time():
+                    self._remove(ns, key)
+                ns.misses += 1
+                logger.debug(f"Cache expired: {namespace}/{key}")
                 return None
         
-        self._misses += 1
-        logger.debug(f"Cache miss: {key}")
+        ns.misses += 1
+        logger.debug(f"Cache miss: {namespace}/{key}")
         return None
     
-    def set(self, key: str, value: Any, ttl: int = 300):
+    def set(self, key: str, value: Any, ttl: Optional[float] = None,
+            stale_ttl: Optional[float] = None, namespace: str = 'default'):
         """
         Set value in cache with TTL (time to live) in seconds
-        Default TTL is 300 seconds (5 minutes)
+        ttl and stale_ttl default to the namespace policy. For stale_ttl
+        seconds after expiry, get_or_refresh still serves the value while
+        refreshing. The least recently used entries are evicted once the
+        namespace holds more than its max_entries
         """
-        expires_at = time.time() + ttl
-        self._cache[key] = {
+        ns = self._ns(namespace)
+        if ttl is None:
+            ttl = ns.policy.ttl
+        if stale_ttl is None:
+            stale_ttl = ns.policy.stale_ttl
+        
+        if key in ns.entries:
+            self._remove(ns, key)
+        
+        now = time.time()
+        size = approx_size(value)
+        ns.entries[key] = {
             'value': value,
-            'expires_at': expires_at,
-            'created_at': time.time()
+            'expires_at': now + ttl,
+            'stale_until': now + ttl + stale_ttl,
+            'created_at': now,
+            'size': size
         }
-        logger.debug(f"Cache set: {key} (TTL: {ttl}s)")
+        ns.bytes += size
+        
+        limit = ns.policy.max_entries
+        while limit is not None and len(ns.entries) > limit:
+            self._remove(ns, next(iter(ns.entries)))
+            ns.evictions += 1
+        
+        logger.debug(f"Cache set: {namespace}/{key} (TTL: {ttl}s, stale: {stale_ttl}s)")
+    
+    def get_stale(self, key: str, namespace: str = 'default') -> Optional[Any]:
+        """Get a value regardless of expiry, if it is still held"""
+        entry = self._ns(namespace).entries.get(key)
+        return entry['value'] if entry else None
     
-    def delete(self, key: str):
+    def expire(self, key: str, namespace: str = 'default'):
+        """Mark an entry as past its hard TTL but keep it as a fallback"""
+        entry = self._ns(namespace).entries.get(key)
+        if entry:
+            entry['expires_at'] = entry['stale_until'] = time.time()
+    
+    async def get_or_refresh(self, key: str, loader: Callable[[], Awaitable[Any]],
+                             ttl: Optional[float] = None, stale_ttl: Optional[float] = None,
+                             namespace: str = 'default') -> Tuple[Any, bool]:
+        """
+        Get a value, loading it with `loader` when needed
+        Returns (value, stale). Within the soft window (ttl) the value is
+        fresh. Up to stale_ttl after that it is returned immediately while
+        one background task refreshes it. Past that hard TTL the caller
+        waits for the refresh; if it fails, the old value is returned with
+        stale=True. Errors propagate only when there is nothing to fall back on
+        """
+        ns = self._ns(namespace)
+        entry = ns.entries.get(key)
+        now = time.time()
+        
+        if entry and entry['expires_at'] > now:
+            ns.hits += 1
+            ns.entries.move_to_end(key)
+            return entry['value'], False
+        
+        if entry and entry['stale_until'] > now:
+            ns.hits += 1
+            ns.entries.move_to_end(key)
+            self._start_refresh(namespace, key, loader, ttl, stale_ttl)
+            logger.debug(f"Cache stale hit, refreshing in background: {namespace}/{key}")
+            return entry['value'], False
+        
+        ns.misses += 1
+        try:
+            value = await asyncio.shield(
+                self._start_refresh(namespace, key, loader, ttl, stale_ttl)
+            )
+            return value, False
+        except Exception as e:
+            entry = ns.entries.get(key)
+            if entry is None:
+                raise
+            logger.warning(f"Refresh of {namespace}/{key} failed ({e}), serving stale value")
+            return entry['value'], True
+    
+    def prefetch(self, key: str, loader: Callable[[], Awaitable[Any]],
+                 namespace: str = 'default'):
+        """
+        Load a value in the background unless it is already fresh
+        Does not count as a hit or miss; failures are only logged
+        """
+        entry = self._ns(namespace).entries.get(key)
+        if entry is None or entry['expires_at'] <= time.time():
+            self._start_refresh(namespace, key, loader, None, None)
+    
+    def _start_refresh(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]],
+                       ttl: Optional[float], stale_ttl: Optional[float]) -> asyncio.Task:
+        """Start a refresh for key unless one is already running"""
+        task_key = (namespace, key)
+        task = self._refreshing.get(task_key)
+        if task is not None:
+            return task
+        
+        async def refresh():
+            value = await loader()
+            self.set(key, value, ttl=ttl, stale_ttl=stale_ttl, namespace=namespace)
+            return value
+        
+        def done(finished: asyncio.Task):
+            if self._refreshing.get(task_key) is finished:
+                del self._refreshing[task_key]
+            if not finished.cancelled() and finished.exception():
+                logger.debug(f"Cache refresh failed: {namespace}/{key}: {finished.exception()}")
+        
+        task = asyncio.create_task(refresh())
+        task.add_done_callback(done)
+        self._refreshing[task_key] = task
+        return task
+    
+    def delete(self, key: str, namespace: str = 'default'):
         """Delete a key from cache"""
-        if key in self._cache:
-            del self._cache[key]
-            logger.debug(f"Cache deleted: {key}")
+        ns = self._ns(namespace)
+        if key in ns.entries:
+            self._remove(ns, key)
+            logger.debug(f"Cache deleted: {namespace}/{key}")
+    
+    def flush(self, namespace: str) -> int:
+        """Drop every entry in one namespace, keeping its counters; returns the count"""
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            return 0
+        count = len(ns.entries)
+        ns.entries.clear()
+        ns.bytes = 0
+        logger.info(f"Cache namespace flushed: {namespace} ({count} entries)")
+        return count
     
     def clear(self):
         """Clear all cache"""
-        self._cache.clear()
-        self._hits = 0
-        self._misses = 0
+        self._namespaces.clear()
         logger.info("Cache cleared")
     
     def size(self) -> int:
         """Get number of items in cache"""
-        return len(self._cache)
+        return sum(len(ns.entries) for ns in self._namespaces.values())
     
     def get_hit_rate(self) -> float:
         """Get cache hit rate percentage"""
-        total = self._hits + self._misses
+        hits = sum(ns.hits for ns in self._namespaces.values())
+        total = hits + sum(ns.misses for ns in self._namespaces.values())
         if total == 0:
             return 0.0
-        return (self._hits / total) * 100
+        return (hits / total) * 100
     
     def cleanup_expired(self):
         """Remove all expired entries"""
         current_time = time.time()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if entry['expires_at'] <= current_time
-        ]
+        removed = 0
         
-        for key in expired_keys:
-            del self._cache[key]
+        for ns in self._namespaces.values():
+            expired_keys = [
+                key for key, entry in ns.entries.items()
+                if entry['stale_until'] <= current_time
+            ]
+            for key in expired_keys:
+                self._remove(ns, key)
+            removed += len(expired_keys)
         
-        if expired_keys:
-            logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
+        if removed:
+            logger.info(f"Cleaned up {removed} expired cache entries")
         
-        return len(expired_keys)
+        return removed
+    
+    def get_namespace_stats(self) -> Dict[str, dict]:
+        """Get per-namespace statistics, keyed by namespace name"""
+        stats = {}
+        for name, ns in sorted(self._namespaces.items()):
+            total = ns.hits + ns.misses
+            stats[name] = {
+                'size': len(ns.entries),
+                'max_entries': ns.policy.max_entries,
+                'bytes': ns.bytes,
+                'hits': ns.hits,
+                'misses': ns.misses,
+                'evictions': ns.evictions,
+                'hit_rate': (ns.hits / total) * 100 if total else 0.0,
+                'ttl': ns.policy.ttl
+            }
+        return stats
     
     def get_stats(self) -> dict:
         """Get cache statistics"""
+        namespaces = self.get_namespace_stats()
         return {
             'size': self.size(),
-            'hits': self._hits,
-            'misses': self._misses,
-            'hit_rate': self.get_hit_rate()
+            'bytes': sum(ns['bytes'] for ns in namespaces.values()),
+            'hits': sum(ns['hits'] for ns in namespaces.values()),
+            'misses': sum(ns['misses'] for ns in namespaces.values()),
+            'evictions': sum(ns['evictions'] for ns in namespaces.values()),
+            'hit_rate': self.get_hit_rate(),
+            'namespaces': namespaces
         }
@@ -0,0 +1,160 @@
+"""
+Circuit breaker for calls to the source site
+Fails fast while a host keeps erroring or timing out, then lets a single
+trial call through to check whether it has recovered
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5,
+                 error_rate: float = 0.5, slow_call: float = 10.0,
+                 slow_rate: float = 0.5, open_seconds: float = 60,
+                 max_open_seconds: float = 600):
+        """
+        Initialize breaker
+        Over the last `window` calls (at least min_calls), it opens when the
+        share of failures reaches error_rate or the share of calls slower
+        than slow_call seconds reaches slow_rate. It stays open for
+        open_seconds, doubled after each failed trial up to max_open_seconds
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self._calls: deque = deque(maxlen=window)  # (failed, slow) per call
+        self._cooldown = open_seconds
+        self._open_until = 0.0
+        self._trial = False
+
+    def allows_calls(self) -> bool:
+        """Check if a call would be let through right now"""
+        if self.state == OPEN:
+            return time.monotonic() >= self._open_until
+        if self.state == HALF_OPEN:
+            return not self._trial
+        return True
+
+    def acquire(self):
+        """Claim permission for one call, raising CircuitOpenError if there is none"""
+        if self.state == OPEN:
+            if time.monotonic() < self._open_until:
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+            self.state = HALF_OPEN
+            logger.info(f"Circuit for {self.name} half-open, sending a trial call")
+
+        if self.state == HALF_OPEN:
+            if self._trial:
+                raise CircuitOpenError(f"{self.name} is unavailable (trial call in flight)")
+            self._trial = True
+
+    def release(self):
+        """Give back a claim without an outcome (e.g. the call was cancelled)"""
+        self._trial = False
+
+    def record(self, success: bool, elapsed: float):
+        """Record the outcome of a call made after acquire()"""
+        slow = elapsed >= self.slow_call
+
+        if self.state == HALF_OPEN:
+            self._trial = False
+            if success and not slow:
+                self.state = CLOSED
+                self._calls.clear()
+                self._cooldown = self.open_seconds
+                logger.info(f"Circuit for {self.name} closed, host recovered")
+            else:
+                self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+                self._open()
+            return
+
+        self._calls.append((not success, slow))
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            failures = sum(failed for failed, _ in self._calls) / len(self._calls)
+            slow_calls = sum(is_slow for _, is_slow in self._calls) / len(self._calls)
+            if failures >= self.error_rate or slow_calls >= self.slow_rate:
+                self._open()
+
+    def _open(self):
+        """Start failing fast for the current cooldown"""
+        self.state = OPEN
+        self._open_until = time.monotonic() + self._cooldown
+        logger.warning(f"Circuit for {self.name} open for {self._cooldown:.0f}s")
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """
+        Guard one call
+        Raises CircuitOpenError up front while open; an exception from the
+        body counts as a failure, a normal exit as a success
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        else:
+            self.record(True, time.monotonic() - start)
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a trial call through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def get_stats(self) -> dict:
+        """Get breaker state and recent error/slow rates"""
+        calls = len(self._calls)
+        return {
+            'state': self.state,
+            'retry_in': self.retry_in(),
+            'calls': calls,
+            'error_rate': sum(failed for failed, _ in self._calls) / calls if calls else 0.0,
+            'slow_rate': sum(slow for _, slow in self._calls) / calls if calls else 0.0
+        }
+
+
+class BreakerRegistry:
+    def __init__(self, **options):
+        """Create one breaker per host on demand, all with the given options"""
+        self.options = options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        """Get the breaker for the host of a URL"""
+        host = urlsplit(url).hostname or ''
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host, **self.options)
+        return breaker
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Get stats for every host seen so far"""
+        return {host: breaker.get_stats() for host, breaker in sorted(self._breakers.items())}
@@ -5,8 +5,35 @@ Uses SQLite for persistent storage
 
 import sqlite3
 import os
+import gzip
+import hashlib
+import re
+import json
+import time
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def url_hash(url: str) -> int:
+    """64-bit key for a URL in the compact archive"""
+    return int.from_bytes(hashlib.sha1(url.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+def open_jsonl(path: str, mode: str = 'r'):
+    """
+    Open a JSONL file as text, gzip-compressed if it is
+    Files are written compressed when path ends in .gz; on reading,
+    compression is detected from the content so the name doesn't matter
+    """
+    if 'w' in mode:
+        compressed = path.endswith('.gz')
+    else:
+        with open(path, 'rb') as f:
+            compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
 
 
 class Database:
@@ -18,9 +45,20 @@ class Database:
     
     def _init_database(self):
         """Create database tables if they don't exist"""
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = self._connect(check_same_thread=False)
         cursor = self.conn.cursor()
+        # Wait for other connections and replicas instead of failing with "locked"
+        cursor.execute('PRAGMA busy_timeout=10000')
+        
+        # Free pages are returned to the OS in small steps by purge_old_posts;
+        # existing files are rebuilt once to switch modes
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('VACUUM')
+        
+        # WAL lets bulk jobs on their own connection run beside the bot
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
         
         # Settings table
         cursor.execute('''
@@ -47,12 +85,227 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_url ON posts(url)
         ''')
         
+        # Keyset pagination order; also serves posted_at range scans
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_posted_at ON posts(posted_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_posted_at_id ON posts(posted_at DESC, id DESC)
         ''')
+        cursor.execute('DROP INDEX IF EXISTS idx_posted_at')
+        
+        # Outbox of rendered posts waiting to be sent
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)
+        ''')
+        
+        # Download link and host health from the link prober
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS link_health (
+                url TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                alive INTEGER NOT NULL,
+                status INTEGER,
+                checked_at REAL NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS host_health (
+                host TEXT PRIMARY KEY,
+                alive INTEGER NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        ''')
+        
+        # Time-limited ownership claims shared by replicas on this database
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        
+        # Purged posts, reduced to what is needed to never post them again
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS posts_archive (
+                url_hash INTEGER PRIMARY KEY,
+                posted_day INTEGER
+            ) WITHOUT ROWID
+        ''')
+        
+        # Columns added after the initial schema
+        self._ensure_column(cursor, 'posts', 'content_hash', 'TEXT')
+        self._ensure_column(cursor, 'posts', 'fingerprint', 'TEXT')
+        self._ensure_column(cursor, 'posts', 'duplicate_of', 'INTEGER')
+        self._ensure_column(cursor, 'posts', 'channel', 'TEXT')
+        self._ensure_column(cursor, 'posts', 'message_id', 'INTEGER')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fingerprint ON posts(fingerprint)
+        ''')
+        
+        self._init_counters(cursor)
+        self.fts_enabled = self._init_title_search(cursor)
         
         self.conn.commit()
     
+    def _init_counters(self, cursor):
+        """
+        Create rollup tables for post counts, kept in sync by triggers
+        so statistics never have to scan the posts table
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_totals'")
+        needs_backfill = cursor.fetchone() is None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_totals (
+                channel TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                unique_total INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_daily (
+                channel TEXT NOT NULL,
+                day TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (channel, day)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_count_insert AFTER INSERT ON posts
+            BEGIN
+                INSERT INTO post_totals (channel, total, unique_total)
+                VALUES (COALESCE(NEW.channel, ''), 1, NEW.duplicate_of IS NULL)
+                ON CONFLICT(channel) DO UPDATE SET
+                    total = total + 1,
+                    unique_total = unique_total + (NEW.duplicate_of IS NULL);
+                INSERT INTO post_daily (channel, day, total)
+                VALUES (COALESCE(NEW.channel, ''), DATE(NEW.posted_at), 1)
+                ON CONFLICT(channel, day) DO UPDATE SET total = total + 1;
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_count_delete AFTER DELETE ON posts
+            BEGIN
+                UPDATE post_totals SET
+                    total = total - 1,
+                    unique_total = unique_total - (OLD.duplicate_of IS NULL)
+                WHERE channel = COALESCE(OLD.channel, '');
+                UPDATE post_daily SET total = total - 1
+                WHERE channel = COALESCE(OLD.channel, '') AND day = DATE(OLD.posted_at);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_count_update
+            AFTER UPDATE OF channel, duplicate_of, posted_at ON posts
+            BEGIN
+                UPDATE post_totals SET
+                    total = total - 1,
+                    unique_total = unique_total - (OLD.duplicate_of IS NULL)
+                WHERE channel = COALESCE(OLD.channel, '');
+                UPDATE post_daily SET total = total - 1
+                WHERE channel = COALESCE(OLD.channel, '') AND day = DATE(OLD.posted_at);
+                INSERT INTO post_totals (channel, total, unique_total)
+                VALUES (COALESCE(NEW.channel, ''), 1, NEW.duplicate_of IS NULL)
+                ON CONFLICT(channel) DO UPDATE SET
+                    total = total + 1,
+                    unique_total = unique_total + (NEW.duplicate_of IS NULL);
+                INSERT INTO post_daily (channel, day, total)
+                VALUES (COALESCE(NEW.channel, ''), DATE(NEW.posted_at), 1)
+                ON CONFLICT(channel, day) DO UPDATE SET total = total + 1;
+            END
+        ''')
+        
+        if needs_backfill:
+            # One-time rollup of history recorded before the counters existed
+            cursor.execute('''
+                INSERT INTO post_totals (channel, total, unique_total)
+                SELECT COALESCE(channel, ''), COUNT(*), SUM(duplicate_of IS NULL)
+                FROM posts GROUP BY COALESCE(channel, '')
+            ''')
+            cursor.execute('''
+                INSERT INTO post_daily (channel, day, total)
+                SELECT COALESCE(channel, ''), DATE(posted_at), COUNT(*)
+                FROM posts GROUP BY COALESCE(channel, ''), DATE(posted_at)
+            ''')
+    
+    def _init_title_search(self, cursor) -> bool:
+        """
+        Create an FTS5 index over post titles, kept in sync by triggers
+        Returns False if this SQLite build has no FTS5 (find_posts then scans)
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")
+        needs_backfill = cursor.fetchone() is None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+                    title, content='posts', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_fts_insert AFTER INSERT ON posts
+            BEGIN
+                INSERT INTO posts_fts (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_fts_delete AFTER DELETE ON posts
+            BEGIN
+                INSERT INTO posts_fts (posts_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_posts_fts_update AFTER UPDATE OF title ON posts
+            BEGIN
+                INSERT INTO posts_fts (posts_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+                INSERT INTO posts_fts (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        
+        if needs_backfill:
+            # One-time index of history recorded before search existed
+            cursor.execute("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+        return True
+    
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        """Open a connection to the database with the app's row factory and functions"""
+        conn = sqlite3.connect(self.db_path, **kwargs)
+        conn.row_factory = sqlite3.Row
+        conn.create_function('url_hash', 1, url_hash, deterministic=True)
+        return conn
+    
+    def _ensure_column(self, cursor, table: str, column: str, definition: str):
+        """Add a column to an existing table if it is missing"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in {row['name'] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
     def set_setting(self, key: str, value: str):
         """Set a configuration setting"""
         cursor = self.conn.cursor()
@@ -69,14 +322,15 @@ class Database:
         result = cursor.fetchone()
         return result['value'] if result else None
     
-    def add_post(self, title: str, url: str):
+    def add_post(self, title: str, url: str, content_hash: Optional[str] = None,
+                 fingerprint: Optional[str] = None, duplicate_of: Optional[int] = None):
         """Add a post to history"""
         cursor = self.conn.cursor()
         try:
             cursor.execute('''
-                INSERT INTO posts (title, url)
-                VALUES (?, ?)
-            ''', (title, url))
+                INSERT INTO posts (title, url, content_hash, fingerprint, duplicate_of)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, url, content_hash, fingerprint, duplicate_of))
             self.conn.commit()
             return True
         except sqlite3.IntegrityError:
@@ -84,11 +338,139 @@ class Database:
             return False
     
     def is_posted(self, url: str) -> bool:
-        """Check if URL has already been posted"""
+        """Check if URL has already been posted (including archived posts)"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT 1 FROM posts WHERE url = ?', (url,))
+        cursor.execute('''
+            SELECT 1 FROM posts WHERE url = ?
+            UNION ALL
+            SELECT 1 FROM posts_archive WHERE url_hash = ?
+            LIMIT 1
+        ''', (url, url_hash(url)))
         return cursor.fetchone() is not None
     
+    def get_post(self, post_id: int) -> Optional[Dict]:
+        """Get a post by id"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, title, url, channel, message_id, content_hash
+            FROM posts WHERE id = ?
+        ''', (post_id,))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+    
+    def get_original_id(self, url: str) -> Optional[int]:
+        """Get the id of the post for URL if it is an original (non-duplicate) post"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id FROM posts WHERE url = ? AND duplicate_of IS NULL', (url,))
+        result = cursor.fetchone()
+        return result['id'] if result else None
+    
+    def get_fingerprints(self) -> Iterator[Tuple[int, str]]:
+        """Iterate (post id, fingerprint) for original (non-duplicate) posts"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, fingerprint FROM posts
+            WHERE fingerprint IS NOT NULL AND duplicate_of IS NULL
+        ''')
+        for row in cursor:
+            yield row['id'], row['fingerprint']
+    
+    def backfill_fingerprints(self, fingerprint: Callable[[str], str]) -> int:
+        """Compute fingerprints for posts recorded before they existed"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id, title FROM posts WHERE fingerprint IS NULL')
+        updates = [(fingerprint(row['title']), row['id']) for row in cursor.fetchall()]
+        
+        if updates:
+            cursor.executemany('UPDATE posts SET fingerprint = ? WHERE id = ?', updates)
+            self.conn.commit()
+        return len(updates)
+    
+    def export_posts(self, path: str) -> int:
+        """
+        Write post history to a JSONL file, one post per line, oldest first
+        Streams rows on its own connection so it can run in a worker thread.
+        The file is gzip-compressed if path ends in .gz. Re-uploads refer
+        to their original by URL. Returns the row count
+        """
+        conn = self._connect()
+        count = 0
+        try:
+            cursor = conn.execute('''
+                SELECT p.title, p.url, p.posted_at, p.updated_at, p.content_hash,
+                       p.fingerprint, p.channel, p.message_id, o.url AS duplicate_of_url
+                FROM posts p LEFT JOIN posts o ON o.id = p.duplicate_of
+                ORDER BY p.id
+            ''')
+            with open_jsonl(path, 'w') as f:
+                for row in cursor:
+                    f.write(json.dumps(dict(row), ensure_ascii=False) + '\n')
+                    count += 1
+        finally:
+            conn.close()
+        return count
+    
+    def import_posts(self, path: str, fingerprint: Optional[Callable[[str], str]] = None,
+                     batch_size: int = 5000) -> Dict:
+        """
+        Load post history from a JSONL file written by export_posts
+        Plain and gzip-compressed files are both read. Reads the file in
+        constant memory and inserts batch_size rows per transaction on its
+        own connection, so it can run in a worker thread.
+        URLs already in history are skipped. Missing fingerprints are
+        computed with `fingerprint`. Archived URLs are skipped too.
+        Returns counts and rows per second
+        """
+        started = time.monotonic()
+        stats = {'rows': 0, 'imported': 0, 'skipped': 0, 'invalid': 0}
+        
+        def records(f):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    post = json.loads(line)
+                    title, url = post['title'], post['url']
+                except (ValueError, KeyError, TypeError):
+                    stats['invalid'] += 1
+                    continue
+                
+                stats['rows'] += 1
+                fp = post.get('fingerprint') or (fingerprint(title) if fingerprint else None)
+                yield (title, url, post.get('posted_at'), post.get('updated_at'),
+                       post.get('content_hash'), fp, post.get('duplicate_of_url'),
+                       post.get('channel'), post.get('message_id'), url)
+        
+        conn = self._connect(timeout=30)
+        try:
+            with open_jsonl(path) as f:
+                rows = records(f)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    with conn:
+                        cursor = conn.executemany('''
+                            INSERT OR IGNORE INTO posts
+                                (title, url, posted_at, updated_at, content_hash, fingerprint,
+                                 duplicate_of, channel, message_id)
+                            SELECT ?, ?, COALESCE(?, CURRENT_TIMESTAMP),
+                                   COALESCE(?, CURRENT_TIMESTAMP), ?, ?,
+                                   (SELECT id FROM posts WHERE url = ?), ?, ?
+                            WHERE NOT EXISTS (
+                                SELECT 1 FROM posts_archive WHERE url_hash = url_hash(?)
+                            )
+                        ''', batch)
+                        stats['imported'] += cursor.rowcount
+        finally:
+            conn.close()
+        
+        elapsed = time.monotonic() - started
+        stats['skipped'] = stats['rows'] - stats['imported']
+        stats['seconds'] = elapsed
+        stats['rows_per_second'] = stats['rows'] / elapsed if elapsed > 0 else 0.0
+        return stats
+    
     def get_recent_posts(self, limit: int = 10) -> List[Dict]:
         """Get recent posts"""
         cursor = self.conn.cursor()
@@ -100,24 +482,99 @@ class Database:
         ''', (limit,))
         return [dict(row) for row in cursor.fetchall()]
     
-    def get_total_posts(self) -> int:
-        """Get total number of posts"""
+    def get_posts_page(self, cursor_key: Optional[Tuple[str, int]] = None,
+                       newer: bool = False, limit: int = 10) -> Tuple[List[Dict], bool]:
+        """
+        Get one page of history, newest first, by keyset pagination
+        cursor_key is the (posted_at, id) of the last post on the previous
+        page; with newer=True, the page before the one starting there.
+        Returns (posts, has_more) where has_more says if another page
+        exists in the direction that was read
+        """
+        cursor = self.conn.cursor()
+        if cursor_key is None:
+            cursor.execute('''
+                SELECT id, title, url, posted_at FROM posts
+                ORDER BY posted_at DESC, id DESC
+                LIMIT ?
+            ''', (limit + 1,))
+        elif newer:
+            cursor.execute('''
+                SELECT id, title, url, posted_at FROM posts
+                WHERE (posted_at, id) > (?, ?)
+                ORDER BY posted_at ASC, id ASC
+                LIMIT ?
+            ''', (*cursor_key, limit + 1))
+        else:
+            cursor.execute('''
+                SELECT id, title, url, posted_at FROM posts
+                WHERE (posted_at, id) < (?, ?)
+                ORDER BY posted_at DESC, id DESC
+                LIMIT ?
+            ''', (*cursor_key, limit + 1))
+        
+        posts = [dict(row) for row in cursor.fetchall()]
+        has_more = len(posts) > limit
+        posts = posts[:limit]
+        if newer:
+            posts.reverse()
+        return posts, has_more
+    
+    def find_posts(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Find posts whose title contains all words of query (word prefixes
+        match), best matches first
+        """
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return []
+        
         cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM posts')
+        if self.fts_enabled:
+            match = ' '.join(f'"{word}"*' for word in words)
+            cursor.execute('''
+                SELECT p.id, p.title, p.url, p.posted_at
+                FROM posts_fts f JOIN posts p ON p.id = f.rowid
+                WHERE posts_fts MATCH ?
+                ORDER BY f.rank
+                LIMIT ?
+            ''', (match, limit))
+        else:
+            conditions = ' AND '.join('title LIKE ?' for _ in words)
+            cursor.execute(f'''
+                SELECT id, title, url, posted_at FROM posts
+                WHERE {conditions}
+                ORDER BY posted_at DESC, id DESC
+                LIMIT ?
+            ''', [f'%{word}%' for word in words] + [limit])
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_total_posts(self, channel: Optional[str] = None) -> int:
+        """Get total number of posts, optionally for one channel"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT COALESCE(SUM(total), 0) as count FROM post_totals
+            WHERE ? IS NULL OR channel = ?
+        ''', (channel, channel))
         return cursor.fetchone()['count']
     
-    def get_posts_count_today(self) -> int:
-        """Get number of posts made today"""
+    def get_posts_count_today(self, channel: Optional[str] = None) -> int:
+        """Get number of posts made today, optionally for one channel"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT COUNT(*) as count FROM posts
-            WHERE DATE(posted_at) = DATE('now')
-        ''')
+            SELECT COALESCE(SUM(total), 0) as count FROM post_daily
+            WHERE day = DATE('now') AND (? IS NULL OR channel = ?)
+        ''', (channel, channel))
         return cursor.fetchone()['count']
     
-    def get_unique_content_count(self) -> int:
-        """Get count of unique content"""
-        return self.get_total_posts()
+    def get_unique_content_count(self, channel: Optional[str] = None) -> int:
+        """Get count of unique content (re-uploads excluded)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT COALESCE(SUM(unique_total), 0) as count FROM post_totals
+            WHERE ? IS NULL OR channel = ?
+        ''', (channel, channel))
+        return cursor.fetchone()['count']
     
     def get_last_post_time(self) -> Optional[str]:
         """Get timestamp of last post"""
@@ -137,26 +594,298 @@ class Database:
             return size_bytes / (1024 * 1024)
         return 0.0
     
-    def update_post_timestamp(self, url: str):
+    def update_post_timestamp(self, url: str, content_hash: Optional[str] = None):
         """Update the timestamp for a post (when links are updated)"""
         cursor = self.conn.cursor()
         cursor.execute('''
             UPDATE posts
-            SET updated_at = CURRENT_TIMESTAMP
+            SET updated_at = CURRENT_TIMESTAMP,
+                content_hash = COALESCE(?, content_hash)
             WHERE url = ?
-        ''', (url,))
+        ''', (content_hash, url))
         self.conn.commit()
     
-    def clear_old_posts(self, days: int = 90):
-        """Clear posts older than specified days"""
+    def enqueue_post(self, title: str, url: str, channel: str, payload: Dict) -> bool:
+        """
+        Queue a rendered post for sending
+        A failed entry for the URL is replaced and starts over with fresh
+        attempts. Returns False if the URL is already queued or posted
+        """
+        if self.is_posted(url):
+            return False
+        
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO outbox (url, title, channel, payload)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                title = excluded.title,
+                channel = excluded.channel,
+                payload = excluded.payload,
+                status = 'pending',
+                attempts = 0,
+                next_attempt_at = 0,
+                last_error = NULL
+            WHERE outbox.status = 'failed'
+        ''', (url, title, channel, json.dumps(payload)))
+        self.conn.commit()
+        return cursor.rowcount > 0
+    
+    def get_queued_fingerprints(self) -> Iterator[Tuple[str, str]]:
+        """Iterate (url, fingerprint) for queued new posts (merges and failed entries excluded)"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT url, payload FROM outbox WHERE status != 'failed'")
+        for row in cursor.fetchall():
+            payload = json.loads(row['payload'])
+            if payload.get('fingerprint') and 'merge_into' not in payload:
+                yield row['url'], payload['fingerprint']
+    
+    def is_queued(self, url: str) -> bool:
+        """Check if URL is waiting in the outbox; failed entries don't count"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM outbox WHERE url = ? AND status != 'failed'", (url,))
+        return cursor.fetchone() is not None
+    
+    def get_due_outbox(self, limit: int = 10) -> List[Dict]:
+        """Get pending outbox entries whose next attempt is due, oldest first"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, url, title, channel, payload, attempts
+            FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id
+            LIMIT ?
+        ''', (time.time(), limit))
+        
+        entries = []
+        for row in cursor.fetchall():
+            entry = dict(row)
+            entry['payload'] = json.loads(entry['payload'])
+            entries.append(entry)
+        return entries
+    
+    def complete_outbox(self, entry_id: int, content_hash: Optional[str] = None,
+                        message_id: Optional[int] = None, fingerprint: Optional[str] = None,
+                        duplicate_of: Optional[int] = None) -> Optional[int]:
+        """
+        Record a sent outbox entry in history and remove it from the outbox
+        Both steps happen in one transaction. Returns the post id
+        """
+        with self.conn:
+            row = self.conn.execute(
+                'SELECT title, url, channel FROM outbox WHERE id = ?', (entry_id,)
+            ).fetchone()
+            if not row:
+                return None
+            
+            cursor = self.conn.execute('''
+                INSERT OR IGNORE INTO posts
+                    (title, url, content_hash, fingerprint, duplicate_of, channel, message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (row['title'], row['url'], content_hash, fingerprint, duplicate_of,
+                  row['channel'], message_id))
+            post_id = cursor.lastrowid if cursor.rowcount else None
+            self.conn.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+        return post_id
+    
+    def discard_outbox(self, entry_id: int):
+        """Remove an outbox entry without recording it"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+        self.conn.commit()
+    
+    def fail_outbox(self, entry_id: int, error: str, retry_in: float, max_attempts: int = 5) -> bool:
+        """
+        Record a failed send attempt and schedule the next one
+        Entries that reach max_attempts are marked as failed; returns True if
+        this one was
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                next_attempt_at = ?,
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+            WHERE id = ?
+        ''', (error, time.time() + retry_in, max_attempts, entry_id))
+        self.conn.commit()
+        cursor.execute("SELECT 1 FROM outbox WHERE id = ? AND status = 'failed'", (entry_id,))
+        return cursor.fetchone() is not None
+    
+    def defer_outbox(self, entry_id: int, error: str, retry_in: float):
+        """Push back an entry without counting an attempt (e.g. after a flood wait)"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            DELETE FROM posts
-            WHERE posted_at < datetime('now', '-' || ? || ' days')
-        ''', (days,))
+            UPDATE outbox SET last_error = ?, next_attempt_at = ? WHERE id = ?
+        ''', (error, time.time() + retry_in, entry_id))
+        self.conn.commit()
+    
+    def get_failed_outbox(self, limit: int = 10) -> List[Dict]:
+        """Get entries that ran out of attempts, most recent first"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, url, title, attempts, last_error FROM outbox
+            WHERE status = 'failed'
+            ORDER BY next_attempt_at DESC
+            LIMIT ?
+        ''', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def retry_failed_outbox(self) -> int:
+        """Give every failed entry a fresh set of attempts; returns the count"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0
+            WHERE status = 'failed'
+        ''')
+        self.conn.commit()
+        return cursor.rowcount
+    
+    def purge_failed_outbox(self) -> int:
+        """Delete every failed entry; returns the count"""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM outbox WHERE status = 'failed'")
         self.conn.commit()
         return cursor.rowcount
     
+    def get_outbox_counts(self) -> Dict[str, int]:
+        """Get number of outbox entries per status"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) as count FROM outbox GROUP BY status')
+        return {row['status']: row['count'] for row in cursor.fetchall()}
+    
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Claim or renew a named lease for ttl seconds
+        Succeeds if the lease is free, expired or already held by owner.
+        The check and the claim are one statement, so two replicas can
+        never both succeed
+        """
+        now = time.time()
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                owner = excluded.owner,
+                expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+        ''', (name, owner, now + ttl, now))
+        self.conn.commit()
+        return cursor.rowcount > 0
+    
+    def release_lease(self, name: str, owner: str):
+        """Give up a lease if owner still holds it"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+        self.conn.commit()
+    
+    def get_lease(self, name: str) -> Optional[Dict]:
+        """Get the current holder of a lease, or None if it is free or expired"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT owner, expires_at FROM leases
+            WHERE name = ? AND expires_at > ?
+        ''', (name, time.time()))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+    
+    def get_link_health(self, urls: List[str]) -> Dict[str, Dict]:
+        """Get cached probe results for the given link URLs"""
+        if not urls:
+            return {}
+        
+        cursor = self.conn.cursor()
+        placeholders = ','.join('?' * len(urls))
+        cursor.execute(f'''
+            SELECT url, alive, status, checked_at FROM link_health
+            WHERE url IN ({placeholders})
+        ''', urls)
+        return {row['url']: dict(row) for row in cursor.fetchall()}
+    
+    def get_host_health(self, hosts: List[str]) -> Dict[str, Dict]:
+        """Get cached reachability for the given hosts"""
+        if not hosts:
+            return {}
+        
+        cursor = self.conn.cursor()
+        placeholders = ','.join('?' * len(hosts))
+        cursor.execute(f'''
+            SELECT host, alive, checked_at FROM host_health
+            WHERE host IN ({placeholders})
+        ''', hosts)
+        return {row['host']: dict(row) for row in cursor.fetchall()}
+    
+    def save_probe_results(self, links: List[Tuple], hosts: List[Tuple]):
+        """
+        Store probe results in one transaction
+        links are (url, host, alive, status) and hosts are (host, alive)
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO link_health (url, host, alive, status, checked_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [link + (now,) for link in links])
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO host_health (host, alive, checked_at)
+                VALUES (?, ?, ?)
+            ''', [host + (now,) for host in hosts])
+    
+    def clear_old_posts(self, days: int = 90):
+        """Clear posts older than specified days"""
+        return self.purge_old_posts(days, archive=False)['deleted']
+    
+    def purge_old_posts(self, days: int = 90, archive: bool = True, chunk_size: int = 500,
+                        vacuum_pages: int = 256, pause: float = 0.05) -> Dict:
+        """
+        Delete posts older than specified days in chunks of chunk_size
+        Each chunk is its own short transaction on a separate connection,
+        so this can run in a worker thread while the bot keeps posting.
+        With archive, purged URLs are kept in posts_archive and still count
+        as posted. After each chunk up to vacuum_pages free pages are
+        released, then the thread sleeps for `pause` seconds
+        """
+        stats = {'deleted': 0, 'archived': 0, 'chunks': 0}
+        size_before = self.get_size_mb()
+        
+        conn = self._connect(timeout=30)
+        try:
+            while True:
+                with conn:
+                    ids = [row['id'] for row in conn.execute('''
+                        SELECT id FROM posts
+                        WHERE posted_at < datetime('now', '-' || ? || ' days')
+                        ORDER BY id
+                        LIMIT ?
+                    ''', (days, chunk_size))]
+                    if not ids:
+                        break
+                    
+                    placeholders = ','.join('?' * len(ids))
+                    if archive:
+                        cursor = conn.execute(f'''
+                            INSERT OR IGNORE INTO posts_archive (url_hash, posted_day)
+                            SELECT url_hash(url), CAST(julianday(posted_at) AS INTEGER)
+                            FROM posts WHERE id IN ({placeholders})
+                        ''', ids)
+                        stats['archived'] += cursor.rowcount
+                    cursor = conn.execute(f'DELETE FROM posts WHERE id IN ({placeholders})', ids)
+                    stats['deleted'] += cursor.rowcount
+                
+                stats['chunks'] += 1
+                # executescript steps the pragma to completion; execute() frees one page
+                conn.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)});')
+                time.sleep(pause)
+            
+            # Release whatever is still free and fold the WAL back into the file
+            conn.executescript('PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);')
+        finally:
+            conn.close()
+        
+        stats['freed_mb'] = max(0.0, size_before - self.get_size_mb())
+        return stats
+    
     def close(self):
         """Close database connection"""
         if self.conn:
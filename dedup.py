@@ -0,0 +1,126 @@
+"""
+Near-duplicate detection for re-listed titles
+MinHash signatures over character n-grams, bucketed with LSH banding
+"""
+
+import zlib
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+NGRAM_SIZE = 3
+NUM_HASHES = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+_PRIME = (1 << 61) - 1
+
+# Fixed coefficients so signatures are stable across restarts
+_COEFFICIENTS = [
+    ((i * 0x9E3779B1 + 0x7F4A7C15) % _PRIME | 1, (i * 0x85EBCA77 + 0xC2B2AE3D) % _PRIME)
+    for i in range(1, NUM_HASHES + 1)
+]
+
+
+def split_fingerprint(fingerprint: str) -> Tuple[str, str]:
+    """Split a "name|year|season" fingerprint into (name, scope)"""
+    name, _, scope = fingerprint.partition('|')
+    return name, scope
+
+
+def shingles(name: str) -> Set[str]:
+    """Get the character n-grams of a normalized name"""
+    padded = f' {name} '
+    if len(padded) <= NGRAM_SIZE:
+        return {padded}
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def minhash(name: str) -> Tuple[int, ...]:
+    """Compute the MinHash signature of a normalized name"""
+    hashed = [zlib.crc32(gram.encode('utf-8')) for gram in shingles(name)]
+    return tuple(
+        min((a * value + b) % _PRIME for value in hashed)
+        for a, b in _COEFFICIENTS
+    )
+
+
+class DuplicateIndex:
+    def __init__(self, threshold: float = 0.8):
+        """
+        Initialize an empty index
+        threshold is the minimum estimated n-gram similarity for a match
+        """
+        self.threshold = threshold
+        self._refs: Dict[str, Hashable] = {}
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[tuple, List[str]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._refs)
+    
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]):
+        """Yield LSH bucket keys; year and season are part of every key"""
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            yield (scope, band, signature[start:start + ROWS_PER_BAND])
+    
+    def add(self, fingerprint: str, ref: Hashable):
+        """Add or update a fingerprint pointing at ref"""
+        if fingerprint in self._refs:
+            self._refs[fingerprint] = ref
+            return
+        
+        name, scope = split_fingerprint(fingerprint)
+        signature = minhash(name)
+        self._refs[fingerprint] = ref
+        self._signatures[fingerprint] = signature
+        for key in self._band_keys(scope, signature):
+            self._buckets.setdefault(key, []).append(fingerprint)
+    
+    def discard(self, fingerprint: str, ref: Hashable = None) -> bool:
+        """
+        Remove a fingerprint; with ref, only if it still points there
+        Returns True if it was removed
+        """
+        if fingerprint not in self._refs:
+            return False
+        if ref is not None and self._refs[fingerprint] != ref:
+            return False
+        
+        _, scope = split_fingerprint(fingerprint)
+        del self._refs[fingerprint]
+        for key in self._band_keys(scope, self._signatures.pop(fingerprint)):
+            bucket = self._buckets[key]
+            bucket.remove(fingerprint)
+            if not bucket:
+                del self._buckets[key]
+        return True
+    
+    def find(self, fingerprint: str) -> Optional[Hashable]:
+        """Get the ref of the closest indexed fingerprint, or None"""
+        if fingerprint in self._refs:
+            return self._refs[fingerprint]
+        
+        name, scope = split_fingerprint(fingerprint)
+        if not name:
+            return None
+        
+        signature = minhash(name)
+        candidates = set()
+        for key in self._band_keys(scope, signature):
+            candidates.update(self._buckets.get(key, ()))
+        
+        best_ref = None
+        best_score = self.threshold
+        for candidate in candidates:
+            other = self._signatures[candidate]
+            score = sum(x == y for x, y in zip(signature, other)) / NUM_HASHES
+            if score >= best_score:
+                best_ref, best_score = self._refs[candidate], score
+        
+        return best_ref
+    
+    def clear(self):
+        """Remove all fingerprints"""
+        self._refs.clear()
+        self._signatures.clear()
+        self._buckets.clear()
@@ -0,0 +1,308 @@
+"""
+Local stand-in for the Telegram Bot API
+Answers the methods the bot uses with plausible results, after a
+configurable latency, and enforces Telegram-like flood limits with 429
+responses. Point an Application at it with
+Application.builder().base_url(api.base_url) or BOT_API_BASE_URL
+
+Usage: python fake_bot_api.py [--port 8081] [--latency 0.1] ...
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Methods that deliver something to a chat and count against flood limits
+SEND_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendDocument', 'sendMediaGroup',
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'
+}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 per_chat_per_minute: int = 20, global_per_second: int = 30,
+                 retry_after_rate: float = 0.0, retry_after: int = 5,
+                 reject_methods: Iterable[str] = (), seed: Optional[int] = None):
+        """
+        Initialize the fake API
+        Each call takes latency seconds plus up to jitter more. Sends above
+        per_chat_per_minute in one chat or global_per_second overall get a
+        429 with the real retry_after; retry_after_rate injects extra 429s
+        (retry_after seconds) at random. Calls to reject_methods get a 400
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.per_chat_per_minute = per_chat_per_minute
+        self.global_per_second = global_per_second
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.reject_methods = set(reject_methods)
+        self.random = random.Random(seed)
+
+        self.sent: List[Dict] = []  # Accepted sends: method, chat_id, at, params, uploads
+        self.calls: Counter = Counter()
+        self.flood_errors = 0
+        self._chat_sends: Dict[str, Deque[float]] = defaultdict(deque)
+        self._global_sends: Deque[float] = deque()
+        self._chat_ids: Dict[str, int] = {}
+        self._message_ids: Counter = Counter()
+        self._messages: Dict[tuple, dict] = {}  # (chat id, message id) -> message
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ''
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving; returns the base URL for the bot (port 0 picks a free one)"""
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f'http://{host}:{port}/bot'
+        logger.info(f"Fake Bot API listening on {self.base_url}")
+        return self.base_url
+
+    async def stop(self):
+        """Stop serving"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _chat(self, chat_id: str) -> dict:
+        """Build a chat object, giving @usernames a stable numeric id"""
+        if chat_id.lstrip('-').isdigit():
+            return {'id': int(chat_id), 'type': 'channel', 'title': f'Chat {chat_id}'}
+        if chat_id not in self._chat_ids:
+            self._chat_ids[chat_id] = -1001000000000 - len(self._chat_ids)
+        return {
+            'id': self._chat_ids[chat_id],
+            'type': 'channel',
+            'title': chat_id.lstrip('@'),
+            'username': chat_id.lstrip('@')
+        }
+
+    def _flood_wait(self, chat_id: str, now: float) -> int:
+        """Seconds until a send is allowed, or 0 if it is allowed now"""
+        if self.retry_after_rate and self.random.random() < self.retry_after_rate:
+            return self.retry_after
+
+        chat_sends = self._chat_sends[chat_id]
+        while chat_sends and chat_sends[0] <= now - 60:
+            chat_sends.popleft()
+        while self._global_sends and self._global_sends[0] <= now - 1:
+            self._global_sends.popleft()
+
+        wait = 0.0
+        if len(chat_sends) >= self.per_chat_per_minute:
+            wait = chat_sends[0] + 60 - now
+        if len(self._global_sends) >= self.global_per_second:
+            wait = max(wait, self._global_sends[0] + 1 - now)
+        return math.ceil(wait) if wait > 0 else 0
+
+    @staticmethod
+    def _parse_markdown(text: str, parse_mode: Optional[str]) -> tuple:
+        """Split legacy Markdown into (plain text, entities) like Telegram does"""
+        if parse_mode != 'Markdown':
+            return text, []
+        styles = {'*': 'bold', '_': 'italic', '`': 'code'}
+        plain = []
+        entities = []
+        offset = 0  # In UTF-16 code units
+        open_entity = None
+        escaped = False
+        for char in text:
+            if escaped or char not in styles and char != '\\':
+                escaped = False
+                plain.append(char)
+                offset += len(char.encode('utf-16-le')) // 2
+            elif char == '\\':
+                escaped = True
+            elif open_entity is None:
+                open_entity = {'type': styles[char], 'offset': offset, 'marker': char}
+            elif open_entity['marker'] == char:
+                entities.append({'type': open_entity['type'], 'offset': open_entity['offset'],
+                                 'length': offset - open_entity['offset']})
+                open_entity = None
+            else:
+                plain.append(char)
+                offset += 1
+        return ''.join(plain), entities
+
+    def _set_content(self, message: dict, params: dict, key: str):
+        """Store the text or caption of a send or edit on a message"""
+        if params.get(key):
+            message[key], entities = self._parse_markdown(params[key], params.get('parse_mode'))
+            entity_key = 'entities' if key == 'text' else 'caption_entities'
+            if entities:
+                message[entity_key] = entities
+            else:
+                message.pop(entity_key, None)
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+
+    def _message(self, chat: dict, params: dict, photo: bool = False) -> dict:
+        """Build and remember a message object as returned for a send"""
+        self._message_ids[chat['id']] += 1
+        message_id = self._message_ids[chat['id']]
+        message = {'message_id': message_id, 'date': int(time.time()), 'chat': chat}
+        if photo:
+            message['photo'] = [{
+                'file_id': f'photo-{chat["id"]}-{message_id}',
+                'file_unique_id': f'u{message_id}',
+                'width': 600, 'height': 900
+            }]
+            self._set_content(message, params, 'caption')
+        else:
+            self._set_content(message, params, 'text')
+        self._messages[chat['id'], message_id] = message
+        return message
+
+    def _edit(self, chat: dict, method: str, params: dict) -> web.Response:
+        """Apply an edit to a remembered message"""
+        message = self._messages.get((chat['id'], int(params.get('message_id', 0))))
+        if message is None:
+            return self._error(400, 'Bad Request: message to edit not found')
+
+        edited = dict(message)
+        if method == 'editMessageText':
+            self._set_content(edited, params, 'text')
+        elif method == 'editMessageCaption':
+            self._set_content(edited, params, 'caption')
+        else:
+            edited['reply_markup'] = json.loads(params.get('reply_markup') or '{}')
+            if not edited['reply_markup']:
+                del edited['reply_markup']
+        if edited == message:
+            return self._error(
+                400, 'Bad Request: message is not modified: specified new message content '
+                     'and reply markup are exactly the same as a current content and reply '
+                     'markup of the message'
+            )
+        edited['edit_date'] = int(time.time())
+        self._messages[chat['id'], message['message_id']] = edited
+        return self._ok(edited)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = {}
+        uploads = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, web.FileField):
+                uploads[key] = len(value.file.read())
+            else:
+                params[key] = value
+        self.calls[method] += 1
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method == 'getMe':
+            return self._ok({
+                'id': 1000000001, 'is_bot': True, 'first_name': 'Fake Bot',
+                'username': 'fake_bot', 'can_join_groups': True,
+                'can_read_all_group_messages': False, 'supports_inline_queries': False
+            })
+        if method not in SEND_METHODS and method != 'deleteMessage':
+            return self._error(404, 'Not Found: method not found')
+
+        chat_id = params.get('chat_id', '')
+        if not chat_id:
+            return self._error(400, 'Bad Request: chat_id is empty')
+        if method in self.reject_methods:
+            return self._error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+
+        now = time.monotonic()
+        if method in SEND_METHODS:
+            wait = self._flood_wait(chat_id, now)
+            if wait:
+                self.flood_errors += 1
+                return self._error(429, f'Too Many Requests: retry after {wait}', {'retry_after': wait})
+            self._chat_sends[chat_id].append(now)
+            self._global_sends.append(now)
+            self.sent.append({'method': method, 'chat_id': chat_id, 'at': time.time(),
+                              'params': params, 'uploads': uploads})
+
+        chat = self._chat(chat_id)
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            group_id = f'{chat["id"]}{len(self.sent)}'
+            messages = []
+            for entry in media:
+                message = self._message(chat, entry, photo=entry.get('type') == 'photo')
+                message['media_group_id'] = group_id
+                messages.append(message)
+            return self._ok(messages)
+        if method in ('sendMessage', 'sendPhoto', 'sendDocument'):
+            return self._ok(self._message(chat, params, photo=method == 'sendPhoto'))
+        if method.startswith('edit'):
+            return self._edit(chat, method, params)
+        return self._ok(True)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: Optional[dict] = None) -> web.Response:
+        body = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            body['parameters'] = parameters
+        return web.json_response(body, status=code)
+
+    def get_stats(self) -> dict:
+        """Get call counts, accepted sends and flood errors"""
+        return {
+            'calls': dict(self.calls),
+            'sent': len(self.sent),
+            'flood_errors': self.flood_errors
+        }
+
+
+async def _serve(args):
+    api = FakeBotAPI(
+        latency=args.latency, jitter=args.jitter,
+        per_chat_per_minute=args.per_chat, global_per_second=args.global_rate,
+        retry_after_rate=args.retry_rate, retry_after=args.retry_after
+    )
+    base_url = await api.start(args.host, args.port)
+    print(f"Fake Bot API running. Start the bot with BOT_API_BASE_URL={base_url}")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"Stats: {api.get_stats()}")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.1, help='Seconds per call')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Extra random seconds per call')
+    parser.add_argument('--per-chat', type=int, default=20, help='Sends per chat per minute')
+    parser.add_argument('--global-rate', type=int, default=30, help='Sends per second overall')
+    parser.add_argument('--retry-rate', type=float, default=0.0, help='Share of sends answered with 429')
+    parser.add_argument('--retry-after', type=int, default=5, help='retry_after of injected 429s')
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Download host registry
+Classifies link URLs by hostname: allowed/denied, server name and extractor
+"""
+
+import json
+import logging
+import os
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class HostRule(NamedTuple):
+    name: str
+    allowed: bool = True
+    extractor: Optional[str] = None
+
+
+# Keys with a dot are domain suffixes ("mega.nz" matches "mega.nz" and
+# "www.mega.nz"). Keys without a dot are site labels matched under any
+# TLD, like the Kotlin extractors' "https://hubcloud.*" patterns
+DEFAULT_RULES: Dict[str, HostRule] = {
+    'hdstream4u': HostRule('HDStream4u', extractor='HdStream4u'),
+    'hubstream': HostRule('HubStream', extractor='Hubstream'),
+    'hubdrive': HostRule('HubDrive', extractor='Hubdrive'),
+    'hubcloud': HostRule('HubCloud', extractor='HubCloud'),
+    'hubcdn': HostRule('HubCDN', extractor='HUBCDN'),
+    'pixeldrain': HostRule('PixelDrain', extractor='PixelDrain'),
+    'hblinks': HostRule('HBLinks', extractor='Hblinks'),
+    'buzzserver': HostRule('BuzzServer'),
+    'mega.nz': HostRule('Mega'),
+    'mediafire.com': HostRule('MediaFire'),
+    'drive.google.com': HostRule('Google Drive'),
+}
+
+
+class HostRegistry:
+    def __init__(self, rules: Optional[Dict[str, HostRule]] = None):
+        """Initialize registry with the given rules (defaults if omitted)"""
+        self._suffixes: Dict[str, HostRule] = {}
+        self._labels: Dict[str, HostRule] = {}
+        self._memo: Dict[str, Optional[HostRule]] = {}
+
+        for pattern, rule in (rules if rules is not None else DEFAULT_RULES).items():
+            self.add(pattern, rule)
+
+    def add(self, pattern: str, rule: HostRule):
+        """Add or replace a rule"""
+        pattern = pattern.lower().strip('.')
+        if '.' in pattern:
+            self._suffixes[pattern] = rule
+        else:
+            self._labels[pattern] = rule
+        self._memo.clear()
+
+    def lookup_host(self, host: str) -> Optional[HostRule]:
+        """Get the rule for a hostname, or None if it is unknown"""
+        if host in self._memo:
+            return self._memo[host]
+
+        labels = host.lower().rstrip('.').split('.')
+        rule = None
+
+        # Longest domain suffix wins
+        for i in range(len(labels)):
+            rule = self._suffixes.get('.'.join(labels[i:]))
+            if rule:
+                break
+
+        # Then site labels, ignoring the TLD
+        if rule is None:
+            for label in labels[:-1]:
+                rule = self._labels.get(label)
+                if rule:
+                    break
+
+        if len(self._memo) > 4096:
+            self._memo.clear()
+        self._memo[host] = rule
+        return rule
+
+    def classify(self, url: str) -> Optional[HostRule]:
+        """Get the rule for a link URL, or None if its host is unknown"""
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return None
+        return self.lookup_host(host) if host else None
+
+    def is_allowed(self, url: str) -> bool:
+        """Check if a link URL points at an allowed download host"""
+        rule = self.classify(url)
+        return rule is not None and rule.allowed
+
+
+def load_rules(path: str) -> Dict[str, HostRule]:
+    """
+    Load rules from a JSON file and merge them over the defaults
+    Format: {"pattern": {"name": "...", "allowed": true, "extractor": "..."}}
+    """
+    with open(path, encoding='utf-8') as f:
+        overrides = json.load(f)
+
+    rules = dict(DEFAULT_RULES)
+    for pattern, options in overrides.items():
+        rules[pattern] = HostRule(
+            options.get('name', 'Download'),
+            options.get('allowed', True),
+            options.get('extractor')
+        )
+    return rules
+
+
+def registry_from_env() -> HostRegistry:
+    """Build the registry, applying HOST_RULES_FILE if it is set"""
+    path = os.getenv('HOST_RULES_FILE')
+    if not path:
+        return HostRegistry()
+
+    try:
+        return HostRegistry(load_rules(path))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load host rules from {path}: {e}")
+        return HostRegistry()
@@ -0,0 +1,159 @@
+"""
+Dead-link probing for download buttons
+Checks links concurrently and caches link/host health in the database
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean the file is gone; anything else reachable counts as alive
+# (hosts often answer 403 to HEAD requests from servers). Unreachable hosts and
+# 5xx answers are unknown: the link is kept and probed again next time
+DEAD_STATUSES = {404, 410}
+
+
+class LinkProber:
+    def __init__(self, db, timeout: float = 5.0, total_limit: int = 10,
+                 per_host_limit: int = 2, alive_ttl: int = 6 * 3600,
+                 dead_ttl: int = 3600, host_ttl: int = 600):
+        """
+        Initialize link prober
+        TTLs are in seconds: alive_ttl/dead_ttl for links, host_ttl for
+        hosts found unreachable
+        """
+        self.db = db
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.total_limit = total_limit
+        self.per_host_limit = per_host_limit
+        self.alive_ttl = alive_ttl
+        self.dead_ttl = dead_ttl
+        self.host_ttl = host_ttl
+        self.session = None
+        self._total = asyncio.Semaphore(total_limit)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    async def _get_session(self):
+        """Get or create aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+            )
+        return self.session
+
+    async def close(self):
+        """Close the session"""
+        if self.session:
+            await self.session.close()
+
+    async def check_links(self, links: List[Dict], mode: str = 'drop') -> List[Dict]:
+        """
+        Probe links and return them filtered or reordered
+        mode 'drop' removes dead links, 'reorder' moves them last,
+        'off' returns the links unchanged. Links of unknown health are kept,
+        and if every link is dead the list is returned unchanged
+        """
+        if mode == 'off' or not links:
+            return links
+
+        alive = await self.probe([link['url'] for link in links])
+
+        if mode == 'reorder':
+            # Stable sort keeps the quality order among live links
+            return sorted(links, key=lambda link: alive.get(link['url']) is False)
+
+        kept = [link for link in links if alive.get(link['url']) is not False]
+        if not kept:
+            logger.warning(f"All {len(links)} download links look dead, keeping them")
+            return links
+        if len(kept) < len(links):
+            logger.info(f"Dropped {len(links) - len(kept)} dead download links")
+        return kept
+
+    async def probe(self, urls: List[str]) -> Dict[str, Optional[bool]]:
+        """
+        Get liveness for each URL, None where it is unknown
+        Fresh cached results are reused; only stale or unknown links are probed
+        """
+        now = time.time()
+        cached = self.db.get_link_health(urls)
+        hosts = {url: urlsplit(url).hostname or '' for url in urls}
+        host_health = self.db.get_host_health(sorted(set(hosts.values())))
+
+        results = {}
+        to_probe = []
+        for url in urls:
+            entry = cached.get(url)
+            if entry:
+                ttl = self.alive_ttl if entry['alive'] else self.dead_ttl
+                if now - entry['checked_at'] < ttl:
+                    results[url] = bool(entry['alive'])
+                    continue
+
+            host = host_health.get(hosts[url])
+            if host and not host['alive'] and now - host['checked_at'] < self.host_ttl:
+                # Host was unreachable moments ago, don't wait on it again
+                results[url] = None
+                continue
+
+            to_probe.append(url)
+
+        if to_probe:
+            session = await self._get_session()
+            probed = await asyncio.gather(
+                *(self._probe_one(session, url, hosts[url]) for url in to_probe)
+            )
+
+            link_rows = []
+            host_alive: Dict[str, bool] = {}
+            for url, (is_alive, status) in zip(to_probe, probed):
+                results[url] = is_alive
+                if is_alive is not None:
+                    # Unknown results are not cached, the link is probed again
+                    link_rows.append((url, hosts[url], int(is_alive), status))
+                # A host is up if any of its links answered at all
+                host = hosts[url]
+                host_alive[host] = host_alive.get(host, False) or status is not None
+
+            self.db.save_probe_results(
+                link_rows,
+                [(host, int(up)) for host, up in host_alive.items()]
+            )
+            logger.info(f"Probed {len(to_probe)} links ({len(urls) - len(to_probe)} cached)")
+
+        return results
+
+    async def _probe_one(self, session, url: str, host: str) -> Tuple[Optional[bool], Optional[int]]:
+        """
+        Check one link with HEAD, falling back to a one-byte ranged GET
+        Returns (alive, status); alive is None for 5xx answers and unreachable
+        hosts, and status is None if the host was unreachable
+        """
+        host_limit = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+
+        async with self._total, host_limit:
+            try:
+                async with session.head(url, allow_redirects=True, timeout=self.timeout) as response:
+                    status = response.status
+
+                if status in (405, 501):
+                    async with session.get(
+                        url,
+                        headers={'Range': 'bytes=0-0'},
+                        allow_redirects=True,
+                        timeout=self.timeout
+                    ) as response:
+                        status = response.status
+
+                if status >= 500:
+                    return None, status
+                return status not in DEAD_STATUSES, status
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f"Probe failed for {url}: {e}")
+                return None, None
@@ -0,0 +1,247 @@
+"""
+Offline load test of the scrape -> render -> send pipeline
+Serves a synthetic source site and a fake Bot API (fake_bot_api.py) on
+localhost, runs the bot's posting and outbox jobs against them with
+compressed intervals, and reports posts per minute and latency percentiles.
+Link probing is turned off, since the download links point at real hosts
+
+Usage: python loadtest.py [--duration 120] [--rate 30] [--tick 30] ...
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from aiohttp import web
+
+from fake_bot_api import FakeBotAPI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHANNEL = '@loadtest'
+# 2x3 pixel PNG served as every poster
+POSTER = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAIAAAADCAIAAAA2iEnWAAAADklEQVR4nGNoAAMGFAoAXpUJAdY1eq0AAAAASUVORK5CYII='
+)
+
+
+class FakeSite:
+    def __init__(self, rate: float, backlog: int):
+        """
+        Source site that starts with `backlog` items and publishes a new
+        one every 60 / rate seconds
+        """
+        self.rate = rate
+        self.backlog = backlog
+        self.started = 0.0
+        self.base_url = ''
+        self._runner = None
+
+    @staticmethod
+    def title(index: int) -> str:
+        """Distinct title per item, so duplicate detection doesn't merge them"""
+        digest = hashlib.sha1(str(index).encode()).hexdigest()
+        return f"{digest[:6].title()} {digest[6:12].title()} {digest[12:18].title()} (2024)"
+
+    def published_at(self, index: int) -> float:
+        """Time item `index` appeared on the site"""
+        if index < self.backlog:
+            return self.started
+        return self.started + (index - self.backlog + 1) * 60 / self.rate
+
+    def count(self) -> int:
+        """Number of items published so far"""
+        return self.backlog + int((time.time() - self.started) * self.rate / 60)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/page/{page}/', self._listing)
+        app.router.add_get('/movie-{index}/', self._detail)
+        app.router.add_get('/poster-{index}.png', self._poster)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f'http://{host}:{port}'
+        self.started = time.time()
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _listing(self, request: web.Request) -> web.Response:
+        newest = self.count() - 1
+        items = ''.join(
+            f'<li class="thumb"><figure><img src="{self.base_url}/poster-{i}.png">'
+            f'<a href="{self.base_url}/movie-{i}/">link</a></figure>'
+            f'<figcaption><a href="{self.base_url}/movie-{i}/">'
+            f'<p>{self.title(i)} 1080p WEB-DL</p></a></figcaption></li>'
+            for i in range(newest, max(-1, newest - 10), -1)
+        )
+        html = f'<html><body><ul class="recent-movies">{items}</ul></body></html>'
+        return web.Response(text=html, content_type='text/html')
+
+    async def _detail(self, request: web.Request) -> web.Response:
+        index = int(request.match_info['index'])
+        links = ''.join(
+            f'<h3><a href="https://hubcloud.one/drive/{index}-{quality}">{quality} x264</a></h3>'
+            for quality in ('480p', '720p', '1080p')
+        )
+        html = (
+            f'<html><body><h1 class="page-title">{self.title(index)}</h1>'
+            f'<div class="page-meta"><em>Action</em><em>Drama</em></div>'
+            f'<div class="kno-rdesc"><div class="kno-rdesc">Plot of item {index}.</div></div>'
+            f'<main class="page-body">{links}</main></body></html>'
+        )
+        return web.Response(text=html, content_type='text/html')
+
+    async def _poster(self, request: web.Request) -> web.Response:
+        return web.Response(body=POSTER, content_type='image/png')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(name: str, values: List[float]) -> str:
+    return (
+        f"{name}: p50 {percentile(values, 50):.2f}s, p90 {percentile(values, 90):.2f}s, "
+        f"p99 {percentile(values, 99):.2f}s, max {max(values, default=0):.2f}s (n={len(values)})"
+    )
+
+
+async def run(args):
+    # bot creates its database in the working directory on import
+    os.chdir(tempfile.mkdtemp(prefix='autopost-loadtest-'))
+    sys.path.insert(0, HERE)
+    import bot
+    from telegram.ext import Application
+    from rate_limiter import RateLimiter
+    logging.getLogger().setLevel(args.log_level)
+
+    site = FakeSite(args.rate, args.backlog)
+    api = FakeBotAPI(
+        latency=args.latency, jitter=args.jitter,
+        per_chat_per_minute=args.per_chat, global_per_second=args.global_rate,
+        retry_after_rate=args.retry_rate, retry_after=args.retry_after, seed=1
+    )
+    bot.scraper.main_url = await site.start()
+    await api.start()
+
+    bot.db.set_setting('channel', CHANNEL)
+    bot.db.set_setting('probe_mode', 'off')
+    if args.posts_per_run:
+        bot.POSTS_PER_RUN = args.posts_per_run
+    bot.send_limiter = RateLimiter(args.send_interval)
+
+    application = Application.builder().token('123456:LOADTEST').base_url(api.base_url).build()
+    await application.initialize()
+
+    print(
+        f"Load test: {args.duration:.0f}s, {args.rate:g} new items/min, backlog {args.backlog}, "
+        f"scrape every {args.tick:g}s, outbox every {args.drain:g}s, "
+        f"{bot.POSTS_PER_RUN} posts/run, {args.send_interval:g}s between sends"
+    )
+
+    run_times: List[float] = []
+    errors: Dict[str, int] = {}
+    deadline = time.monotonic() + args.duration
+
+    async def every(seconds: float, name: str, job):
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                await job()
+            except Exception as e:
+                errors[name] = errors.get(name, 0) + 1
+                logging.getLogger(__name__).warning(f"{name} failed: {e}")
+            if name == 'post_to_channel':
+                run_times.append(time.monotonic() - start)
+            await asyncio.sleep(max(0.0, seconds - (time.monotonic() - start)))
+
+    async def scrape_and_send():
+        # Same as an adaptive run: the listing cache would hide new items
+        bot.cache.expire('latest_content', namespace='listing')
+        await bot.post_to_channel(application, CHANNEL)
+
+    started = time.time()
+    await asyncio.gather(
+        every(args.tick, 'post_to_channel', scrape_and_send),
+        every(args.drain, 'drain_outbox', lambda: bot.drain_outbox(application))
+    )
+    elapsed = time.time() - started
+
+    # Publish -> send latency, matched by the item URL in each post's keyboard,
+    # or by title for album photos
+    titles = {site.title(i): i for i in range(site.count())}
+    latencies = []
+    albums = 0
+    for send in api.sent:
+        if send['method'] == 'sendMediaGroup':
+            albums += 1
+            for media in json.loads(send['params'].get('media', '[]')):
+                match = re.search(r'\*(.+)\*', media.get('caption', ''))
+                if match and match.group(1) in titles:
+                    latencies.append(send['at'] - site.published_at(titles[match.group(1)]))
+            continue
+        match = re.search(r'/movie-(\d+)/', send['params'].get('reply_markup', ''))
+        if match and send['method'] in ('sendPhoto', 'sendMessage'):
+            latencies.append(send['at'] - site.published_at(int(match.group(1))))
+
+    published = site.count()
+    pending = bot.db.get_outbox_counts().get('pending', 0)
+    stats = api.get_stats()
+    print(f"Published {published} items, posted {len(latencies)} ({albums} albums), {pending} still queued")
+    print(f"Throughput: {len(latencies) / elapsed * 60:.1f} posts/min")
+    print(summarize("Publish -> post", latencies))
+    print(summarize("post_to_channel run", run_times))
+    print(f"Bot API calls: {stats['calls']}, 429 responses: {stats['flood_errors']}")
+    print(f"Photos uploaded as bytes: {sum(1 for send in api.sent if send['uploads'])}")
+    if errors:
+        print(f"Job errors: {errors}")
+
+    await application.shutdown()
+    await bot.scraper.close()
+    await bot.posters.close()
+    bot.scraper.parser.shutdown()
+    await api.stop()
+    await site.stop()
+    bot.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=120, help='Seconds to run')
+    parser.add_argument('--rate', type=float, default=30, help='New items per minute on the site')
+    parser.add_argument('--backlog', type=int, default=10, help='Items on the site at the start')
+    parser.add_argument('--tick', type=float, default=30, help='Seconds between posting runs')
+    parser.add_argument('--drain', type=float, default=12, help='Seconds between outbox runs')
+    parser.add_argument('--posts-per-run', type=int, default=0, help='Sends per outbox run (default: bot setting)')
+    parser.add_argument('--send-interval', type=float, default=2, help='Seconds between sends')
+    parser.add_argument('--latency', type=float, default=0.1, help='Bot API seconds per call')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Extra random Bot API seconds per call')
+    parser.add_argument('--per-chat', type=int, default=20, help='Bot API sends per chat per minute')
+    parser.add_argument('--global-rate', type=int, default=30, help='Bot API sends per second overall')
+    parser.add_argument('--retry-rate', type=float, default=0.0, help='Share of sends answered with 429')
+    parser.add_argument('--retry-after', type=int, default=5, help='retry_after of injected 429s')
+    parser.add_argument('--log-level', default='WARNING')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+HTML parsing for the HDhub4u scraper
+Pure functions over raw page bytes so they can run in a worker process
+"""
+
+import asyncio
+import codecs
+import logging
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from html import escape
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup
+from host_registry import registry_from_env
+
+logger = logging.getLogger(__name__)
+
+# (title, url, poster_url, quality)
+ItemRecord = Tuple[str, str, str, str]
+# (url, quality, text, server)
+LinkRecord = Tuple[str, str, str, str]
+# (links, metadata)
+DetailRecord = Tuple[List[LinkRecord], Dict[str, Any]]
+
+LINK_SELECTOR = 'h3 a, h4 a, h5 a, .page-body > div a, .entry-content a'
+
+# Download hosts from the HDhub4u ecosystem (loaded in every worker process)
+HOSTS = registry_from_env()
+
+# Sort order for links (4K > 1080p > 720p > 480p)
+QUALITY_ORDER = {'4K': 0, '2160p': 0, '1080p': 1, '720p': 2, '480p': 3, 'Download': 4}
+
+
+def clean_title(title: str) -> str:
+    """Clean title from quality tags"""
+    # Remove quality indicators
+    cleaned = re.sub(r'\b(480p|720p|1080p|2160p|4K|HEVC|x264|x265|HDRip|WEB-DL|BluRay)\b', '', title, flags=re.IGNORECASE)
+    # Remove extra spaces
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    return cleaned
+
+
+def get_quality(text: str) -> str:
+    """Extract quality from text"""
+    patterns = [
+        (r'\b(4k|uhd|2160p)\b', '4K UHD'),
+        (r'\b(1080p)\b', '1080p FHD'),
+        (r'\b(720p)\b', '720p HD'),
+        (r'\b(480p)\b', '480p'),
+        (r'\b(bluray)\b', 'BluRay'),
+        (r'\b(web-?dl|webrip)\b', 'WEB-DL'),
+    ]
+
+    for pattern, quality in patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return quality
+
+    return 'HD'
+
+
+def extract_quality_from_text(text: str) -> str:
+    """
+    Extract quality information from link text
+    Enhanced with better pattern matching
+    """
+    text_upper = text.upper()
+
+    # Check for specific quality patterns (order matters - check specific first)
+    if '2160' in text or '4K' in text_upper or 'UHD' in text_upper:
+        return '4K'
+    elif '1440' in text or 'QHD' in text_upper:
+        return '1440p'
+    elif '1080' in text or 'FHD' in text_upper:
+        return '1080p'
+    elif '720' in text:
+        return '720p'
+    elif '480' in text or 'SD' in text_upper:
+        return '480p'
+    elif '360' in text:
+        return '360p'
+    elif 'HD' in text_upper and '1080' not in text and '720' not in text:
+        return '720p'  # Generic HD defaults to 720p
+    else:
+        return 'Download'
+
+
+def extract_server_name(url: str) -> str:
+    """Extract server name from URL"""
+    rule = HOSTS.classify(url)
+    return rule.name if rule else 'Download'
+
+
+def parse_item(item) -> Optional[ItemRecord]:
+    """Parse a single `li.thumb` element into an item record"""
+    try:
+        # Extract title
+        title_elem = item.select_one('figcaption:nth-child(2) > a:nth-child(1) > p:nth-child(1)')
+        if not title_elem:
+            return None
+
+        title_text = title_elem.get_text(strip=True)
+        title = clean_title(title_text)
+
+        # Extract URL
+        url_elem = item.select_one('figure:nth-child(1) > a:nth-child(2)')
+        if not url_elem:
+            return None
+        url = url_elem.get('href', '')
+
+        # Extract poster
+        poster_elem = item.select_one('figure:nth-child(1) > img:nth-child(1)')
+        poster_url = poster_elem.get('src', '') if poster_elem else ''
+
+        # Extract quality
+        quality = get_quality(title_text)
+
+        return (title, url, poster_url, quality)
+
+    except Exception as e:
+        logger.error(f"Error parsing item: {e}")
+        return None
+
+
+def parse_listing(html: bytes, limit: int = 10) -> List[ItemRecord]:
+    """Parse a listing page into at most `limit` item records"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    records = []
+    for item in soup.select('.recent-movies > li.thumb')[:limit]:
+        record = parse_item(item)
+        if record:
+            records.append(record)
+    return records
+
+
+# Elements that never get an end tag
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'source', 'track', 'wbr'
+}
+
+
+class _ListingHTMLParser(HTMLParser):
+    def __init__(self, on_item: Callable[[str], None]):
+        """Collect the HTML of each `.recent-movies > li.thumb` element"""
+        super().__init__(convert_charrefs=True)
+        self.on_item = on_item
+        self._stack: List[Tuple[str, bool]] = []  # (tag, is listing container)
+        self._fragment: Optional[List[str]] = None
+        self._item_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+
+        if self._fragment is not None:
+            self._fragment.append(self.get_starttag_text())
+        elif tag == 'li' and 'thumb' in classes and self._stack and self._stack[-1][1]:
+            self._fragment = [self.get_starttag_text()]
+            self._item_depth = len(self._stack)
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, 'recent-movies' in classes))
+
+    def handle_startendtag(self, tag, attrs):
+        if self._fragment is not None:
+            self._fragment.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._fragment is not None:
+            self._fragment.append(f'</{tag}>')
+
+        # Pop up to the matching element; unmatched end tags are ignored
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth][0] == tag:
+                del self._stack[depth:]
+                break
+
+        if self._fragment is not None and len(self._stack) <= self._item_depth:
+            fragment, self._fragment = ''.join(self._fragment), None
+            self.on_item(fragment)
+
+    def handle_data(self, data):
+        if self._fragment is not None:
+            self._fragment.append(escape(data))
+
+
+class ListingStreamParser:
+    def __init__(self, limit: int = 10, stop_at: Optional[Callable[[str], bool]] = None,
+                 encoding: str = 'utf-8', stop_after: int = 3):
+        """
+        Incremental listing parser fed with response chunks
+        Stops after `limit` items, or after `stop_after` items in a row whose
+        URL makes `stop_at` return True (e.g. ones that were already posted).
+        A single old post bumped up the listing doesn't hide new items below
+        it. Matching items are kept in the records; `truncated` tells if
+        stop_at ended the page early
+        """
+        self.limit = limit
+        self.stop_at = stop_at
+        self.stop_after = stop_after
+        self.records: List[ItemRecord] = []
+        self.done = False
+        self.truncated = False
+        self._matched = 0  # Consecutive items matching stop_at
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._parser = _ListingHTMLParser(self._on_item)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feed a chunk of the page; returns True once enough items were read"""
+        if not self.done:
+            self._parser.feed(self._decoder.decode(chunk))
+        return self.done
+
+    def close(self) -> List[ItemRecord]:
+        """Finish parsing and return the item records"""
+        if not self.done:
+            self._parser.feed(self._decoder.decode(b'', final=True))
+            self._parser.close()
+        return self.records
+
+    def _on_item(self, fragment: str):
+        """Turn a completed item element into a record"""
+        if self.done:
+            return
+
+        # Reuse the BeautifulSoup selectors on the small item fragment
+        record = parse_item(BeautifulSoup(fragment, 'html.parser').li)
+        if not record:
+            return
+
+        self.records.append(record)
+        if len(self.records) >= self.limit:
+            self.done = True
+            return
+
+        if self.stop_at and self.stop_at(record[1]):
+            self._matched += 1
+            if self._matched >= self.stop_after:
+                self.done = self.truncated = True
+        else:
+            self._matched = 0
+
+
+def _extract_links(soup) -> List[LinkRecord]:
+    """Extract download link records from a detail page, best quality first"""
+    links = []
+    seen_urls = set()  # Prevent duplicates
+
+    for elem in soup.select(LINK_SELECTOR):
+        link_url = elem.get('href', '')
+
+        # Skip if already processed
+        if link_url in seen_urls:
+            continue
+
+        # Filter for valid download links (from HDhub4u ecosystem)
+        rule = HOSTS.classify(link_url)
+        if rule and rule.allowed:
+            link_text = elem.get_text(strip=True)
+            links.append((
+                link_url,
+                extract_quality_from_text(link_text),
+                link_text,
+                rule.name
+            ))
+            seen_urls.add(link_url)
+
+    links.sort(key=lambda link: QUALITY_ORDER.get(link[1], 5))
+    return links
+
+
+def _extract_metadata(soup) -> Dict[str, Any]:
+    """
+    Extract post metadata from a detail page
+    Same sources as the Kotlin provider's load()
+    """
+    def attr(selector: str, name: str) -> str:
+        elem = soup.select_one(selector)
+        return (elem.get(name) or '').strip() if elem else ''
+
+    plot_elem = soup.select_one('.kno-rdesc .kno-rdesc')
+    title_elem = soup.select_one('h1.page-title')
+    title_text = title_elem.get_text(' ', strip=True) if title_elem else ''
+
+    # Tags that are only a quality or year are not genres
+    tags = [elem.get_text(strip=True) for elem in soup.select('.page-meta em')]
+    genre = [
+        tag for tag in tags
+        if tag and not re.fullmatch(r'(19|20)\d{2}|\d{3,4}p|4K', tag, re.IGNORECASE)
+    ]
+
+    year_match = re.search(r'\b(19|20)\d{2}\b', title_text)
+    year = year_match.group(0) if year_match else next(
+        (tag for tag in tags if re.fullmatch(r'(19|20)\d{2}', tag)), ''
+    )
+
+    imdb_elem = soup.select_one("div span a[href*='imdb.com']")
+    rating = ''
+    if imdb_elem:
+        context = imdb_elem.parent.get_text(' ', strip=True)
+        rating_match = re.search(r'(\d{1,2}(?:\.\d)?)\s*/\s*10', context)
+        if rating_match:
+            rating = f"{rating_match.group(1)}/10"
+
+    return {
+        'year': year,
+        'rating': rating,
+        'genre': genre,
+        'plot': plot_elem.get_text(' ', strip=True) if plot_elem else '',
+        'image': attr('meta[property="og:image"]', 'content'),
+        'poster': attr('main.page-body img.aligncenter', 'src'),
+        'imdb_url': imdb_elem.get('href', '') if imdb_elem else '',
+        'tmdb_url': attr("div span a[href*='themoviedb.org']", 'href'),
+    }
+
+
+def parse_detail(html: bytes) -> DetailRecord:
+    """Parse a detail page once into (link records, metadata)"""
+    soup = BeautifulSoup(html, 'html.parser')
+    return _extract_links(soup), _extract_metadata(soup)
+
+
+def parse_details_batch(pages: List[bytes]) -> List[DetailRecord]:
+    """Parse several detail pages in one task"""
+    return [parse_detail(html) for html in pages]
+
+
+class ParseExecutor:
+    def __init__(self, mode: str = 'process', max_workers: Optional[int] = None):
+        """
+        Initialize parsing executor
+        mode is 'process', 'thread' or 'inline' (parse on the event loop)
+        """
+        if mode not in ('process', 'thread', 'inline'):
+            raise ValueError(f"Unknown parser executor mode: {mode}")
+
+        self.mode = mode
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        """Get or create the underlying pool"""
+        if self._executor is None and self.mode == 'process':
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError) as e:
+                # Some hosts (e.g. serverless) can't create process pools
+                logger.warning(f"Process pool unavailable ({e}), parsing in threads")
+                self.mode = 'thread'
+
+        if self._executor is None and self.mode == 'thread':
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='parser'
+            )
+
+        return self._executor
+
+    async def run(self, func, *args):
+        """Run a parsing function off the event loop and return its result"""
+        executor = self._get_executor()
+        if executor is None:
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, func, *args)
+
+    def shutdown(self):
+        """Shut down the worker pool"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def executor_from_env() -> ParseExecutor:
+    """Build the parsing executor from PARSER_EXECUTOR / PARSER_WORKERS"""
+    workers = os.getenv('PARSER_WORKERS')
+    return ParseExecutor(
+        os.getenv('PARSER_EXECUTOR', 'process'),
+        int(workers) if workers else None
+    )
@@ -0,0 +1,279 @@
+"""
+Poster images for posts
+Fetches posters, fits them to Telegram's photo limits and keeps them in a
+size-bounded on-disk cache, so posts upload bytes instead of asking
+Telegram to fetch slow or hotlink-protected URLs
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limits for photos sent with sendPhoto
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+MAX_DIMENSION_SUM = 10000
+MAX_ASPECT_RATIO = 20
+
+# Formats uploaded unchanged when Pillow is not installed
+PASSTHROUGH_FORMATS = {'jpeg', 'png', 'webp'}
+
+
+def image_size(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """Read (format, width, height) from a JPEG, PNG, GIF or WebP header"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3fff, height & 0x3fff
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return 'webp', (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X':
+            width = int.from_bytes(data[24:27], 'little') + 1
+            height = int.from_bytes(data[27:30], 'little') + 1
+            return 'webp', width, height
+        return None
+
+    if data[:2] == b'\xff\xd8':
+        # Walk the segments up to the first start-of-frame marker
+        pos = 2
+        while pos + 9 <= len(data):
+            if data[pos] != 0xff:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xff:
+                pos += 1
+                continue
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return 'jpeg', width, height
+            pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+    return None
+
+
+def fits_telegram(width: int, height: int, size: int) -> bool:
+    """Check a photo against Telegram's size, dimension and aspect ratio limits"""
+    if not width or not height or size > MAX_PHOTO_BYTES:
+        return False
+    if width + height > MAX_DIMENSION_SUM:
+        return False
+    return max(width, height) / min(width, height) <= MAX_ASPECT_RATIO
+
+
+def fit_image(data: bytes, max_side: int = 1280, quality: int = 85) -> Optional[bytes]:
+    """
+    Make an image uploadable as a Telegram photo
+    With Pillow it is downscaled to max_side and recompressed as JPEG.
+    Without it, JPEG/PNG/WebP images already within the limits are used
+    as they are. Returns None if the image can't be used
+    """
+    header = image_size(data)
+    if header is None:
+        return None
+    fmt, width, height = header
+    if max(width, height) / max(1, min(width, height)) > MAX_ASPECT_RATIO:
+        return None
+
+    if Image is None:
+        if fmt in PASSTHROUGH_FORMATS and fits_telegram(width, height, len(data)):
+            return data
+        return None
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((max_side, max_side))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=quality, optimize=True)
+    except Exception as e:
+        logger.debug(f"Could not recompress image: {e}")
+        return None
+
+    result = out.getvalue()
+    return result if len(result) <= MAX_PHOTO_BYTES else None
+
+
+class PosterCache:
+    def __init__(self, directory: str = 'poster_cache', max_bytes: int = 200 * 1024 * 1024,
+                 max_side: int = 1280, quality: int = 85, timeout: float = 15.0,
+                 max_download: int = 20 * 1024 * 1024, headers: Optional[Dict[str, str]] = None):
+        """
+        Initialize poster cache
+        Images are stored under directory, keyed by URL hash; the least
+        recently used files are deleted once they take more than max_bytes.
+        Downloads larger than max_download bytes are abandoned
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.quality = quality
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_download = max_download
+        self.headers = headers or {}
+        self.session = None
+        self._total: Optional[int] = None  # Bytes on disk, counted on first write
+        self._fetching: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Cache key (file name) for a poster URL"""
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.img")
+
+    async def _get_session(self):
+        """Get or create aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(headers=self.headers, timeout=self.timeout)
+        return self.session
+
+    async def close(self):
+        """Close the session"""
+        if self.session:
+            await self.session.close()
+
+    def load(self, key: str) -> Optional[bytes]:
+        """Read a cached poster, marking it as recently used"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """
+        Make sure a poster is cached and return its key
+        Returns None if it can't be downloaded or made uploadable;
+        concurrent calls for one URL share a download
+        """
+        if not url:
+            return None
+
+        key = self.key(url)
+        if os.path.exists(self._path(key)):
+            self.hits += 1
+            return key
+
+        task = self._fetching.get(key)
+        if task is None:
+            task = self._fetching[key] = asyncio.create_task(self._download(url, key))
+            task.add_done_callback(lambda _: self._fetching.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, url: str, key: str) -> Optional[str]:
+        """Download, fit and store one poster"""
+        self.misses += 1
+        try:
+            session = await self._get_session()
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise ValueError(f"HTTP {response.status}")
+                if (response.content_length or 0) > self.max_download:
+                    raise ValueError(f"{response.content_length} bytes is too large")
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    data.extend(chunk)
+                    if len(data) > self.max_download:
+                        raise ValueError("too large")
+
+            # Recompressing is CPU work; keep it off the event loop
+            image = await asyncio.to_thread(fit_image, bytes(data), self.max_side, self.quality)
+            if image is None:
+                raise ValueError("not a usable image")
+            await asyncio.to_thread(self._store, key, image)
+            return key
+
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Poster unavailable ({e}): {url}")
+            return None
+
+    def _store(self, key: str, image: bytes):
+        """Write a poster atomically and prune the cache"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._files())
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+        self._total += len(image)
+
+        if self._total > self.max_bytes:
+            self.prune()
+
+    def _files(self):
+        """List (path, size, mtime) of cached posters"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return []
+        files = []
+        for entry in entries:
+            if entry.name.endswith('.img'):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def prune(self) -> int:
+        """Delete least recently used posters until under max_bytes; returns the count"""
+        files = sorted(self._files(), key=lambda file: file[2])
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._total = total
+        if removed:
+            logger.info(f"Pruned {removed} cached posters")
+        return removed
+
+    def get_stats(self) -> dict:
+        """Get disk usage and fetch counters"""
+        files = self._files()
+        return {
+            'files': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures,
+            'recompress': Image is not None
+        }
@@ -0,0 +1,114 @@
+"""
+On-demand profiling of a single posting run
+Combines a CPU profile (pyinstrument if installed, cProfile otherwise)
+with a tracemalloc diff of allocations made during the run
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # Optional dependency
+    SamplingProfiler = None
+
+logger = logging.getLogger(__name__)
+
+
+class RunProfiler:
+    def __init__(self, top_functions: int = 30, top_allocations: int = 20,
+                 trace_frames: int = 10):
+        """Initialize a disarmed profiler"""
+        self.top_functions = top_functions
+        self.top_allocations = top_allocations
+        self.trace_frames = trace_frames
+        self.chat_id: Optional[int] = None  # Where to send the report; None = disarmed
+
+    @property
+    def armed(self) -> bool:
+        """Check if the next run should be profiled"""
+        return self.chat_id is not None
+
+    def arm(self, chat_id: int):
+        """Profile the next run and report to the given chat"""
+        self.chat_id = chat_id
+
+    def disarm(self) -> Optional[int]:
+        """Cancel profiling; returns the chat that was waiting for a report"""
+        chat_id, self.chat_id = self.chat_id, None
+        return chat_id
+
+    async def run(self, label: str,
+                  func: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[Exception], str]:
+        """
+        Await func() under the profilers
+        Returns (result, error, report); an exception from func is returned
+        as error so the report is produced either way
+        """
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.trace_frames)
+        before = tracemalloc.take_snapshot()
+
+        if SamplingProfiler is not None:
+            profiler = SamplingProfiler(async_mode='enabled')
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = await func()
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - start
+
+        if SamplingProfiler is not None:
+            profiler.stop()
+        else:
+            profiler.disable()
+
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+        report = self._format_report(label, elapsed, error, profiler, before, after, peak)
+        logger.info(f"Profiled {label}: {elapsed:.3f}s")
+        return result, error, report
+
+    def _format_report(self, label: str, elapsed: float, error: Optional[Exception],
+                       profiler, before, after, peak: int) -> str:
+        """Build the plain-text report"""
+        out = io.StringIO()
+        out.write(f"Profile of {label} at {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+        out.write(f"Wall time: {elapsed:.3f}s\n")
+        out.write(f"Outcome: {'error: ' + repr(error) if error else 'ok'}\n")
+        out.write("Note: everything on the event loop during the run is included\n\n")
+
+        if SamplingProfiler is not None:
+            out.write("== CPU (pyinstrument) ==\n")
+            out.write(profiler.output_text(unicode=False, color=False))
+        else:
+            out.write(f"== CPU (cProfile, top {self.top_functions} by cumulative time) ==\n")
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(self.top_functions)
+            out.write(f"== CPU (cProfile, top {self.top_functions} by own time) ==\n")
+            stats.sort_stats('tottime').print_stats(self.top_functions)
+
+        out.write(f"\n== Memory (peak traced {peak / 1024:.1f} KB) ==\n")
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        out.write(f"Top {self.top_allocations} allocation sites still held after the run:\n")
+        for stat in diff[:self.top_allocations]:
+            out.write(f"{stat}\n")
+
+        return out.getvalue()
@@ -0,0 +1,28 @@
+"""
+Async rate limiter for outgoing API calls
+Spaces calls out so each pipeline stage can be throttled on its own
+"""
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    def __init__(self, interval: float):
+        """Allow at most one call every `interval` seconds"""
+        self.interval = interval
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def wait(self):
+        """Wait until the next call is allowed"""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = max(now, self._next_at) + self.interval
+    
+    def pause(self, seconds: float):
+        """Hold back all calls for the given number of seconds (e.g. after a 429)"""
+        self._next_at = max(self._next_at, time.monotonic() + seconds)
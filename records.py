@@ -0,0 +1,81 @@
+"""
+Compact records for scraped content
+Listing items and download links stay cached for hours and are compared
+on every update check. Frozen slotted dataclasses keep them small and
+hashable, and they are safe to share between callers. They still read
+like the dicts they replace: record['url'], record.get('quality') and
+dict(record) all work
+"""
+
+import sys
+import time
+from dataclasses import dataclass, field, fields
+from typing import Any, Tuple
+
+
+def intern_label(value: str) -> str:
+    """Share one copy of a short, often repeated label (quality, server name)"""
+    return sys.intern(value) if value else value
+
+
+class _DictView:
+    __slots__ = ()
+    _keys: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a field like dict.get"""
+        return getattr(self, key) if key in self._keys else default
+
+    def keys(self) -> Tuple[str, ...]:
+        """Field names, so dict(record) builds the dict view"""
+        return self._keys
+
+    def as_dict(self) -> dict:
+        """Get a mutable dict copy of the record"""
+        return {key: getattr(self, key) for key in self._keys}
+
+
+@dataclass(frozen=True, slots=True)
+class ContentItem(_DictView):
+    title: str
+    url: str
+    poster_url: str
+    quality: str
+    scraped_at: float = field(default_factory=time.time, compare=False)
+
+    @classmethod
+    def from_record(cls, record: Tuple[str, str, str, str]) -> 'ContentItem':
+        """Build an item from a parsed (title, url, poster_url, quality) record"""
+        title, url, poster_url, quality = record
+        return cls(title, url, poster_url, intern_label(quality))
+
+
+@dataclass(frozen=True, slots=True)
+class DownloadLink(_DictView):
+    url: str
+    quality: str
+    text: str
+    server: str
+
+    @classmethod
+    def from_record(cls, record: Tuple[str, str, str, str]) -> 'DownloadLink':
+        """Build a link from a parsed (url, quality, text, server) record"""
+        url, quality, text, server = record
+        return cls(url, intern_label(quality), text, intern_label(server))
+
+
+ContentItem._keys = tuple(f.name for f in fields(ContentItem))
+DownloadLink._keys = tuple(f.name for f in fields(DownloadLink))
+
+
+def links_hash(links) -> int:
+    """Fingerprint a list of links for change detection (stable within a process)"""
+    return hash(tuple(links))
@@ -5,15 +5,22 @@ Adapted from the Kotlin provider code to Python
 
 import asyncio
 import aiohttp
+import os
 import re
 import logging
-from typing import List, Dict, Optional
-from bs4 import BeautifulSoup
-from datetime import datetime
+from typing import Callable, List, Dict, Optional, Tuple
+from urllib.parse import quote_plus
+import parsing
+from circuit_breaker import BreakerRegistry, CircuitOpenError
+from records import ContentItem, DownloadLink, links_hash
 
 logger = logging.getLogger(__name__)
 
 
+class ScrapeError(Exception):
+    """Raised when a page could not be fetched"""
+
+
 class HDhub4uScraper:
     def __init__(self):
         self.main_url = "https://hdhub4u.rehab"
@@ -22,6 +29,11 @@ class HDhub4uScraper:
             'Cookie': 'xla=s4t'
         }
         self.session = None
+        self.parser = parsing.executor_from_env()
+        self.stream_listing = os.getenv('STREAM_LISTING', 'true').lower() != 'false'
+        self.content_stale = False  # Last listing came from an expired cache entry
+        self.breakers = BreakerRegistry()
+        self.timeout = aiohttp.ClientTimeout(total=30, sock_connect=10)
     
     async def _get_session(self):
         """Get or create aiohttp session"""
@@ -29,264 +41,371 @@ class HDhub4uScraper:
             self.session = aiohttp.ClientSession(headers=self.headers)
         return self.session
     
+    def is_available(self, url: Optional[str] = None) -> bool:
+        """Check if requests to the host of url (default: the main site) are let through"""
+        return self.breakers.for_url(url or self.main_url).allows_calls()
+    
     async def close(self):
-        """Close the session"""
+        """Close the session and parser pool"""
         if self.session:
             await self.session.close()
+        self.parser.shutdown()
     
-    async def get_latest_content(self, cache_manager) -> List[Dict]:
+    def _check_status(self, url: str, status: int) -> bool:
         """
-        Get latest content from HDhub4u
-        Uses cache to avoid excessive scraping
+        Check a response status; True means the body can be used
+        Server errors and rate limiting raise so the host's circuit breaker
+        counts them; other non-200 statuses are reported as unusable
+        """
+        if status == 200:
+            return True
+        if status >= 500 or status == 429:
+            raise ScrapeError(f"Failed to fetch {url}: {status}")
+        logger.error(f"Failed to fetch {url}: {status}")
+        return False
+    
+    async def _fetch_bytes(self, url: str) -> Optional[bytes]:
+        """
+        Fetch a page as raw bytes, or None on a client error response
+        Raises CircuitOpenError without a request while the host is failing
         """
-        # Check cache first
-        cached = cache_manager.get('latest_content')
-        if cached:
-            logger.info("Returning cached content")
-            return cached
+        session = await self._get_session()
         
-        try:
-            session = await self._get_session()
-            
-            # Fetch main page
-            async with session.get(
-                f"{self.main_url}/page/1/",
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                if response.status != 200:
-                    logger.error(f"Failed to fetch: {response.status}")
-                    return []
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Parse content items
-                content_items = []
-                items = soup.select('.recent-movies > li.thumb')
-                
-                for item in items[:10]:  # Limit to 10 items
-                    parsed_item = self._parse_item(item)
-                    if parsed_item:
-                        content_items.append(parsed_item)
-                
-                # Cache the results for 5 minutes
-                cache_manager.set('latest_content', content_items, ttl=300)
-                
-                logger.info(f"Scraped {len(content_items)} items")
-                return content_items
+        with self.breakers.for_url(url).call():
+            async with session.get(url, timeout=self.timeout) as response:
+                if not self._check_status(url, response.status):
+                    return None
+                return await response.read()
+    
+    async def _stream_listing(self, url: str, limit: int,
+                              stop_at: Optional[Callable[[str], bool]] = None
+                              ) -> Optional[Tuple[List, bool]]:
+        """
+        Fetch and parse a listing page incrementally
+        Stops reading the body once enough items are extracted. Returns
+        (records, truncated), truncated meaning stop_at ended the page early
+        """
+        session = await self._get_session()
+        
+        with self.breakers.for_url(url).call():
+            async with session.get(url, timeout=self.timeout) as response:
+                if not self._check_status(url, response.status):
+                    return None
                 
+                parser = parsing.ListingStreamParser(limit, stop_at, response.charset or 'utf-8')
+                async for chunk in response.content.iter_chunked(16384):
+                    if parser.feed(chunk):
+                        # Drop the rest of the page (sidebar, scripts)
+                        response.close()
+                        break
+            
+            return parser.close(), parser.truncated
+    
+    async def get_latest_content(self, cache_manager,
+                                 stop_at: Optional[Callable[[str], bool]] = None) -> List[ContentItem]:
+        """
+        Get latest content from HDhub4u
+        Uses cache to avoid excessive scraping. In streaming mode the
+        listing is read only until a few URLs in a row make `stop_at`
+        return True. The cache holds (items, complete), so a shortened
+        listing is stored like a full one; its records still include the
+        posted items it stopped at
+        """
+        try:
+            (content_items, _), stale = await cache_manager.get_or_refresh(
+                'latest_content',
+                lambda: self._fetch_latest_content(stop_at),
+                namespace='listing'
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping listing fetch: {e}")
+            return []
         except Exception as e:
             logger.error(f"Error scraping content: {e}")
             return []
+        
+        if stale:
+            logger.warning("Listing fetch failed, using stale cached content")
+        self.content_stale = stale
+        return content_items
     
-    def _parse_item(self, item) -> Optional[Dict]:
-        """Parse a single content item from HTML"""
-        try:
-            # Extract title
-            title_elem = item.select_one('figcaption:nth-child(2) > a:nth-child(1) > p:nth-child(1)')
-            if not title_elem:
-                return None
-            
-            title_text = title_elem.get_text(strip=True)
-            title = self._clean_title(title_text)
-            
-            # Extract URL
-            url_elem = item.select_one('figure:nth-child(1) > a:nth-child(2)')
-            if not url_elem:
-                return None
-            url = url_elem.get('href', '')
-            
-            # Extract poster
-            poster_elem = item.select_one('figure:nth-child(1) > img:nth-child(1)')
-            poster_url = poster_elem.get('src', '') if poster_elem else ''
-            
-            # Extract quality
-            quality = self._get_quality(title_text)
-            
-            return {
-                'title': title,
-                'url': url,
-                'poster_url': poster_url,
-                'quality': quality,
-                'scraped_at': datetime.now().isoformat()
-            }
+    async def _fetch_latest_content(self, stop_at: Optional[Callable[[str], bool]] = None
+                                    ) -> Tuple[List[ContentItem], bool]:
+        """
+        Fetch and parse the listing page; raises on failure
+        Returns (items, complete); complete is False if stop_at shortened the listing
+        """
+        listing_url = f"{self.main_url}/page/1/"
+        truncated = False
+        
+        if self.stream_listing:
+            # Parse while downloading, stop early (limit to 10 items)
+            result = await self._stream_listing(listing_url, 10, stop_at)
+            if result is None:
+                raise ScrapeError(f"Failed to fetch {listing_url}")
+            records, truncated = result
+        else:
+            # Fetch main page
+            html = await self._fetch_bytes(listing_url)
+            if html is None:
+                raise ScrapeError(f"Failed to fetch {listing_url}")
             
+            # Parse content items off the event loop (limit to 10 items)
+            records = await self.parser.run(parsing.parse_listing, html, 10)
+        
+        content_items = [self._item_from_record(record) for record in records]
+        if truncated:
+            logger.info(f"Scraped {len(content_items)} items, stopped at already posted ones")
+        else:
+            logger.info(f"Scraped {len(content_items)} items")
+        return content_items, not truncated
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Normalize a search query so equivalent searches share a cache entry"""
+        return ' '.join(query.lower().split())
+    
+    async def search(self, query: str, cache_manager, page: int = 1) -> List[ContentItem]:
+        """
+        Search the site, like the Kotlin provider's search(query, page)
+        Result pages are cached per normalized query, and the next page is
+        prefetched in the background while the caller shows this one
+        """
+        query = self.normalize_query(query)
+        if not query:
+            return []
+        
+        try:
+            results, stale = await cache_manager.get_or_refresh(
+                f'{query}|{page}',
+                lambda: self._fetch_search(query, page),
+                namespace='search'
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping search: {e}")
+            return []
         except Exception as e:
-            logger.error(f"Error parsing item: {e}")
-            return None
+            logger.error(f"Error searching for {query!r}: {e}")
+            return []
+        
+        if stale:
+            logger.warning(f"Search failed, using stale cached results for {query!r}")
+        
+        if results:
+            cache_manager.prefetch(
+                f'{query}|{page + 1}',
+                lambda: self._fetch_search(query, page + 1),
+                namespace='search'
+            )
+        return results
+    
+    async def _fetch_search(self, query: str, page: int) -> List[ContentItem]:
+        """Fetch and parse one search result page; raises on failure"""
+        search_url = f"{self.main_url}/page/{page}/?s={quote_plus(query)}"
+        
+        html = await self._fetch_bytes(search_url)
+        if html is None:
+            # Past the last page the site answers 404
+            return []
+        
+        records = await self.parser.run(parsing.parse_listing, html, 50)
+        return [self._item_from_record(record) for record in records]
+    
+    def _item_from_record(self, record: parsing.ItemRecord) -> ContentItem:
+        """Build a content item from a parsed item record"""
+        return ContentItem.from_record(record)
+    
+    def _link_from_record(self, record: parsing.LinkRecord) -> DownloadLink:
+        """Build a download link from a parsed link record"""
+        return DownloadLink.from_record(record)
+    
+    def _parse_item(self, item) -> Optional[ContentItem]:
+        """Parse a single content item from HTML"""
+        record = parsing.parse_item(item)
+        return self._item_from_record(record) if record else None
     
     def _clean_title(self, title: str) -> str:
         """Clean title from quality tags"""
-        # Remove quality indicators
-        cleaned = re.sub(r'\b(480p|720p|1080p|2160p|4K|HEVC|x264|x265|HDRip|WEB-DL|BluRay)\b', '', title, flags=re.IGNORECASE)
-        # Remove extra spaces
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        return cleaned
+        return parsing.clean_title(title)
+    
+    def fingerprint_title(self, title: str) -> str:
+        """
+        Build a normalized title fingerprint for duplicate detection
+        Format is "name|year|season" so re-uploads with a different
+        quality string or slug map to the same value
+        """
+        cleaned = self._clean_title(title)
+        
+        year_match = re.search(r'\b(19|20)\d{2}\b', cleaned)
+        season_match = re.search(r'\b(?:season\s*|s)(\d{1,2})\b', cleaned, re.IGNORECASE)
+        year = year_match.group(0) if year_match else ''
+        season = str(int(season_match.group(1))) if season_match else ''
+        
+        # The name is whatever comes before the year, season or bracketed extras
+        cut = len(cleaned)
+        for match in (year_match, season_match, re.search(r'[(\[]', cleaned)):
+            if match and match.start() > 0:
+                cut = min(cut, match.start())
+        name = re.sub(r'[^a-z0-9]+', ' ', cleaned[:cut].lower()).strip()
+        
+        return f"{name}|{year}|{season}"
     
     def _get_quality(self, text: str) -> str:
         """Extract quality from text"""
-        patterns = [
-            (r'\b(4k|uhd|2160p)\b', '4K UHD'),
-            (r'\b(1080p)\b', '1080p FHD'),
-            (r'\b(720p)\b', '720p HD'),
-            (r'\b(480p)\b', '480p'),
-            (r'\b(bluray)\b', 'BluRay'),
-            (r'\b(web-?dl|webrip)\b', 'WEB-DL'),
-        ]
+        return parsing.get_quality(text)
+    
+    async def get_details(self, url: str, cache_manager) -> Dict:
+        """
+        Get download links and metadata for a content item
+        Both come from one fetch and one parse, cached under one key.
+        When the host's circuit breaker is (or just went) open, the empty
+        result is flagged 'unavailable': the item has links, we can't get them
+        """
+        try:
+            details, stale = await cache_manager.get_or_refresh(
+                url,
+                lambda: self._fetch_details(url),
+                namespace='detail'
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping detail fetch: {e}")
+            return {'links': [], 'meta': {}, 'unavailable': True}
+        except Exception as e:
+            logger.error(f"Error getting details: {e}")
+            return {'links': [], 'meta': {}, 'unavailable': not self.is_available(url)}
         
-        for pattern, quality in patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return quality
+        if stale:
+            logger.warning(f"Detail fetch failed, using stale cached details for {url}")
+        return details
+    
+    async def _fetch_details(self, url: str) -> Dict:
+        """Fetch and parse a detail page; raises on failure"""
+        html = await self._fetch_bytes(url)
+        if html is None:
+            raise ScrapeError(f"Failed to fetch {url}")
         
-        return 'HD'
+        return self._details_from_record(await self.parser.run(parsing.parse_detail, html))
     
-    async def get_download_links(self, url: str, cache_manager) -> List[Dict]:
+    async def get_download_links(self, url: str, cache_manager) -> List[DownloadLink]:
         """
         Get download links for a specific content item
         Enhanced to extract multiple quality options
         """
-        cache_key = f'links_{url}'
-        cached = cache_manager.get(cache_key)
-        if cached:
-            return cached
-        
-        try:
-            session = await self._get_session()
-            
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                if response.status != 200:
-                    return []
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                links = []
-                seen_urls = set()  # Prevent duplicates
-                
-                # Find download links from multiple sections
-                # Check h3, h4 headers and links in page body
-                link_elements = soup.select('h3 a, h4 a, h5 a, .page-body > div a, .entry-content a')
-                
-                for elem in link_elements:
-                    link_url = elem.get('href', '')
-                    link_text = elem.get_text(strip=True)
-                    
-                    # Skip if already processed
-                    if link_url in seen_urls:
-                        continue
-                    
-                    # Filter for valid download links (from HDhub4u ecosystem)
-                    valid_domains = [
-                        'hdstream4u', 'hubstream', 'hubdrive', 'hubcloud', 
-                        'hubcdn', 'pixeldrain', 'hblinks', 'buzzserver',
-                        'mega.nz', 'mediafire', 'drive.google'
-                    ]
-                    
-                    if any(domain in link_url.lower() for domain in valid_domains):
-                        quality = self._extract_quality_from_text(link_text)
-                        
-                        # Add to links list
-                        links.append({
-                            'url': link_url,
-                            'quality': quality,
-                            'text': link_text,
-                            'server': self._extract_server_name(link_url)
-                        })
-                        
-                        seen_urls.add(link_url)
-                
-                # Sort links by quality (4K > 1080p > 720p > 480p)
-                quality_order = {'4K': 0, '2160p': 0, '1080p': 1, '720p': 2, '480p': 3, 'Download': 4}
-                links.sort(key=lambda x: quality_order.get(x['quality'], 5))
-                
-                # Cache for 1 hour
-                cache_manager.set(cache_key, links, ttl=3600)
-                
-                return links
-                
-        except Exception as e:
-            logger.error(f"Error getting download links: {e}")
-            return []
+        details = await self.get_details(url, cache_manager)
+        return details['links']
     
-    def _extract_quality_from_text(self, text: str) -> str:
+    async def get_details_batch(self, urls: List[str], cache_manager) -> Dict[str, Dict]:
         """
-        Extract quality information from link text
-        Enhanced with better pattern matching
+        Get details for several items
+        Pages are fetched concurrently and parsed together in one executor task
         """
-        text_upper = text.upper()
+        results = {}
+        missing = []
+        for url in urls:
+            cached = cache_manager.get(url, namespace='detail')
+            if cached:
+                results[url] = cached
+            else:
+                missing.append(url)
         
-        # Check for specific quality patterns (order matters - check specific first)
-        if '2160' in text or '4K' in text_upper or 'UHD' in text_upper:
-            return '4K'
-        elif '1440' in text or 'QHD' in text_upper:
-            return '1440p'
-        elif '1080' in text or 'FHD' in text_upper:
-            return '1080p'
-        elif '720' in text:
-            return '720p'
-        elif '480' in text or 'SD' in text_upper:
-            return '480p'
-        elif '360' in text:
-            return '360p'
-        elif 'HD' in text_upper and '1080' not in text and '720' not in text:
-            return '720p'  # Generic HD defaults to 720p
-        else:
-            return 'Download'
+        if not missing:
+            return results
+        
+        pages = await asyncio.gather(
+            *(self._fetch_bytes(url) for url in missing),
+            return_exceptions=True
+        )
+        
+        fetched = []
+        for url, page in zip(missing, pages):
+            if isinstance(page, Exception):
+                logger.error(f"Error getting details for {url}: {page}")
+            if isinstance(page, bytes):
+                fetched.append((url, page))
+            else:
+                # Fall back to expired details if they are still held
+                results[url] = cache_manager.get_stale(url, namespace='detail') or {'links': [], 'meta': {}}
+        
+        if fetched:
+            parsed = await self.parser.run(
+                parsing.parse_details_batch, [page for _, page in fetched]
+            )
+            for (url, _), record in zip(fetched, parsed):
+                details = self._details_from_record(record)
+                cache_manager.set(url, details, namespace='detail')
+                results[url] = details
+        
+        return results
+    
+    async def get_download_links_batch(self, urls: List[str], cache_manager) -> Dict[str, List[DownloadLink]]:
+        """Get download links for several items"""
+        details = await self.get_details_batch(urls, cache_manager)
+        return {url: detail['links'] for url, detail in details.items()}
+    
+    def _details_from_record(self, record: parsing.DetailRecord) -> Dict:
+        """
+        Build a details dict from a parsed detail record
+        The links' fingerprint is computed here, once per fetch, so update
+        checks compare two ints instead of rehashing every link
+        """
+        link_records, meta = record
+        links = [self._link_from_record(link) for link in link_records]
+        return {
+            'links': links,
+            'meta': meta,
+            'links_hash': links_hash(links)
+        }
+    
+    def _extract_quality_from_text(self, text: str) -> str:
+        """Extract quality information from link text"""
+        return parsing.extract_quality_from_text(text)
     
     def _extract_server_name(self, url: str) -> str:
         """Extract server name from URL"""
-        url_lower = url.lower()
-        
-        if 'hubdrive' in url_lower:
-            return 'HubDrive'
-        elif 'hubcloud' in url_lower:
-            return 'HubCloud'
-        elif 'hubstream' in url_lower:
-            return 'HubStream'
-        elif 'hdstream4u' in url_lower:
-            return 'HDStream4u'
-        elif 'pixeldrain' in url_lower:
-            return 'PixelDrain'
-        elif 'hubcdn' in url_lower:
-            return 'HubCDN'
-        elif 'mega.nz' in url_lower:
-            return 'Mega'
-        elif 'mediafire' in url_lower:
-            return 'MediaFire'
-        elif 'drive.google' in url_lower:
-            return 'Google Drive'
-        else:
-            return 'Download'
+        return parsing.extract_server_name(url)
     
-    async def check_for_updates(self, existing_urls: List[str], cache_manager) -> List[Dict]:
+    async def check_for_updates(self, existing_urls: List[str], cache_manager,
+                                batch_size: int = 5) -> List[Dict]:
         """
         Check if any existing content has updated download links
         """
         updated_items = []
         
-        for url in existing_urls:
+        for start in range(0, len(existing_urls), batch_size):
+            batch = existing_urls[start:start + batch_size]
+            
+            if not all(self.is_available(url) for url in batch):
+                logger.warning(
+                    f"Source site unavailable, stopping update check "
+                    f"({len(existing_urls) - start} URLs left)"
+                )
+                break
+            
             try:
                 # Get fresh links
-                new_links = await self.get_download_links(url, cache_manager)
+                fresh = await self.get_details_batch(batch, cache_manager)
+            except Exception as e:
+                logger.error(f"Error checking updates for {batch}: {e}")
+                continue
+            
+            for url in batch:
+                details = fresh.get(url) or {'links': []}
+                new_links = details['links']
                 
-                # Compare with cached version (implement comparison logic)
-                cache_key = f'links_prev_{url}'
-                old_links = cache_manager.get(cache_key)
+                # Compare with the previous links by fingerprint only
+                new_hash = details.get('links_hash') if new_links else None
+                old_hash = cache_manager.get(url, namespace='links_prev')
                 
-                if old_links and new_links != old_links:
+                if old_hash is not None and new_hash != old_hash:
                     updated_items.append({
                         'url': url,
                         'new_links': new_links
                     })
                 
                 # Update cache
-                cache_manager.set(cache_key, new_links, ttl=86400)  # 24 hours
-                
-                # Rate limiting
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error checking updates for {url}: {e}")
-                continue
+                cache_manager.set(url, new_hash, namespace='links_prev')
+            
+            # Rate limiting
+            await asyncio.sleep(1)
         
         return updated_items
@@ -6,9 +6,41 @@ Test script to validate bot components
 import asyncio
 import sys
 from database import Database
-from cache_manager import CacheManager
+from cache_manager import CacheManager, CachePolicy, DEFAULT_POLICIES
 from scraper import HDhub4uScraper
-from bot import format_post_message
+from adaptive_scheduler import AdaptiveInterval
+from dedup import DuplicateIndex
+from link_prober import LinkProber
+from profiling import RunProfiler
+from records import links_hash
+from host_registry import HostRegistry, load_rules
+from circuit_breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError
+from parsing import ListingStreamParser, ParseExecutor, parse_listing, parse_details_batch
+from bot import format_post_message, render_post, compute_content_hash
+
+SAMPLE_LISTING_HTML = (
+    '<html><body><ul class="recent-movies">'
+    + ''.join(
+        f'<li class="thumb"><figure><img src="https://img.example.com/{i}.jpg">'
+        f'<a href="https://hdhub4u.example/movie-{i}/">link</a></figure>'
+        f'<figcaption><a href="https://hdhub4u.example/movie-{i}/">'
+        f'<p>Movie {i} (2024) 1080p WEB-DL</p></a></figcaption></li>'
+        for i in range(12)
+    )
+    + '</ul><aside>' + '<div class="widget"><a href="#">sidebar</a></div>' * 400 + '</aside></body></html>'
+).encode('utf-8')
+
+SAMPLE_DETAIL_HTML = (
+    b'<html><head><meta property="og:image" content="https://img.example.com/og.jpg"></head><body>'
+    b'<h1 class="page-title"><span>Movie</span> Sample Agent (2023) WEB-DL</h1>'
+    b'<div class="page-meta"><em>Action</em><em>Thriller</em><em>1080p</em></div>'
+    b'<div><span><a href="https://www.imdb.com/title/tt1234567/">IMDb</a> Rating: 7.4/10</span></div>'
+    b'<div class="kno-rdesc"><div class="kno-rdesc">A retired agent returns for one last job.</div></div>'
+    b'<main class="page-body"><h3><a href="https://hubcloud.one/drive/1">720p x264</a></h3>'
+    b'<h3><a href="https://hubcloud.one/drive/2">1080p HEVC</a></h3>'
+    b'<h4><a href="https://example.com/ads">Sponsor</a></h4>'
+    b'<h4><a href="https://pixeldrain.com/u/abc">480p</a></h4></main></body></html>'
+)
 
 def test_database():
     """Test database functionality"""
@@ -42,6 +74,306 @@ def test_database():
     
     print("✅ Database tests passed!")
 
+def test_outbox():
+    """Test outbox queueing, retries and completion"""
+    print("\nTesting Outbox...")
+    import os
+    db = Database('test_outbox.db')
+
+    try:
+        payload = {'caption': 'Queued Movie', 'keyboard': None, 'poster_url': ''}
+        assert db.enqueue_post('Queued Movie', 'https://example.com/q', '@chan', payload), "Enqueue failed"
+        assert not db.enqueue_post('Queued Movie', 'https://example.com/q', '@chan', payload), "Duplicate enqueued"
+
+        entry = db.get_due_outbox()[0]
+        assert entry['payload'] == payload, "Payload not round-tripped"
+
+        db.fail_outbox(entry['id'], 'timeout', retry_in=60)
+        assert db.get_due_outbox() == [], "Failed entry retried too early"
+        db.fail_outbox(entry['id'], 'timeout', retry_in=0)
+        assert db.get_due_outbox()[0]['attempts'] == 2, "Attempts not tracked"
+        db.defer_outbox(entry['id'], 'flood', retry_in=0)
+        assert db.get_due_outbox()[0]['attempts'] == 2, "Flood wait used up an attempt"
+
+        other = {'caption': 'Stuck Movie', 'keyboard': None, 'poster_url': '', 'fingerprint': 'stuck movie||'}
+        db.enqueue_post('Stuck Movie', 'https://example.com/s', '@chan', other)
+        stuck = db.get_due_outbox()[1]
+        assert not db.fail_outbox(stuck['id'], 'bad', retry_in=0, max_attempts=2), "Failed too early"
+        assert db.fail_outbox(stuck['id'], 'bad', retry_in=0, max_attempts=2), "Not marked failed"
+        assert not db.is_queued('https://example.com/s'), "Failed entry still counts as queued"
+        assert list(db.get_queued_fingerprints()) == [], "Failed entry still indexed"
+        assert db.get_failed_outbox()[0]['last_error'] == 'bad', "Failed entry not listed"
+        assert db.enqueue_post('Stuck Movie', 'https://example.com/s', '@chan', {**other, 'caption': 'New'}), "Failed entry not re-queued"
+        revived = db.get_due_outbox()[1]
+        assert (revived['attempts'], revived['payload']['caption']) == (0, 'New'), "Re-queued entry not reset"
+        db.fail_outbox(revived['id'], 'bad', retry_in=0, max_attempts=1)
+        assert db.retry_failed_outbox() == 1 and db.is_queued('https://example.com/s'), "Retry failed"
+        db.fail_outbox(revived['id'], 'bad', retry_in=0, max_attempts=1)
+        assert db.purge_failed_outbox() == 1, "Purge failed"
+
+        assert db.complete_outbox(entry['id'], content_hash='abc'), "Completion failed"
+        assert db.is_posted('https://example.com/q'), "Sent entry not recorded"
+        assert db.get_outbox_counts() == {}, "Sent entry left in outbox"
+        assert not db.enqueue_post('Queued Movie', 'https://example.com/q', '@chan', payload), "Posted URL re-queued"
+    finally:
+        db.close()
+        if os.path.exists('test_outbox.db'):
+            os.remove('test_outbox.db')
+
+    print("✅ Outbox tests passed!")
+
+def test_post_counters():
+    """Test that rollup counters follow inserts and deletes"""
+    print("\nTesting post counters...")
+    import os
+    db = Database('test_counters.db')
+
+    try:
+        db.add_post('Counted Movie', 'https://example.com/c1')
+        db.add_post('Counted Movie', 'https://example.com/c2', duplicate_of=1)
+        payload = {'caption': 'Channel Movie'}
+        db.enqueue_post('Channel Movie', 'https://example.com/c3', '@chan', payload)
+        db.complete_outbox(db.get_due_outbox()[0]['id'])
+
+        assert db.get_total_posts() == 3, "Total not maintained"
+        assert db.get_unique_content_count() == 2, "Re-upload counted as unique"
+        assert db.get_posts_count_today() == 3, "Daily count not maintained"
+        assert db.get_total_posts(channel='@chan') == 1, "Per-channel count wrong"
+
+        db.conn.execute("UPDATE posts SET posted_at = datetime('now', '-200 days') WHERE id = 1")
+        db.conn.commit()
+        assert db.get_posts_count_today() == 2, "Daily count ignored timestamp change"
+        assert db.clear_old_posts(days=90) == 1, "Old post not cleared"
+        assert db.get_total_posts() == 2, "Delete not reflected in total"
+        assert db.get_unique_content_count() == 1, "Delete not reflected in unique count"
+    finally:
+        db.close()
+        if os.path.exists('test_counters.db'):
+            os.remove('test_counters.db')
+
+    print("✅ Post counter tests passed!")
+
+def test_retention_purge():
+    """Test chunked purge, archive lookups and incremental vacuum"""
+    print("\nTesting retention purge...")
+    import os
+    db = Database('test_retention.db')
+
+    try:
+        assert db.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2, "Incremental vacuum not enabled"
+        for i in range(7):
+            db.add_post(f'Old Movie {i} ' + 'x' * 2000, f'https://example.com/old{i}')
+        db.add_post('New Movie', 'https://example.com/new')
+        db.conn.execute("UPDATE posts SET posted_at = datetime('now', '-100 days') WHERE url LIKE '%/old%'")
+        db.conn.commit()
+
+        result = db.purge_old_posts(days=90, chunk_size=3, pause=0)
+        assert (result['deleted'], result['archived'], result['chunks']) == (7, 7, 3), f"Purge wrong: {result}"
+        assert db.get_total_posts() == 1, "Purged posts still counted"
+        assert db.is_posted('https://example.com/old3'), "Archived URL not treated as posted"
+        assert not db.enqueue_post('Old Movie 3', 'https://example.com/old3', '@chan', {}), "Archived URL re-queued"
+        assert db.conn.execute('PRAGMA freelist_count').fetchone()[0] == 0, "Free pages not released"
+
+        db.conn.execute("UPDATE posts SET posted_at = datetime('now', '-100 days')")
+        db.conn.commit()
+        assert db.purge_old_posts(days=90, archive=False, pause=0)['archived'] == 0, "Delete mode archived"
+        assert not db.is_posted('https://example.com/new'), "Deleted URL still posted"
+    finally:
+        db.close()
+        if os.path.exists('test_retention.db'):
+            os.remove('test_retention.db')
+
+    print("✅ Retention purge tests passed!")
+
+def test_leases():
+    """Test that only one replica at a time can hold a lease"""
+    print("\nTesting leases...")
+    import os
+    replica_a = Database('test_leases.db')
+    replica_b = Database('test_leases.db')
+
+    try:
+        assert replica_a.acquire_lease('scheduler', 'a', 60), "Free lease not acquired"
+        assert not replica_b.acquire_lease('scheduler', 'b', 60), "Held lease taken over"
+        assert replica_a.acquire_lease('scheduler', 'a', 60), "Owner could not renew"
+        assert replica_b.get_lease('scheduler')['owner'] == 'a', "Wrong owner reported"
+
+        # An owner that stops renewing loses the lease once it expires
+        replica_a.conn.execute("UPDATE leases SET expires_at = 0 WHERE name = 'scheduler'")
+        replica_a.conn.commit()
+        assert replica_a.get_lease('scheduler') is None, "Expired lease still reported"
+        assert replica_b.acquire_lease('scheduler', 'b', 60), "Expired lease not taken over"
+        assert not replica_a.acquire_lease('scheduler', 'a', 60), "Old owner kept the lease"
+
+        replica_a.release_lease('scheduler', 'a')
+        assert replica_a.get_lease('scheduler')['owner'] == 'b', "Non-owner released the lease"
+        replica_b.release_lease('scheduler', 'b')
+        assert replica_a.acquire_lease('scheduler', 'a', 60), "Released lease not free"
+    finally:
+        replica_a.close()
+        replica_b.close()
+        if os.path.exists('test_leases.db'):
+            os.remove('test_leases.db')
+
+    print("✅ Lease tests passed!")
+
+def test_history_pages_and_search():
+    """Test keyset paging of history and title search"""
+    print("\nTesting history paging and title search...")
+    import os
+    db = Database('test_history_pages.db')
+
+    try:
+        for i in range(25):
+            db.add_post(f'Movie {i} (2024) 1080p', f'https://example.com/p{i}')
+        # Same timestamp for several posts: ids break the tie
+        db.conn.execute("UPDATE posts SET posted_at = datetime('2025-01-01', '+' || (id / 3) || ' hours')")
+        db.conn.commit()
+
+        seen = []
+        page, has_more = db.get_posts_page(limit=10)
+        seen += page
+        while has_more:
+            last = page[-1]
+            page, has_more = db.get_posts_page((last['posted_at'], last['id']), limit=10)
+            seen += page
+        assert [post['id'] for post in seen] == list(range(25, 0, -1)), "Keyset pages skip or repeat posts"
+
+        first = seen[10]
+        newer, has_more = db.get_posts_page((first['posted_at'], first['id']), newer=True, limit=10)
+        assert [post['id'] for post in newer] == list(range(25, 15, -1)) and not has_more, "Newer page wrong"
+        _, has_older = db.get_posts_page((seen[-1]['posted_at'], seen[-1]['id']), limit=0)
+        assert not has_older, "Older posts reported past the last one"
+
+        assert [post['url'] for post in db.find_posts('movie 17')] == ['https://example.com/p17'], "Title search failed"
+        assert len(db.find_posts('mov 2024')) == 20, "Prefix search failed"
+        assert db.find_posts('"; DROP TABLE posts; --') == [], "Query not sanitized"
+
+        db.conn.execute("UPDATE posts SET title = 'Renamed Show' WHERE id = 1")
+        db.conn.execute("DELETE FROM posts WHERE id = 2")
+        db.conn.commit()
+        assert [post['id'] for post in db.find_posts('renamed')] == [1], "Index not updated"
+        assert db.find_posts('movie 1 2024', limit=50) and all(
+            post['id'] not in (1, 2) for post in db.find_posts('movie', limit=50)
+        ), "Deleted or renamed posts still indexed"
+    finally:
+        db.close()
+        if os.path.exists('test_history_pages.db'):
+            os.remove('test_history_pages.db')
+
+    print("✅ History paging and title search tests passed!")
+
+def test_history_export_import():
+    """Test JSONL export/import round trip, plain and gzip-compressed"""
+    print("\nTesting history export/import...")
+    import os
+    source = Database('test_export.db')
+    target = Database('test_import.db')
+
+    try:
+        source.add_post('Original Movie (2024)', 'https://example.com/h1', fingerprint='original|2024|')
+        source.add_post('Original Movie 2024 Re-upload', 'https://example.com/h2', duplicate_of=1)
+        source.add_post('Other Show', 'https://example.com/h3')
+        assert source.export_posts('test_history.jsonl') == 3, "Export count wrong"
+
+        with open('test_history.jsonl', 'a', encoding='utf-8') as f:
+            f.write('not json\n{"title": "No URL"}\n')
+
+        target.add_post('Other Show', 'https://example.com/h3')
+        result = target.import_posts('test_history.jsonl', fingerprint=lambda title: 'fp', batch_size=2)
+        assert (result['rows'], result['imported'], result['skipped'], result['invalid']) == (3, 2, 1, 2), \
+            f"Import counts wrong: {result}"
+        assert result['rows_per_second'] > 0, "Throughput not reported"
+
+        assert target.is_posted('https://example.com/h2'), "Imported URL not recorded"
+        assert target.get_total_posts() == 3 and target.get_unique_content_count() == 2, \
+            "Counters or duplicate link not rebuilt"
+        fingerprints = dict(target.get_fingerprints())
+        assert 'original|2024|' in fingerprints.values(), "Exported fingerprint lost"
+        assert target.import_posts('test_history.jsonl')['imported'] == 0, "Re-import added rows"
+
+        # Compressed exports import the same, whatever the downloaded file is called
+        assert source.export_posts('test_history.jsonl.gz') == 3, "Compressed export count wrong"
+        with open('test_history.jsonl.gz', 'rb') as f:
+            assert f.read(2) == b'\x1f\x8b', "Export not gzip-compressed"
+        os.replace('test_history.jsonl.gz', 'test_history_download')
+        fresh = Database('test_import_gz.db')
+        try:
+            assert fresh.import_posts('test_history_download')['imported'] == 3, "Compressed import failed"
+        finally:
+            fresh.close()
+    finally:
+        source.close()
+        target.close()
+        for path in ('test_export.db', 'test_import.db', 'test_import_gz.db',
+                     'test_history.jsonl', 'test_history.jsonl.gz', 'test_history_download'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    print("✅ History export/import tests passed!")
+
+def test_link_prober():
+    """Test dead link detection and cached health"""
+    print("\nTesting link prober...")
+    import os
+    from aiohttp import web
+
+    hits = []
+
+    async def handler(request):
+        hits.append((request.method, request.path))
+        if request.path == '/gone':
+            return web.Response(status=404)
+        if request.path == '/nohead' and request.method == 'HEAD':
+            return web.Response(status=405)
+        if request.path == '/busy':
+            return web.Response(status=503)
+        return web.Response(status=200)
+
+    async def run():
+        app = web.Application()
+        app.router.add_route('*', '/{name}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        base = f'http://127.0.0.1:{port}'
+
+        prober = LinkProber(db, timeout=2)
+        links = [
+            {'url': f'{base}/gone'}, {'url': f'{base}/ok'},
+            {'url': f'{base}/nohead'}, {'url': f'{base}/busy'},
+            {'url': 'http://127.0.0.1:9/down'},
+        ]
+        try:
+            reordered = await prober.check_links(links, 'reorder')
+            kept = await prober.check_links(links, 'drop')
+            all_dead = await prober.check_links(links[:1], 'drop')
+        finally:
+            await prober.close()
+            await runner.cleanup()
+        return base, reordered, kept, all_dead
+
+    db = Database('test_prober.db')
+    try:
+        base, reordered, kept, all_dead = asyncio.run(run())
+        assert [link['url'] for link in kept] == [
+            f'{base}/ok', f'{base}/nohead', f'{base}/busy', 'http://127.0.0.1:9/down'
+        ], "Dead links not dropped or unknown links dropped"
+        assert reordered[-1]['url'] == f'{base}/gone', "Dead links not moved last"
+        assert all_dead == [{'url': f'{base}/gone'}], "All-dead link list not kept"
+        # 5xx answers aren't cached, so /busy is the only link probed twice
+        assert len(hits) == 6, "Cached results were probed again"
+        assert ('GET', '/nohead') in hits, "No ranged GET fallback"
+        assert db.get_host_health(['127.0.0.1'])['127.0.0.1']['alive'] == 1, "Host health not stored"
+    finally:
+        db.close()
+        if os.path.exists('test_prober.db'):
+            os.remove('test_prober.db')
+
+    print("✅ Link prober tests passed!")
+
 def test_cache():
     """Test cache functionality"""
     print("\nTesting Cache Manager...")
@@ -71,6 +403,76 @@ def test_cache():
     
     print("✅ Cache tests passed!")
 
+def test_cache_namespaces():
+    """Test per-namespace policies, eviction and statistics"""
+    print("\nTesting cache namespaces...")
+    cache = CacheManager({'small': CachePolicy(ttl=60, max_entries=2)})
+
+    cache.set('a', 'x' * 1000, namespace='small')
+    cache.set('b', 'y', namespace='small')
+    assert cache.get('a', namespace='small'), "Namespaced value missing"
+    cache.set('c', 'z', namespace='small')
+    assert cache.get('b', namespace='small') is None, "Least recently used entry kept"
+    assert cache.get('a', namespace='small'), "Recently used entry evicted"
+
+    cache.set('a', 'same key, other namespace')
+    assert cache.get('a') != cache.get('a', namespace='small'), "Namespaces not isolated"
+
+    stats = cache.get_namespace_stats()
+    assert stats['small']['size'] == 2 and stats['small']['evictions'] == 1, "Eviction not counted"
+    assert stats['small']['hits'] == 3 and stats['small']['misses'] == 1, "Hits/misses not tracked"
+    assert stats['small']['bytes'] > 1000, "Bytes not accounted"
+    assert stats['small']['ttl'] == 60, "Namespace policy not applied"
+
+    assert cache.flush('small') == 2, "Flush count wrong"
+    assert cache.get_namespace_stats()['small']['bytes'] == 0, "Bytes not reset on flush"
+    assert cache.get('a') == 'same key, other namespace', "Flush touched another namespace"
+
+    # Unlisted namespaces fall back to the default policy
+    cache.set('k', 1, namespace='adhoc')
+    assert cache.get_namespace_stats()['adhoc']['ttl'] == DEFAULT_POLICIES['default'].ttl
+
+    print("✅ Cache namespace tests passed!")
+
+def test_cache_stale_while_revalidate():
+    """Test soft/hard TTL behaviour of get_or_refresh"""
+    print("\nTesting stale-while-revalidate...")
+    cache = CacheManager()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def failing_loader():
+        raise RuntimeError("site down")
+
+    async def run():
+        assert await cache.get_or_refresh('k', loader, ttl=0.05, stale_ttl=0.2) == (1, False)
+        assert await cache.get_or_refresh('k', loader, ttl=0.05, stale_ttl=0.2) == (1, False)
+        assert len(calls) == 1, "Fresh value reloaded"
+
+        await asyncio.sleep(0.06)
+        # Soft window: old value right away, a single background refresh
+        results = [await cache.get_or_refresh('k', loader, ttl=0.05, stale_ttl=0.2) for _ in range(3)]
+        assert results == [(1, False)] * 3, "Stale value not served immediately"
+        await asyncio.sleep(0.03)
+        assert len(calls) == 2, "Background refresh not deduplicated"
+        assert cache.get('k') == 2, "Background refresh not stored"
+
+        await asyncio.sleep(0.3)
+        # Past the hard TTL: failures fall back to the old value with a flag
+        assert await cache.get_or_refresh('k', failing_loader, ttl=0.05) == (2, True)
+        try:
+            await cache.get_or_refresh('missing', failing_loader)
+            assert False, "Error swallowed without a fallback"
+        except RuntimeError:
+            pass
+
+    asyncio.run(run())
+    print("✅ Stale-while-revalidate test passed!")
+
 def test_format_message_escaping():
     """Ensure Markdown entities are escaped in formatted messages"""
     print("\nTesting Markdown escaping...")
@@ -91,6 +493,749 @@ def test_format_message_escaping():
 
     print("✅ Markdown escaping test passed!")
 
+def test_content_hash():
+    """Ensure the content hash follows what a merge edit can change"""
+    print("\nTesting content hash...")
+    item = {
+        'title': 'Hashed Movie',
+        'quality': '720p HD',
+        'url': 'https://example.com/hashed',
+        'download_links': [{'url': 'https://hubcloud.one/a', 'quality': '720p'}],
+    }
+
+    first_hash, message, keyboard = render_post(item)
+    assert render_post(dict(item, plot='Changed plot'))[0] == first_hash, "Caption-only change altered the hash"
+    assert compute_content_hash(keyboard, 1) == first_hash, "Hash not stable for equal content"
+
+    item['download_links'] = item['download_links'] + [
+        {'url': 'https://pixeldrain.com/u/b', 'quality': '1080p'}
+    ]
+    assert render_post(item)[0] != first_hash, "Link change not reflected in hash"
+
+    print("✅ Content hash test passed!")
+
+def test_adaptive_interval():
+    """Ensure the adaptive interval stays within bounds"""
+    print("\nTesting adaptive interval...")
+    interval = AdaptiveInterval(2, 30)
+
+    for _ in range(20):
+        interval.record_run(0)
+    assert interval.current == 30, "Idle runs did not back off to max"
+
+    interval.record_run(4)
+    assert interval.current == 15, "New items did not speed up polling"
+    for _ in range(10):
+        interval.record_run(3)
+    assert interval.current == 2, "Busy runs did not reach min"
+    assert interval.jitter_seconds() == 12, "Jitter not proportional to interval"
+
+    assert interval.count_new(['a', 'b']) == 2, "First sighting not counted"
+    assert interval.count_new(['a', 'b', 'c']) == 1, "Stuck items counted again"
+    small = AdaptiveInterval(2, 30, max_seen=2)
+    small.count_new(['a', 'b', 'c'])
+    assert small.count_new(['a']) == 1, "Seen URLs not bounded"
+
+    print("✅ Adaptive interval test passed!")
+
+def test_records():
+    """Test record dict views, label interning and change detection"""
+    print("\nTesting records...")
+    import dataclasses
+    scraper = HDhub4uScraper()
+
+    item = scraper._item_from_record(('Movie', 'https://hdhub4u.example/m/', 'https://img.example.com/p.jpg', '1080p FHD'))
+    assert item['title'] == 'Movie' and item.get('year', '') == '', "Dict view broken"
+    assert dict(item)['poster_url'] == 'https://img.example.com/p.jpg', "dict() of record broken"
+    assert isinstance(item.scraped_at, float), "Timestamp not numeric"
+    try:
+        item.title = 'Changed'
+        assert False, "Record is mutable"
+    except dataclasses.FrozenInstanceError:
+        pass
+
+    first = scraper._link_from_record(('https://hubcloud.one/drive/1', '720p'.encode().decode(), '720p x264', 'HubCloud'))
+    second = scraper._link_from_record(('https://hubcloud.one/drive/2', '720p'.encode().decode(), '720p HEVC', 'HubCloud'))
+    assert first.quality is second.quality, "Quality label not interned"
+
+    links = [first, second]
+    assert len({first, scraper._link_from_record(tuple(dict(first).values()))}) == 1, "Equal links hash differently"
+    assert links == [scraper._link_from_record(tuple(dict(link).values())) for link in links], "Equal links differ"
+
+    cache = CacheManager()
+    cache.set('u', links_hash(links), namespace='links_prev')
+    details = scraper._details_from_record(([tuple(dict(link).values()) for link in links], {}))
+    assert details['links_hash'] == links_hash(links), "Links hash not stored with details"
+    # Bypass the network: feed the batch result through a stub
+    async def same_links(urls, cache_manager):
+        return {'u': details}
+    async def new_links(urls, cache_manager):
+        return {'u': {'links': [first], 'meta': {}, 'links_hash': links_hash([first])}}
+    scraper.get_details_batch = same_links
+    assert asyncio.run(scraper.check_for_updates(['u'], cache, batch_size=5)) == [], "Unchanged links reported"
+    scraper.get_details_batch = new_links
+    updated = asyncio.run(scraper.check_for_updates(['u'], cache, batch_size=5))
+    assert [entry['url'] for entry in updated] == ['u'], "Changed links not reported"
+
+    print("✅ Record tests passed!")
+
+def test_duplicate_index():
+    """Ensure re-uploads map to the original post"""
+    print("\nTesting duplicate index...")
+    scraper = HDhub4uScraper()
+    index = DuplicateIndex()
+
+    original = scraper.fingerprint_title('Pushpa 2: The Rule (2024) Hindi WEB-DL 720p [1.2GB]')
+    reupload = scraper.fingerprint_title('Pushpa 2 - The Rule (2024) HDRip 1080p')
+    assert original == reupload, "Quality strings leaked into fingerprint"
+
+    index.add(original, 1)
+    index.add(scraper.fingerprint_title('Stranger Things (Season 4) 2022'), 2)
+    assert index.find('pushpa 2 the rule the|2024|') == 1, "Near-duplicate not found"
+    assert index.find(scraper.fingerprint_title('Stranger Things S04 (2022)')) == 2, "Season alias not matched"
+    assert index.find(scraper.fingerprint_title('Stranger Things Season 3 (2022)')) is None, "Different season matched"
+    assert index.find(scraper.fingerprint_title('Pushpa 2: The Rule (2021)')) is None, "Different year matched"
+
+    assert not index.discard(original, 2), "Fingerprint removed for another ref"
+    assert index.discard(original, 1) and index.find(original) is None, "Fingerprint not removed"
+    assert len(index) == 1, "Other fingerprints removed"
+
+    print("✅ Duplicate index test passed!")
+
+def test_parse_executor():
+    """Ensure pages parse to plain records inside a worker process"""
+    print("\nTesting parse executor...")
+    executor = ParseExecutor('process', max_workers=1)
+
+    async def run():
+        items = await executor.run(parse_listing, SAMPLE_LISTING_HTML, 10)
+        links = await executor.run(parse_details_batch, [SAMPLE_DETAIL_HTML] * 2)
+        return items, links
+
+    try:
+        items, links = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert len(items) == 10, "Listing limit not applied"
+    assert items[0] == (
+        'Movie 0 (2024)', 'https://hdhub4u.example/movie-0/',
+        'https://img.example.com/0.jpg', '1080p FHD'
+    ), "Item record wrong"
+    assert len(links) == 2 and links[0] == links[1], "Batch results differ"
+    link_records, meta = links[0]
+    assert [link[1] for link in link_records] == ['1080p', '720p', '480p'], "Links not filtered and sorted"
+    assert link_records[0][3] == 'HubCloud', "Server name wrong"
+    assert meta['year'] == '2023' and meta['rating'] == '7.4/10', "Year or rating missing"
+    assert meta['genre'] == ['Action', 'Thriller'], "Genre tags wrong"
+    assert meta['plot'].startswith('A retired agent'), "Plot missing"
+    assert meta['image'] == 'https://img.example.com/og.jpg', "og:image missing"
+
+    print("✅ Parse executor test passed!")
+
+def test_streaming_listing():
+    """Ensure the streaming parser stops before the end of the page"""
+    print("\nTesting streaming listing parser...")
+    chunks = [SAMPLE_LISTING_HTML[i:i + 512] for i in range(0, len(SAMPLE_LISTING_HTML), 512)]
+
+    parser = ListingStreamParser(limit=10)
+    fed = 0
+    for chunk in chunks:
+        fed += 1
+        if parser.feed(chunk):
+            break
+    assert fed < len(chunks), "Parser read the whole page"
+    assert parser.close() == parse_listing(SAMPLE_LISTING_HTML, 10), "Streamed items differ"
+
+    # A lone posted item (movie-3) doesn't hide movie-4; three in a row end the page
+    posted = {f'https://hdhub4u.example/movie-{i}/' for i in (3, 5, 6, 7)}
+    parser = ListingStreamParser(limit=10, stop_at=posted.__contains__)
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    assert [record[1] for record in parser.close()] == [
+        f'https://hdhub4u.example/movie-{i}/' for i in range(8)
+    ], "Parser did not stop after posted items"
+    assert parser.truncated, "Early stop not reported"
+
+    from aiohttp import web
+
+    async def listing(request):
+        return web.Response(body=SAMPLE_LISTING_HTML, content_type='text/html')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/page/1/', listing)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+
+        scraper = HDhub4uScraper()
+        scraper.main_url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+        cache = CacheManager()
+        try:
+            items = await scraper.get_latest_content(cache, stop_at=posted.__contains__)
+            return items, cache.get('latest_content', namespace='listing')
+        finally:
+            await scraper.close()
+            await runner.cleanup()
+
+    items, cached = asyncio.run(run())
+    assert len(items) == 8, "Shortened listing not returned"
+    assert cached is not None and cached[1] is False and list(cached[0]) == items, "Shortened listing not cached"
+
+    print("✅ Streaming listing test passed!")
+
+def test_circuit_breaker():
+    """Test breaker transitions and fail-fast scraping"""
+    print("\nTesting circuit breaker...")
+    import time
+    from aiohttp import web
+
+    breaker = CircuitBreaker('site', window=4, min_calls=4, error_rate=0.5, open_seconds=0.05)
+    for success in (True, False, True, False):
+        breaker.record(success, 0.1)
+    assert breaker.state == 'open', "Breaker not opened at error threshold"
+    try:
+        breaker.acquire()
+        assert False, "Open breaker let a call through"
+    except CircuitOpenError:
+        pass
+
+    time.sleep(0.06)
+    breaker.acquire()
+    assert breaker.state == 'half-open' and not breaker.allows_calls(), "Second trial allowed"
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open' and breaker.retry_in() > 0.05, "Failed trial did not back off"
+    time.sleep(0.11)
+    with breaker.call():
+        pass
+    assert breaker.state == 'closed', "Successful trial did not close breaker"
+
+    slow = CircuitBreaker('slow', min_calls=2, slow_call=1.0, slow_rate=0.5)
+    slow.record(True, 2.0)
+    slow.record(True, 2.0)
+    assert slow.state == 'open', "Slow calls did not open breaker"
+
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        return web.Response(status=503)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{name}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        scraper = HDhub4uScraper()
+        scraper.main_url = f'http://127.0.0.1:{port}'
+        scraper.breakers = BreakerRegistry(min_calls=2)
+        try:
+            urls = [f'{scraper.main_url}/item-{i}' for i in range(10)]
+            await scraper.check_for_updates(urls, CacheManager(), batch_size=2)
+            details = await scraper.get_details(urls[0], CacheManager())
+            return scraper.is_available(), details
+        finally:
+            await scraper.close()
+            await runner.cleanup()
+
+    available, details = asyncio.run(run())
+    assert not available, "Breaker not opened by server errors"
+    assert len(hits) == 2, "Update check kept hitting a failing site"
+    assert details['unavailable'] and details['links'] == [], "Skipped detail fetch not flagged"
+
+    print("✅ Circuit breaker tests passed!")
+
+def test_run_profiler():
+    """Test that a profiled run reports CPU and memory hot spots"""
+    print("\nTesting run profiler...")
+    profiler = RunProfiler(top_functions=10)
+    assert not profiler.armed, "Profiler armed by default"
+
+    def busy_parse():
+        return [str(i) * 10 for i in range(20000)]
+
+    async def work():
+        await asyncio.sleep(0)
+        return busy_parse()
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    profiler.arm(42)
+    assert profiler.armed and profiler.disarm() == 42 and not profiler.armed, "Arm/disarm broken"
+
+    result, error, report = asyncio.run(profiler.run('work', work))
+    assert len(result) == 20000 and error is None, "Run result not passed through"
+    assert 'busy_parse' in report, "Hot function missing from report"
+    assert 'test_components.py' in report.split('== Memory')[1], "Allocation site missing from report"
+
+    _, error, report = asyncio.run(profiler.run('failing', failing))
+    assert isinstance(error, RuntimeError) and 'boom' in report, "Error not reported"
+
+    print("✅ Run profiler tests passed!")
+
+def test_search_cache():
+    """Test cached search with normalized queries and next-page prefetch"""
+    print("\nTesting search cache...")
+    from aiohttp import web
+
+    hits = []
+
+    async def handler(request):
+        hits.append((request.match_info['page'], request.query.get('s')))
+        if request.match_info['page'] == '3':
+            return web.Response(status=404)
+        return web.Response(body=SAMPLE_LISTING_HTML, content_type='text/html')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/page/{page}/', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        scraper = HDhub4uScraper()
+        scraper.main_url = f'http://127.0.0.1:{port}'
+        cache = CacheManager()
+        try:
+            first = await scraper.search('  Movie   2024 ', cache)
+            again = await scraper.search('movie 2024', cache)
+            await asyncio.sleep(0.1)  # Let the prefetch finish
+            second = await scraper.search('MOVIE 2024', cache, page=2)
+            await asyncio.sleep(0.1)
+            past_end = await scraper.search('movie 2024', cache, page=3)
+
+            # Next is offered on every page with results; past the end only Prev
+            import bot
+            originals = bot.scraper, bot.cache
+            bot.scraper, bot.cache = scraper, cache
+            try:
+                pages = [await bot.render_search('movie 2024', page) for page in (1, 2, 3)]
+            finally:
+                bot.scraper, bot.cache = originals
+            navs = [[button.text for button in keyboard.inline_keyboard[-1]] for _, keyboard in pages]
+            return first, again, second, past_end, navs, pages[-1][0]
+        finally:
+            await scraper.close()
+            await runner.cleanup()
+
+    first, again, second, past_end, navs, empty_text = asyncio.run(run())
+    assert navs == [['Next ▶️'], ['◀️ Prev', 'Next ▶️'], ['◀️ Prev']], f"Wrong navigation: {navs}"
+    assert empty_text == '🔎 No results for "movie 2024" on page 3', "Empty page not explained"
+    assert len(first) == 12 and first[0]['title'].startswith('Movie 0'), "Search results not parsed"
+    assert again == first, "Normalized query not served from cache"
+    assert second and past_end == [], "Paging wrong"
+    assert hits == [('1', 'movie 2024'), ('2', 'movie 2024'), ('3', 'movie 2024')], \
+        f"Unexpected fetches: {hits}"
+
+    print("✅ Search cache tests passed!")
+
+def test_fake_bot_api():
+    """Test the local Bot API stand-in with a real Bot client"""
+    print("\nTesting fake Bot API...")
+    from telegram import Bot
+    from telegram.error import RetryAfter
+    from fake_bot_api import FakeBotAPI
+
+    async def scenario():
+        api = FakeBotAPI(per_chat_per_minute=2)
+        await api.start()
+        try:
+            async with Bot('123456:TEST', base_url=api.base_url) as bot:
+                first = await bot.send_message('@chan', 'hello')
+                second = await bot.send_photo('@chan', photo='https://img.example.com/p.jpg', caption='poster')
+                assert (first.message_id, second.message_id) == (1, 2), "Message ids not sequential"
+                assert second.caption == 'poster' and first.chat.username == 'chan', "Message fields lost"
+                try:
+                    await bot.send_message('@chan', 'flood')
+                    assert False, "Flood limit not enforced"
+                except RetryAfter as e:
+                    assert 0 < e.retry_after <= 60, f"Bad retry_after: {e.retry_after}"
+                await bot.send_message('@other', 'separate limit')
+        finally:
+            await api.stop()
+        return api.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['sent'] == 3 and stats['flood_errors'] == 1, f"Wrong stats: {stats}"
+    assert stats['calls']['getMe'] == 1, "Bot did not initialize against the fake API"
+
+    print("✅ Fake Bot API tests passed!")
+
+def test_poster_cache():
+    """Test poster header parsing, caching, pruning and send fallbacks"""
+    print("\nTesting poster cache...")
+    import os
+    import shutil
+    import struct
+    import zlib
+    from aiohttp import web
+    import poster_cache
+    from bot import poster_for
+
+    def png(width, height, padding=0):
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        rows = b''.join(b'\x00' + b'\x80' * width * 3 for _ in range(height))
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'tEXt', b'c\x00' + b'x' * padding)
+                + chunk(b'IEND', b''))
+
+    jpeg = b'\xff\xd8\xff\xe0\x00\x04ab\xff\xc0\x00\x11\x08\x02\x58\x01\x90' + b'\x00' * 12
+    assert poster_cache.image_size(jpeg) == ('jpeg', 400, 600), "JPEG size misread"
+    assert poster_cache.image_size(png(30, 20)) == ('png', 30, 20), "PNG size misread"
+    assert poster_cache.image_size(b'<html>') is None, "Non-image accepted"
+    assert not poster_cache.fits_telegram(9000, 2000, 1000), "Dimension limit not applied"
+
+    hits = []
+    images = {'a': png(40, 60, padding=3000), 'b': png(40, 60, padding=3000), 'wide': png(2100, 100)}
+
+    async def handler(request):
+        name = request.match_info['name']
+        hits.append(name)
+        if name not in images:
+            return web.Response(status=403)
+        return web.Response(body=images[name], content_type='image/png')
+
+    directory = 'test_poster_cache'
+    original_image = poster_cache.Image
+    poster_cache.Image = None  # Exercise the pure-Python path even if Pillow is installed
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{name}.png', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+
+        cache = poster_cache.PosterCache(directory, max_bytes=5000)
+        try:
+            keys = await asyncio.gather(cache.fetch(f'{base}/a.png'), cache.fetch(f'{base}/a.png'))
+            assert keys[0] == keys[1] == cache.key(f'{base}/a.png'), "Wrong cache key"
+            assert hits == ['a'], f"Concurrent fetches not shared: {hits}"
+            assert await cache.fetch(f'{base}/a.png') == keys[0] and hits == ['a'], "Cached poster downloaded again"
+            assert cache.load(keys[0]) == images['a'], "Cached bytes differ"
+
+            assert await cache.fetch(f'{base}/missing.png') is None, "Blocked poster cached"
+            assert await cache.fetch(f'{base}/wide.png') is None, "Over-wide poster accepted"
+
+            # Both posters don't fit in max_bytes; the least recently used goes
+            await cache.fetch(f'{base}/b.png')
+            assert cache.load(keys[0]) is None, "Cache exceeded max_bytes"
+            assert cache.get_stats()['files'] == 1, "Wrong file count"
+        finally:
+            await cache.close()
+            await runner.cleanup()
+
+    try:
+        asyncio.run(run())
+    finally:
+        poster_cache.Image = original_image
+        shutil.rmtree(directory, ignore_errors=True)
+
+    assert poster_for({'poster_url': 'https://img.example.com/p.jpg'}) == 'https://img.example.com/p.jpg', "Old entry lost poster"
+    assert poster_for({'poster_url': 'https://img.example.com/p.jpg', 'poster_file': None}) is None, "Failed poster retried"
+    assert poster_for({'poster_url': 'u', 'poster_file': 'gone'}) == 'u', "No URL fallback for pruned poster"
+
+    print("✅ Poster cache tests passed!")
+
+def test_catchup_albums():
+    """Test that a backlog goes out as an album plus one links message"""
+    print("\nTesting catch-up albums...")
+    import json
+    import os
+    import bot
+    from telegram.ext import Application
+    from fake_bot_api import FakeBotAPI
+    from rate_limiter import RateLimiter
+
+    original_db, original_limiter = bot.db, bot.send_limiter
+    original_catchup = bot.CATCHUP_THRESHOLD, bot.ALBUMS_PER_RUN
+    bot.db = Database('test_catchup.db')
+    bot.send_limiter = RateLimiter(0)
+
+    for i in range(8):
+        item = {
+            'title': f'Backlog Movie {i}',
+            'url': f'https://hdhub4u.example/backlog-{i}/',
+            'download_links': [
+                {'url': f'https://hubcloud.one/drive/{i}-{quality}', 'quality': quality}
+                for quality in ('1080p', '720p', '480p', '4K')
+            ]
+        }
+        content_hash, caption, keyboard = render_post(item)
+        payload = {'caption': caption, 'keyboard': keyboard.to_dict(), 'content_hash': content_hash,
+                   'poster_url': f'https://img.example.com/{i}.jpg' if i < 7 else ''}
+        bot.db.enqueue_post(item['title'], item['url'], '@chan', payload)
+
+    async def scenario(reject_methods=()):
+        api = FakeBotAPI(reject_methods=reject_methods)
+        await api.start()
+        application = Application.builder().token('123456:TEST').base_url(api.base_url).build()
+        await application.initialize()
+        try:
+            sent = await bot.drain_outbox(application)
+        finally:
+            await application.shutdown()
+            await api.stop()
+        return sent, api
+
+    try:
+        sent, api = asyncio.run(scenario())
+        assert sent == 8, f"Backlog not cleared: {sent}"
+        methods = [send['method'] for send in api.sent]
+        assert methods == ['sendMediaGroup', 'sendMessage', 'sendMessage'], f"Wrong calls: {methods}"
+        album = json.loads(api.sent[0]['params']['media'])
+        assert len(album) == 7 and album[0]['caption'] == '1. *Backlog Movie 0*', "Wrong album"
+        links = api.sent[1]['params']
+        rows = json.loads(links['reply_markup'])['inline_keyboard']
+        assert len(rows) == 7 and all(len(row) == 3 for row in rows), "Wrong links keyboard"
+        assert rows[0][0] == {'text': '1 · 1080p FHD', 'url': 'https://hubcloud.one/drive/0-1080p'}, "Wrong first link"
+        assert links['disable_notification'] == 'true', "Links message not silent"
+        assert bot.db.is_posted('https://hdhub4u.example/backlog-3/'), "Album post not recorded"
+        assert bot.db.get_outbox_counts() == {}, "Outbox not empty"
+
+        # One album per run across channels; a partly claimed album goes out singly
+        bot.CATCHUP_THRESHOLD, bot.ALBUMS_PER_RUN = 2, 1
+        for channel in ('@a', '@b'):
+            for i in range(3):
+                url = f'https://hdhub4u.example/{channel[1]}-{i}/'
+                bot.db.enqueue_post(f'Movie {channel} {i}', url, channel,
+                                    {'caption': 'x', 'keyboard': None, 'poster_url': f'https://img.example.com/{i}.jpg'})
+        sent, api = asyncio.run(scenario())
+        assert sent == 3 and [send['chat_id'] for send in api.sent] == ['@a', '@a'], "Album limit not applied"
+        assert bot.db.get_outbox_counts() == {'pending': 3}, "Other channel not left queued"
+
+        for i in (1, 2):
+            bot.db.acquire_lease(f'send:https://hdhub4u.example/b-{i}/', 'other-replica', 60)
+        sent, api = asyncio.run(scenario())
+        assert sent == 1 and [send['method'] for send in api.sent] == ['sendPhoto'], "Album of one sent"
+
+        # A rejected album falls back to single posts instead of failing them all
+        for i in range(3):
+            bot.db.enqueue_post(f'Movie @c {i}', f'https://hdhub4u.example/c-{i}/', '@c',
+                                {'caption': 'x', 'keyboard': None, 'poster_url': f'https://img.example.com/{i}.jpg'})
+        sent, api = asyncio.run(scenario(reject_methods={'sendMediaGroup'}))
+        assert api.calls['sendMediaGroup'] == 1, "Album not tried"
+        assert sent == 3 and [send['method'] for send in api.sent] == ['sendPhoto'] * 3, "Rejected album not sent singly"
+        assert bot.db.get_outbox_counts() == {'pending': 2}, "Rejected album entries failed"
+    finally:
+        bot.CATCHUP_THRESHOLD, bot.ALBUMS_PER_RUN = original_catchup
+        bot.db.close()
+        bot.db, bot.send_limiter = original_db, original_limiter
+        if os.path.exists('test_catchup.db'):
+            os.remove('test_catchup.db')
+
+    print("✅ Catch-up album tests passed!")
+
+def test_merge_edit():
+    """Test that merging a re-upload edits the keyboard and the link count once"""
+    print("\nTesting merge edits...")
+    import json
+    import os
+    import bot
+    from telegram.ext import Application
+    from fake_bot_api import FakeBotAPI
+    from rate_limiter import RateLimiter
+
+    original_db, original_limiter = bot.db, bot.send_limiter
+    original_details = bot.scraper.get_details
+    bot.db = Database('test_merge.db')
+    bot.send_limiter = RateLimiter(0)
+
+    def links(*names):
+        return [{'url': f'https://hubcloud.one/drive/{name}', 'quality': '720p'} for name in names]
+
+    old_links = links('a', 'b', 'c')
+
+    async def get_details(url, cache_manager):
+        return {'links': old_links, 'meta': {}}
+
+    bot.scraper.get_details = get_details
+    item = {'title': 'Merge Movie', 'url': 'https://hdhub4u.example/merge/', 'download_links': old_links}
+    content_hash, caption, keyboard = render_post(item)
+    bot.db.enqueue_post(item['title'], item['url'], '@chan', {
+        'caption': caption, 'keyboard': keyboard.to_dict(), 'content_hash': content_hash, 'poster_url': ''
+    })
+
+    async def scenario():
+        api = FakeBotAPI()
+        await api.start()
+        application = Application.builder().token('123456:TEST').base_url(api.base_url).build()
+        await application.initialize()
+        try:
+            await bot.drain_outbox(application)
+            target = bot.db.get_post(1)
+            reupload = {'title': 'Merge Movie', 'url': 'https://hdhub4u.example/merge-2/',
+                        'download_links': links('c', 'd', 'e')}
+            queued = await bot.enqueue_merge(target, reupload, 'merge movie||')
+            entry = bot.db.get_due_outbox()[0]
+            merged = await bot.drain_outbox(application)
+            # Resending an edit that already went through
+            bot.db.enqueue_post('Merge Movie', 'https://hdhub4u.example/merge-3/', '@chan', entry['payload'])
+            repeated = await bot.drain_outbox(application)
+        finally:
+            await application.shutdown()
+            await api.stop()
+        return queued, merged, repeated, api
+
+    try:
+        queued, merged, repeated, api = asyncio.run(scenario())
+        assert queued and merged == 1, "Merge not sent"
+        methods = [send['method'] for send in api.sent]
+        assert methods[:3] == ['sendMessage', 'editMessageReplyMarkup', 'editMessageText'], f"Wrong calls: {methods}"
+        rows = json.loads(api.sent[1]['params']['reply_markup'])['inline_keyboard']
+        assert len(rows) == 6, "Merged keyboard wrong"
+        text = api.sent[2]['params']['text']
+        assert '💾 5 Download Links Available' in text and '*Merge Movie*' in text, "Link count not updated"
+        assert repeated == 1 and len(api.sent) == 4, "Unchanged edit not treated as done"
+
+        # Another re-upload with links an earlier merge already added changes nothing
+        target = bot.db.get_post(1)
+        reupload = {'title': 'Merge Movie', 'url': 'https://hdhub4u.example/merge-5/', 'download_links': links('d', 'e')}
+        assert not asyncio.run(bot.enqueue_merge(target, reupload, 'merge movie||')), "No-op merge queued"
+        assert bot.db.get_outbox_counts() == {}, "No-op merge edit left in the outbox"
+
+        # Links past the keyboard's first eight render the same buttons
+        old_links = links(*'abcdefgh')
+        target = bot.db.get_post(1)
+        reupload = {'title': 'Merge Movie', 'url': 'https://hdhub4u.example/merge-4/', 'download_links': links('i')}
+        assert not asyncio.run(bot.enqueue_merge(target, reupload, 'merge movie||')), "Invisible merge queued"
+        assert bot.db.is_posted('https://hdhub4u.example/merge-4/'), "Skipped re-upload not recorded"
+    finally:
+        bot.db.close()
+        bot.db, bot.send_limiter = original_db, original_limiter
+        bot.scraper.get_details = original_details
+        if os.path.exists('test_merge.db'):
+            os.remove('test_merge.db')
+
+    print("✅ Merge edit tests passed!")
+
+def test_enqueue_batch_details():
+    """Test that new items get their detail pages in one batch"""
+    print("\nTesting batched detail fetches...")
+    import os
+    import shutil
+    import tempfile
+    import bot
+    from loadtest import FakeSite
+    from poster_cache import PosterCache
+
+    originals = bot.db, bot.cache, bot.posters, bot.scraper.main_url
+    poster_dir = tempfile.mkdtemp()
+    bot.db = Database('test_batch.db')
+    bot.db.set_setting('probe_mode', 'off')
+    bot.cache = CacheManager()
+    bot.posters = PosterCache(poster_dir)
+    parsed = []
+    original_run = bot.scraper.parser.run
+
+    async def run(func, *args):
+        parsed.append(func.__name__)
+        return await original_run(func, *args)
+
+    bot.scraper.parser.run = run
+    original_fetch = bot.posters.fetch
+
+    async def fetch(url):
+        parsed.append('poster')
+        return await original_fetch(url)
+
+    bot.posters.fetch = fetch
+
+    async def scenario():
+        site = FakeSite(rate=0, backlog=4)
+        bot.scraper.main_url = await site.start()
+        try:
+            return await bot.enqueue_new_content('@chan')
+        finally:
+            await bot.posters.close()
+            await bot.scraper.close()
+            await site.stop()
+
+    try:
+        new_urls = asyncio.run(scenario())
+        assert len(new_urls) == 4 and bot.db.get_outbox_counts() == {'pending': 4}, "Items not queued"
+        assert parsed.count('parse_details_batch') == 1, f"Details not batched: {parsed}"
+        assert 'parse_detail' not in parsed, "Detail page parsed again"
+        assert parsed.index('parse_details_batch') == 4, f"Posters not fetched alongside details: {parsed}"
+        assert all(entry['payload']['poster_file'] for entry in bot.db.get_due_outbox()), "Posters missing"
+        assert all(entry['payload']['keyboard'] for entry in bot.db.get_due_outbox()), "Links missing"
+    finally:
+        bot.db.close()
+        bot.db, bot.cache, bot.posters, bot.scraper.main_url = originals
+        del bot.scraper.parser.run
+        shutil.rmtree(poster_dir, ignore_errors=True)
+        if os.path.exists('test_batch.db'):
+            os.remove('test_batch.db')
+
+    print("✅ Batched detail fetch test passed!")
+
+def test_leader_takeover():
+    """Test that a replica taking over scheduled jobs reloads the duplicate index"""
+    print("\nTesting scheduler takeover...")
+    import os
+    import bot
+
+    originals = bot.db, bot.load_dedup_index, bot._holds_scheduler_lease
+    bot.db = Database('test_takeover.db')
+    bot._holds_scheduler_lease = False
+    reloads, runs = [], []
+    bot.load_dedup_index = lambda: reloads.append(1)
+
+    async def job():
+        runs.append(1)
+        return True
+
+    try:
+        bot.db.acquire_lease(bot.SCHEDULER_LEASE, 'other-replica', 60)
+        assert asyncio.run(bot.run_if_leader(job)) is None and not runs, "Job ran without the lease"
+
+        bot.db.release_lease(bot.SCHEDULER_LEASE, 'other-replica')
+        assert asyncio.run(bot.run_if_leader(job)) and asyncio.run(bot.run_if_leader(job)), "Job not run"
+        assert len(runs) == 2 and len(reloads) == 1, f"Index not reloaded once on takeover: {reloads}"
+    finally:
+        bot.db.close()
+        bot.db, bot.load_dedup_index, bot._holds_scheduler_lease = originals
+        if os.path.exists('test_takeover.db'):
+            os.remove('test_takeover.db')
+
+    print("✅ Scheduler takeover test passed!")
+
+def test_host_registry():
+    """Ensure links are classified by hostname, not substrings"""
+    print("\nTesting host registry...")
+    import json
+    import os
+    registry = HostRegistry()
+
+    assert registry.classify('https://new4.hubcloud.dad/drive/1').name == 'HubCloud', "Site label not matched"
+    assert registry.classify('https://drive.google.com/file/d/1').name == 'Google Drive', "Suffix not matched"
+    assert not registry.is_allowed('https://ads.example.com/?next=hubcdn.fans'), "Query string matched"
+    assert not registry.is_allowed('https://hubcloudx.com/a'), "Partial label matched"
+
+    with open('test_hosts.json', 'w') as f:
+        json.dump({'hubcdn': {'allowed': False}, 'gofile.io': {'name': 'GoFile'}}, f)
+    try:
+        registry = HostRegistry(load_rules('test_hosts.json'))
+    finally:
+        os.remove('test_hosts.json')
+    assert not registry.is_allowed('https://hubcdn.fans/x'), "Deny rule ignored"
+    assert registry.classify('https://gofile.io/d/x').name == 'GoFile', "Configured host missing"
+
+    print("✅ Host registry test passed!")
+
 async def test_scraper():
     """Test scraper functionality"""
     print("\nTesting Scraper...")
@@ -129,8 +1274,33 @@ def run_tests():
     
     try:
         test_format_message_escaping()
+        test_content_hash()
+        test_adaptive_interval()
+        test_records()
+        test_duplicate_index()
+        test_parse_executor()
+        test_streaming_listing()
+        test_host_registry()
+        test_circuit_breaker()
+        test_run_profiler()
+        test_search_cache()
+        test_fake_bot_api()
+        test_poster_cache()
+        test_catchup_albums()
+        test_merge_edit()
+        test_enqueue_batch_details()
         test_database()
+        test_outbox()
+        test_post_counters()
+        test_history_export_import()
+        test_retention_purge()
+        test_leases()
+        test_leader_takeover()
+        test_history_pages_and_search()
+        test_link_prober()
         test_cache()
+        test_cache_namespaces()
+        test_cache_stale_while_revalidate()
         asyncio.run(test_scraper())
         
         print("\n" + "=" * 50)